@@ -0,0 +1,111 @@
+"""
+Admission control for expensive endpoints.
+Each cost class has a gate with bounded concurrency and a bounded FIFO queue. Requests
+wait on the event loop, not in a worker thread, so queued heavy requests never hold
+threadpool threads that cheap lookups need. When the queue is full, or a request has
+waited too long, it is shed with 503 and a Retry-After estimated from recent service times.
+A streaming response outlives its endpoint, so a streaming endpoint holds its slot until
+the stream is done (admit_until_released) rather than until it returns.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque
+
+from fastapi import HTTPException
+
+
+class AdmissionGate:
+    """Concurrency limit plus wait queue for one cost class of endpoints."""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout_seconds: float = 10.0
+    ):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.active = 0
+        self.shed = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of seconds per admitted request, for Retry-After
+        self._service_seconds = 1.0
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new arrival."""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._service_seconds * backlog / self.max_concurrent))
+
+    def _overloaded(self, reason: str) -> HTTPException:
+        self.shed += 1
+        return HTTPException(
+            status_code=503,
+            detail=f"Server busy ({self.name} requests {reason}), retry later",
+            headers={"Retry-After": str(self.retry_after())}
+        )
+
+    async def _acquire(self) -> None:
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._overloaded("queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended; pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._overloaded("timed out in queue")
+
+    def _release(self) -> None:
+        # A freed slot goes straight to the oldest waiter, keeping the queue FIFO
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _finish(self, started: float) -> None:
+        self._service_seconds = 0.8 * self._service_seconds + 0.2 * (time.monotonic() - started)
+        self._release()
+
+    async def admit(self) -> AsyncIterator[None]:
+        """FastAPI dependency: hold a slot of this gate while the endpoint runs."""
+        await self._acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._finish(started)
+
+    async def admit_until_released(self) -> Callable[[], None]:
+        """
+        FastAPI dependency for streaming endpoints: hold a slot of this gate until the
+        returned release() is called, from any thread, once the response is streamed
+        or abandoned. Further calls do nothing.
+        """
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        released = []
+
+        def release() -> None:
+            if not released:
+                released.append(True)
+                loop.call_soon_threadsafe(self._finish, started)
+        return release
@@ -0,0 +1,143 @@
+"""
+Bulk loader for real interaction data.
+Reads CSV or Parquet files in the interaction schema, prepares chunks in parallel
+across cores, and writes the snapshot the API server loads at startup.
+
+Usage:
+    python bulk_loader.py calls_2024_*.csv --output interactions.snapshot
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from schema import prepare_interaction
+from persistence import save_snapshot
+
+DEFAULT_CHUNK_SIZE = 50000
+
+AGENT_FIELDS = ["agent_id", "agent_name", "team_leader", "region", "tenure_band"]
+
+
+def prepare_chunk(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Prepare a chunk of raw records. Returns (interactions, rejected_count)."""
+    prepared = []
+    rejected = 0
+    for raw in rows:
+        try:
+            prepared.append(prepare_interaction(raw))
+        except (ValueError, TypeError):
+            rejected += 1
+    return prepared, rejected
+
+
+def iter_file_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Yield raw records from a CSV or Parquet file, chunk_size rows at a time."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    with open(path, newline="", encoding="utf-8") as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def load_files(
+    paths: List[str],
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Read and prepare every file, fanning chunks out to a process pool.
+    At most two chunks per worker are in flight so memory stays bounded.
+    Returns (interactions in file order, rejected_count).
+    """
+    workers = workers or os.cpu_count() or 1
+    interactions = []
+    rejected = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            for chunk in iter_file_chunks(path, chunk_size):
+                pending.append(executor.submit(prepare_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    prepared, bad = pending.popleft().result()
+                    interactions.extend(prepared)
+                    rejected += bad
+
+        while pending:
+            prepared, bad = pending.popleft().result()
+            interactions.extend(prepared)
+            rejected += bad
+
+    return interactions, rejected
+
+
+def build_agent_roster(interactions: List[Dict[str, Any]]) -> List[Dict]:
+    """Derive the agent roster from interaction records (latest record wins)."""
+    roster = {}
+    for interaction in interactions:
+        roster[interaction["agent_id"]] = {field: interaction[field] for field in AGENT_FIELDS}
+    return [roster[agent_id] for agent_id in sorted(roster)]
+
+
+def run_bulk_load(
+    paths: List[str],
+    output: str,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """Load files, deduplicate, sort by time, and write the server snapshot."""
+    started = time.time()
+    interactions, rejected = load_files(paths, workers, chunk_size)
+    row_count = len(interactions)
+
+    # Indexes are built once over the full load: later files win on duplicate ids
+    interaction_index = {i["interaction_id"]: i for i in interactions}
+    interactions = sorted(interaction_index.values(), key=lambda i: i["timestamp"])
+    agents = build_agent_roster(interactions)
+
+    save_snapshot(output, agents, interactions)
+
+    return {
+        "files": len(paths),
+        "loaded": len(interactions),
+        "duplicates": row_count - len(interactions),
+        "rejected": rejected,
+        "agents": len(agents),
+        "output": output,
+        "seconds": round(time.time() - started, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk load interaction files into a server snapshot.")
+    parser.add_argument("paths", nargs="+", help="CSV or Parquet files in the interaction schema")
+    parser.add_argument("--output", "-o", required=True, help="Snapshot file to write")
+    parser.add_argument("--workers", "-w", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per parallel chunk")
+    args = parser.parse_args(argv)
+
+    summary = run_bulk_load(args.paths, args.output, args.workers, args.chunk_size)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
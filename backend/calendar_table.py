@@ -0,0 +1,74 @@
+"""
+Shared calendar dimension.
+Days are numbered from a Monday epoch, so the ISO week and weekday of a day are
+plain integer division and remainder. The store keeps these ids as small integer
+columns per row, and every endpoint turns ids back into labels through the same
+tables here, so time bucketing is integer grouping and week boundaries agree.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Tuple
+
+# Day 0; a Monday, so week_index = day_index // 7 starts every week on Monday (ISO)
+EPOCH = date(1970, 1, 5)
+
+WEEKDAY_LABELS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# Per-row calendar columns kept by the store, with their array typecodes
+CALENDAR_COLUMNS = {
+    "day_index": "i",
+    "week_index": "i",
+    "hour": "b",
+    "weekday": "b",
+}
+
+# Lazily filled lookup tables, shared by every request
+_DAY_INDEX_BY_KEY: Dict[str, int] = {}
+_DAYS: Dict[int, Dict[str, Any]] = {}
+_WEEKS: Dict[int, Dict[str, Any]] = {}
+
+
+def day_index(day_key: str) -> int:
+    """Day id of a YYYY-MM-DD key."""
+    index = _DAY_INDEX_BY_KEY.get(day_key)
+    if index is None:
+        index = _DAY_INDEX_BY_KEY[day_key] = (date.fromisoformat(day_key) - EPOCH).days
+    return index
+
+
+def time_buckets(timestamp: str) -> Tuple[int, int, int, int]:
+    """(day_index, week_index, hour, weekday) of an interaction timestamp."""
+    day = day_index(timestamp[:10])
+    return day, day // 7, datetime.fromisoformat(timestamp).hour, day % 7
+
+
+def calendar_day(index: int) -> Dict[str, Any]:
+    """Labels for a day id: date, ISO week key, week start and weekday."""
+    day = _DAYS.get(index)
+    if day is None:
+        value = EPOCH + timedelta(days=index)
+        week = calendar_week(index // 7)
+        day = _DAYS[index] = {
+            "date": value.isoformat(),
+            "week_key": week["week_key"],
+            "week_start": week["week_start"],
+            "weekday": index % 7,
+            "weekday_label": WEEKDAY_LABELS[index % 7],
+        }
+    return day
+
+
+def calendar_week(index: int) -> Dict[str, Any]:
+    """Labels for a week id: ISO week key (YYYY-Www) and Monday start date."""
+    week = _WEEKS.get(index)
+    if week is None:
+        start = EPOCH + timedelta(weeks=index)
+        iso_year, iso_week, _ = start.isocalendar()
+        week = _WEEKS[index] = {
+            "week_key": f"{iso_year}-W{iso_week:02d}",
+            "week_start": start.isoformat(),
+        }
+    return week
+
+
+def hour_label(hour: int) -> str:
+    return f"{hour:02d}:00"
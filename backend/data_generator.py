@@ -2,10 +2,11 @@
 Fake data generator for Call Center Insights Dashboard.
 Generates realistic interaction data for 90 days.
 """
+import os
 import uuid
 import random
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 
 from taxonomy import (
     LINES_OF_BUSINESS, CALL_REASONS, PRODUCTS, REGIONS, CHANNELS,
@@ -15,6 +16,26 @@ from taxonomy import (
     PRODUCT_WEIGHTS, CALL_REASON_WEIGHTS, TEAM_LEADERS
 )
 from root_cause_engine import classify_interaction, generate_ai_summary
+from persistence import (
+    load_checkpoint, load_snapshot, read_wal, wal_segments, WriteAheadLog, Checkpointer, CHECKPOINT_FILENAME
+)
+from store import InteractionStore, StoreSnapshot
+from tiered_storage import TieringManager, open_cold_segment, pin_cold_files
+
+# Snapshot written by bulk_loader.py; when set, real data replaces generated data
+SNAPSHOT_PATH = os.environ.get("INTERACTIONS_SNAPSHOT")
+
+# Directory for the write-ahead log and checkpoints; when set, ingested data survives restarts
+DATA_DIR = os.environ.get("INTERACTIONS_DATA_DIR")
+CHECKPOINT_INTERVAL_SECONDS = float(os.environ.get("CHECKPOINT_INTERVAL_SECONDS", "300"))
+WAL_COMMIT_DELAY_MS = float(os.environ.get("WAL_COMMIT_DELAY_MS", "0"))
+
+# Storage policy: cold segment directory, hot window, RAM budget for hot rows, retention
+COLD_STORAGE_DIR = os.environ.get("COLD_STORAGE_DIR") or (os.path.join(DATA_DIR, "cold") if DATA_DIR else None)
+HOT_DAYS = int(os.environ.get("HOT_DAYS", "28"))
+HOT_MEMORY_BUDGET_MB = float(os.environ.get("HOT_MEMORY_BUDGET_MB", "0"))
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "0"))
+TIERING_INTERVAL_SECONDS = float(os.environ.get("TIERING_INTERVAL_SECONDS", "60"))
 
 # Complaint text templates by category
 COMPLAINT_TEMPLATES = {
@@ -394,12 +415,25 @@ def _get_lob_for_product(product: str) -> str:
     return "Other"
 
 
-# Generate data at module load
-AGENTS, AGENT_LOOKUP = generate_agents(80)
-INTERACTIONS = generate_interactions(AGENTS, AGENT_LOOKUP, num_days=90, avg_per_day=150)
+# Load or generate data at module load; the latest checkpoint wins over the bulk-load snapshot.
+# A checkpoint's cold segments are mapped from their files, not read into memory
+CHECKPOINT_PATH = os.path.join(DATA_DIR, CHECKPOINT_FILENAME) if DATA_DIR else None
+WAL_SEGMENT = 0
+CHECKPOINTED = []
+INTERACTIONS = []
+if CHECKPOINT_PATH and os.path.exists(CHECKPOINT_PATH):
+    AGENTS, CHECKPOINTED, WAL_SEGMENT = load_checkpoint(CHECKPOINT_PATH, open_cold_segment)
+    AGENT_LOOKUP = {a["agent_id"]: a for a in AGENTS}
+elif SNAPSHOT_PATH:
+    AGENTS, INTERACTIONS, _ = load_snapshot(SNAPSHOT_PATH)
+    AGENT_LOOKUP = {a["agent_id"]: a for a in AGENTS}
+else:
+    AGENTS, AGENT_LOOKUP = generate_agents(80)
+    INTERACTIONS = generate_interactions(AGENTS, AGENT_LOOKUP, num_days=90, avg_per_day=150)
 
-# Create index for fast lookup
-INTERACTION_INDEX = {i["interaction_id"]: i for i in INTERACTIONS}
+# Versioned, indexed store; INTERACTION_INDEX is its shared id -> row position map
+STORE = InteractionStore(INTERACTIONS, segments=[segment for segment, _ in CHECKPOINTED])
+INTERACTION_INDEX = STORE.positions
 
 
 def get_all_agents() -> List[Dict]:
@@ -410,13 +444,121 @@ def get_agent_lookup() -> Dict[str, Dict]:
     return AGENT_LOOKUP
 
 
+def get_store() -> InteractionStore:
+    return STORE
+
+
+def get_snapshot() -> StoreSnapshot:
+    """Latest published store version. Pin one per request for consistent reads."""
+    return STORE.snapshot()
+
+
 def get_all_interactions() -> List[Dict]:
-    return INTERACTIONS
+    return STORE.snapshot().rows()
 
 
 def get_interaction_by_id(interaction_id: str) -> Dict:
-    return INTERACTION_INDEX.get(interaction_id)
+    return STORE.snapshot().get(interaction_id)
 
 
-def get_interaction_index() -> Dict[str, Dict]:
+def get_interaction_index() -> Dict[str, int]:
     return INTERACTION_INDEX
+
+
+def get_checkpointer() -> Optional[Checkpointer]:
+    return CHECKPOINTER
+
+
+def get_tiering_manager() -> Optional[TieringManager]:
+    return TIERING_MANAGER
+
+
+def register_agents(interactions: List[Dict[str, Any]]) -> None:
+    """Add agents first seen in ingested interactions to the roster."""
+    for interaction in interactions:
+        agent_id = interaction["agent_id"]
+        if agent_id not in AGENT_LOOKUP:
+            agent = {
+                "agent_id": agent_id,
+                "agent_name": interaction["agent_name"],
+                "team_leader": interaction["team_leader"],
+                "region": interaction["region"],
+                "tenure_band": interaction["tenure_band"]
+            }
+            AGENTS.append(agent)
+            AGENT_LOOKUP[agent_id] = agent
+
+
+def apply_logged_write(store: InteractionStore, op: str, payload: Any) -> None:
+    """Apply one write as the WAL logs it (see InteractionStore.add_write_listener)."""
+    if op == "drop_before":
+        store.drop_before(payload)
+        return
+    register_agents(payload)
+    if op == "append":
+        store.append(payload)
+    else:
+        store.upsert(payload)
+
+
+def replay_wal(store: InteractionStore, directory: str, from_segment: int) -> int:
+    """
+    Re-apply logged writes made after the checkpoint. Consecutive appends are
+    applied as one batch. Returns the number of records replayed.
+    """
+    replayed = 0
+    pending = []
+    for op, payload in read_wal(directory, from_segment):
+        if op == "append":
+            register_agents(payload)
+            pending.extend(payload)
+        else:
+            store.append(pending)
+            pending = []
+            apply_logged_write(store, op, payload)
+        replayed += 1
+    store.append(pending)
+    return replayed
+
+
+def prepare_replica() -> None:
+    """
+    In a process forked from this one to follow its writes (see offload.py): apply
+    them without logging or forwarding them again, and keep mapped the cold files
+    the forked store may still read after this process has deleted them.
+    """
+    STORE.attach_wal(None)
+    STORE.write_listeners.clear()
+    pin_cold_files(STORE.snapshot())
+
+
+def apply_replicated_write(op: str, payload: Any) -> None:
+    """In a replica, apply a write this process's store forwarded."""
+    apply_logged_write(STORE, op, payload)
+
+
+# Recover writes since the last checkpoint, then log new ones
+CHECKPOINTER = None
+if DATA_DIR:
+    replay_wal(STORE, DATA_DIR, WAL_SEGMENT)
+    next_segment = max([WAL_SEGMENT] + [number + 1 for number, _ in wal_segments(DATA_DIR)])
+    STORE.attach_wal(WriteAheadLog(DATA_DIR, next_segment, WAL_COMMIT_DELAY_MS / 1000))
+    # The checkpointer holds the loaded segments from here on, and with them the cold
+    # files the checkpoint on disk lists, even if replayed writes replaced them
+    CHECKPOINTER = Checkpointer(
+        STORE, STORE.wal, CHECKPOINT_PATH, get_all_agents, CHECKPOINT_INTERVAL_SECONDS, checkpointed=CHECKPOINTED
+    )
+    # Checkpoint right away so the base data and the replayed log are what the next restart loads
+    CHECKPOINTER.checkpoint(force=True)
+CHECKPOINTED = None
+
+# Retention and hot/cold tiering
+TIERING_MANAGER = None
+if COLD_STORAGE_DIR or RETENTION_DAYS:
+    TIERING_MANAGER = TieringManager(
+        STORE, COLD_STORAGE_DIR, HOT_DAYS, HOT_MEMORY_BUDGET_MB, RETENTION_DAYS, TIERING_INTERVAL_SECONDS
+    )
+    TIERING_MANAGER.run_once()
+    if CHECKPOINTER:
+        # Record segments that just went cold, so their hot copies are not held until the next interval
+        CHECKPOINTER.checkpoint()
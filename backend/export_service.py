@@ -0,0 +1,239 @@
+"""
+Streaming export of interaction records.
+Serializers consume an iterator of interactions and yield NDJSON/CSV text
+or Arrow/Parquet bytes in chunks, so extracts never have to be materialized
+in memory. The Arrow formats also take Arrow tables among the interactions
+(the rows of cold segments) and write them as they are, pivoting only row
+dicts. Arrow formats need the optional pyarrow dependency.
+"""
+import csv
+import io
+import json
+import tempfile
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow/Parquet export is optional
+    pa = None
+    pq = None
+
+from schema import INTERACTION_SCHEMA
+
+# Rows buffered per yielded chunk
+DEFAULT_CHUNK_SIZE = 1000
+
+# Rows per Arrow record batch / Parquet row group
+DEFAULT_BATCH_SIZE = 65536
+
+# Bytes per chunk when streaming a finished Parquet file
+PARQUET_READ_SIZE = 1024 * 1024
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+EXPORT_EXTENSIONS = {
+    "ndjson": "ndjson",
+    "csv": "csv",
+    "arrow": "arrows",
+    "parquet": "parquet",
+}
+
+ARROW_FORMATS = ("arrow", "parquet")
+
+
+def resolve_columns(columns: Optional[str]) -> List[str]:
+    """
+    Parse a comma-separated column list into schema field names.
+    Returns every field when no columns are given; raises ValueError on unknown fields.
+    """
+    if not columns:
+        return list(INTERACTION_SCHEMA)
+
+    fields = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [f for f in fields if f not in INTERACTION_SCHEMA]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+    return fields
+
+
+def iter_ndjson(
+    interactions: Iterable[Dict[str, Any]],
+    columns: List[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[str]:
+    """Yield newline-delimited JSON, one object per interaction."""
+    buffer = []
+    for interaction in interactions:
+        buffer.append(json.dumps({c: interaction.get(c) for c in columns}))
+        if len(buffer) >= chunk_size:
+            yield "\n".join(buffer) + "\n"
+            buffer = []
+
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+def iter_csv(
+    interactions: Iterable[Dict[str, Any]],
+    columns: List[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[str]:
+    """Yield CSV text with a header row. Nested values are JSON-encoded."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+
+    rows_in_chunk = 0
+    for interaction in interactions:
+        writer.writerow([_csv_value(interaction.get(c)) for c in columns])
+        rows_in_chunk += 1
+        if rows_in_chunk >= chunk_size:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+            rows_in_chunk = 0
+
+    # Always flush - an empty selection still gets its header
+    if out.tell():
+        yield out.getvalue()
+
+
+def _csv_value(value: Any) -> Any:
+    """Convert a field value into a CSV cell."""
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def arrow_available() -> bool:
+    """Whether pyarrow is installed for the Arrow/Parquet formats."""
+    return pa is not None
+
+
+def arrow_schema(columns: List[str]) -> "pa.Schema":
+    """Build the Arrow schema for the projected columns."""
+    return pa.schema([(c, _arrow_type(INTERACTION_SCHEMA[c])) for c in columns])
+
+
+def _arrow_type(py_type: type) -> "pa.DataType":
+    """Map an interaction field type to its Arrow type."""
+    if py_type is bool:
+        return pa.bool_()
+    if py_type is int:
+        return pa.int64()
+    if py_type is float:
+        return pa.float64()
+    if py_type is list:
+        # recommended_actions: [{"text": ..., "type": ...}]
+        return pa.list_(pa.struct([("text", pa.string()), ("type", pa.string())]))
+    return pa.string()
+
+
+def iter_record_batches(
+    interactions: Iterable[Any],
+    columns: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator["pa.RecordBatch"]:
+    """
+    Pivot interactions into column lists and yield a record batch per batch_size rows or so.
+    Arrow tables among them (already projected to columns) join the batches as they are,
+    in order with the rows around them.
+    """
+    schema = arrow_schema(columns)
+    parts: List["pa.Table"] = []
+    parts_rows = 0
+    values = {c: [] for c in columns}
+    count = 0
+
+    for interaction in interactions:
+        if isinstance(interaction, pa.Table):
+            if count:
+                parts.append(pa.Table.from_batches([_record_batch(values, schema)]))
+                values = {c: [] for c in columns}
+                parts_rows += count
+                count = 0
+            parts.append(interaction if interaction.schema.equals(schema) else interaction.cast(schema))
+            parts_rows += interaction.num_rows
+        else:
+            for c in columns:
+                values[c].append(interaction.get(c))
+            count += 1
+        if parts_rows + count >= batch_size:
+            yield _combine(parts, values, schema)
+            parts, parts_rows = [], 0
+            values = {c: [] for c in columns}
+            count = 0
+
+    if parts_rows + count:
+        yield _combine(parts, values, schema)
+
+
+def _combine(parts: List["pa.Table"], values: Dict[str, List[Any]], schema: "pa.Schema") -> "pa.RecordBatch":
+    """One record batch of the tables in parts followed by the rows pivoted into values."""
+    if not parts:
+        return _record_batch(values, schema)
+    if values[schema.names[0]]:
+        parts = parts + [pa.Table.from_batches([_record_batch(values, schema)])]
+    return pa.concat_tables(parts).combine_chunks().to_batches()[0]
+
+
+def _record_batch(values: Dict[str, List[Any]], schema: "pa.Schema") -> "pa.RecordBatch":
+    """Convert column lists into a record batch."""
+    arrays = [pa.array(values[field.name], type=field.type) for field in schema]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_arrow_stream(
+    interactions: Iterable[Dict[str, Any]],
+    columns: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """Yield an Arrow IPC stream, flushing the bytes of each record batch as it is written."""
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, arrow_schema(columns))
+
+    for batch in iter_record_batches(interactions, columns, batch_size):
+        writer.write_batch(batch)
+        yield _drain(sink)
+
+    writer.close()
+    yield _drain(sink)
+
+
+def iter_parquet(
+    interactions: Iterable[Dict[str, Any]],
+    columns: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Yield a Parquet file with one row group per batch.
+    The footer is only known at the end, so the file is spooled to disk first.
+    """
+    with tempfile.TemporaryFile() as spool:
+        writer = pq.ParquetWriter(spool, arrow_schema(columns))
+        for batch in iter_record_batches(interactions, columns, batch_size):
+            writer.write_batch(batch)
+        writer.close()
+
+        spool.seek(0)
+        while True:
+            chunk = spool.read(PARQUET_READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    """Return and clear everything written to the sink so far."""
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
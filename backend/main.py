@@ -1,10 +1,15 @@
 """
 FastAPI Backend for Call Center Insights Dashboard.
 """
-from fastapi import FastAPI, Query, HTTPException
+import os
+import uuid
+import functools
+from fastapi import FastAPI, Query, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Iterable, Iterator, Tuple, Union
 from datetime import datetime, timedelta
 from collections import defaultdict
 
@@ -14,11 +19,115 @@ from taxonomy import (
     COMPLAINT_SEVERITIES, TEAM_LEADERS
 )
 from data_generator import (
-    get_all_agents, get_agent_lookup, get_all_interactions,
-    get_interaction_by_id, get_interaction_index, AGENTS, AGENT_LOOKUP
+    get_all_agents, get_agent_lookup, get_all_interactions, get_store, get_snapshot,
+    get_interaction_by_id, get_interaction_index, get_checkpointer, get_tiering_manager,
+    register_agents, prepare_replica, apply_replicated_write, AGENTS, AGENT_LOOKUP
+)
+from schema import prepare_interaction, merge_correction
+from calendar_table import calendar_day, calendar_week, day_index, hour_label, WEEKDAY_LABELS
+from store import (
+    StoreSnapshot, GroupBy, CUBE_DIMENSIONS, DuplicateInteractionError, counters_from_rows, merge_counters,
+    merge_grouped, new_counters, split_bitmap
 )
 from root_cause_engine import generate_ai_summary, analyze_root_causes
 from ai_service import generate_executive_summary, generate_enhanced_root_cause
+from selections import SelectionCache
+from single_flight import SingleFlight, freeze
+from admission import AdmissionGate
+from offload import ProcessOffloader, OffloadUnavailable, register
+from sketches import sketch_percentiles
+from sampling import Estimate, approximate
+from query_planner import CompiledFilter, FilterError, compile_filters, parse_filter_date, parse_group_fields
+from export_service import (
+    resolve_columns, iter_ndjson, iter_csv, iter_arrow_stream, iter_parquet,
+    arrow_available, EXPORT_MEDIA_TYPES, EXPORT_EXTENSIONS, ARROW_FORMATS
+)
+
+SELECTIONS = SelectionCache(
+    max_entries=int(os.environ.get("SELECTION_CACHE_ENTRIES", "256")),
+    memory_budget_mb=float(os.environ.get("SELECTION_CACHE_MB", "64")),
+    ttl_seconds=float(os.environ.get("SELECTION_TTL_SECONDS", "900"))
+)
+
+# Concurrent identical read requests share one computation (see coalesced)
+IN_FLIGHT = SingleFlight()
+
+# Admission control per cost class: concurrent requests, queued requests and seconds a request
+# may queue before it is shed with 503. Detail lookups, options, selections and writes are not gated;
+# exports are bulk, holding their slot until the whole extract is streamed.
+HEAVY_REQUESTS = AdmissionGate(
+    "heavy",
+    max_concurrent=int(os.environ.get("HEAVY_MAX_CONCURRENT", "4")),
+    max_queue=int(os.environ.get("HEAVY_MAX_QUEUE", "16")),
+    queue_timeout_seconds=float(os.environ.get("HEAVY_QUEUE_TIMEOUT_SECONDS", "10"))
+)
+STANDARD_REQUESTS = AdmissionGate(
+    "standard",
+    max_concurrent=int(os.environ.get("STANDARD_MAX_CONCURRENT", "16")),
+    max_queue=int(os.environ.get("STANDARD_MAX_QUEUE", "64")),
+    queue_timeout_seconds=float(os.environ.get("STANDARD_QUEUE_TIMEOUT_SECONDS", "10"))
+)
+BULK_REQUESTS = AdmissionGate(
+    "bulk",
+    max_concurrent=int(os.environ.get("BULK_MAX_CONCURRENT", "2")),
+    max_queue=int(os.environ.get("BULK_MAX_QUEUE", "4")),
+    queue_timeout_seconds=float(os.environ.get("BULK_QUEUE_TIMEOUT_SECONDS", "10"))
+)
+
+# Worker processes for the heavy endpoints (0 disables), forked at startup and following every
+# write, and how long a call waits for its worker to catch up before it runs in this process
+ANALYTICS_POOL = ProcessOffloader(
+    workers=int(os.environ.get("ANALYTICS_WORKERS", str(os.cpu_count() or 1))),
+    current_version=lambda: get_store().version,
+    prepare_worker=prepare_replica,
+    apply_write=apply_replicated_write,
+    catch_up_seconds=float(os.environ.get("ANALYTICS_CATCH_UP_SECONDS", "5"))
+)
+get_store().add_write_listener(ANALYTICS_POOL.forward)
+
+# Scans over at least this many candidate rows are split into row ranges aggregated side by side in the pool,
+# and how long the split scan may take before it is abandoned for a serial scan
+PARALLEL_SCAN_MIN_ROWS = int(os.environ.get("PARALLEL_SCAN_MIN_ROWS", "100000"))
+PARALLEL_SCAN_TIMEOUT_SECONDS = float(os.environ.get("PARALLEL_SCAN_TIMEOUT_SECONDS", "30"))
+
+# Approximate mode (approx=true): sampled rows per query, and the scope below which answers stay exact
+APPROX_SAMPLE_BUDGET = int(os.environ.get("APPROX_SAMPLE_BUDGET", "10000"))
+APPROX_EXACT_MAX_ROWS = int(os.environ.get("APPROX_EXACT_MAX_ROWS", "50000"))
+
+# Estimated KPIs per approximate response: (name, numerator, denominator or None for a total, scale, digits)
+METRIC_ESTIMATES = (
+    ("total_interactions", "count", None, 1, 0),
+    ("total_complaints", "complaints", None, 1, 0),
+    ("complaint_rate", "complaints", "count", 100, 1),
+    ("avg_handling_time_seconds", "handling_time", "count", 1, 0),
+    ("avg_handling_time_minutes", "handling_time", "count", 1 / 60, 2),
+    ("fcr_rate", "resolved", "count", 100, 1),
+    ("escalation_rate", "escalated", "count", 100, 1),
+    ("avg_transfers", "transfers", "count", 1, 2),
+    ("digital_eligible_count", "digital_eligible", None, 1, 0),
+    ("deflection_rate", "deflection_success", "digital_eligible", 100, 1),
+    ("total_cost", "cost", None, 1, 2),
+)
+BREAKDOWN_ESTIMATES = (
+    ("count", "count", None, 1, 0),
+    ("complaint_count", "complaints", None, 1, 0),
+    ("complaint_rate", "complaints", "count", 100, 1),
+    ("avg_handling_time_minutes", "handling_time", "count", 1 / 60, 2),
+    ("fcr_rate", "resolved", "count", 100, 1),
+    ("total_cost", "cost", None, 1, 2),
+)
+TREND_ESTIMATES = (
+    ("volume", "count", None, 1, 0),
+    ("avg_handling_time", "handling_time", "count", 1 / 60, 2),
+    ("fcr_rate", "resolved", "count", 100, 1),
+    ("complaint_volume", "complaints", None, 1, 0),
+)
+
+# Filterable dimensions reported by /api/facets, keyed by record field
+FACET_FIELDS = (
+    "line_of_business", "call_reason", "product", "region", "team_leader",
+    "agent_id", "channel", "customer_segment", "is_complaint"
+)
 
 app = FastAPI(title="Call Center Insights API", version="1.0.0")
 
@@ -32,91 +141,476 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def start_background_tasks():
+    """
+    Fork the analytics pool, then start periodic checkpoints and the storage policy,
+    where configured: workers are forked before any of these threads exists.
+    """
+    ANALYTICS_POOL.start()
+    checkpointer = get_checkpointer()
+    if checkpointer:
+        checkpointer.start()
+    tiering_manager = get_tiering_manager()
+    if tiering_manager:
+        tiering_manager.start()
+
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    """Stop the analytics pool and storage policy, write a final checkpoint and close the write-ahead log."""
+    ANALYTICS_POOL.shutdown()
+    tiering_manager = get_tiering_manager()
+    if tiering_manager:
+        tiering_manager.stop()
+    checkpointer = get_checkpointer()
+    if checkpointer:
+        checkpointer.stop()
+        checkpointer.wal.close()
+
+
 # Pydantic models
 class RootCauseRequest(BaseModel):
     interaction_ids: Optional[List[str]] = None
     filters: Optional[Dict[str, Any]] = None
 
 
+class IngestRequest(BaseModel):
+    interactions: List[Dict[str, Any]]
+
+
 class FiltersModel(BaseModel):
     from_date: Optional[str] = None
     to_date: Optional[str] = None
-    line_of_business: Optional[str] = None
-    call_reason: Optional[str] = None
-    product: Optional[str] = None
-    region: Optional[str] = None
-    team_leader: Optional[str] = None
-    agent_id: Optional[str] = None
+    # Categorical filters take one value or a list (IN)
+    line_of_business: Optional[Union[str, List[str]]] = None
+    call_reason: Optional[Union[str, List[str]]] = None
+    product: Optional[Union[str, List[str]]] = None
+    region: Optional[Union[str, List[str]]] = None
+    team_leader: Optional[Union[str, List[str]]] = None
+    agent_id: Optional[Union[str, List[str]]] = None
     complaints_only: bool = False
-    channel: Optional[str] = None
-    segment: Optional[str] = None
+    channel: Optional[Union[str, List[str]]] = None
+    segment: Optional[Union[str, List[str]]] = None
+    # Inclusive numeric ranges
+    min_handling_time_seconds: Optional[float] = None
+    max_handling_time_seconds: Optional[float] = None
+    min_hold_time_seconds: Optional[float] = None
+    max_hold_time_seconds: Optional[float] = None
+    min_transfer_count: Optional[float] = None
+    max_transfer_count: Optional[float] = None
+    min_estimated_cost_dollars: Optional[float] = None
+    max_estimated_cost_dollars: Optional[float] = None
+    min_root_cause_confidence: Optional[float] = None
+    max_root_cause_confidence: Optional[float] = None
 
 
 # Helper functions
+def compile_query(filters: Optional[Dict[str, Any]] = None, **params: Any) -> CompiledFilter:
+    """Compile request filters, under any accepted alias; invalid filters are rejected with 422."""
+    try:
+        return compile_filters(filters, **params)
+    except FilterError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def coalesced(endpoint: Callable) -> Callable:
+    """
+    Single-flight a read endpoint: concurrent calls with the same normalized parameters
+    against the same data version run it once and all receive that result.
+    """
+    @functools.wraps(endpoint)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        key = (endpoint.__name__, get_snapshot().version, freeze(args), freeze(kwargs))
+        return IN_FLIGHT.do(key, endpoint, *args, **kwargs)
+    return wrapper
+
+
+def offloaded(inline_when: Optional[Callable[..., bool]] = None) -> Callable:
+    """
+    Run a CPU-heavy endpoint in the analytics process pool, so it neither holds the GIL
+    nor blocks the event loop; identical concurrent calls share one task. Runs in the
+    threadpool instead when the pool is disabled or behind the data, or when
+    inline_when(**params) holds.
+    """
+    def decorate(endpoint: Callable) -> Callable:
+        register(endpoint.__name__, endpoint)
+
+        @functools.wraps(endpoint)
+        async def wrapper(**kwargs: Any) -> Any:
+            key = (endpoint.__name__, get_snapshot().version, freeze(kwargs))
+            if not (inline_when and inline_when(**kwargs)):
+                try:
+                    return await ANALYTICS_POOL.call(endpoint.__name__, key, kwargs)
+                except OffloadUnavailable:
+                    pass
+            return await run_in_threadpool(IN_FLIGHT.do, key, endpoint, **kwargs)
+        return wrapper
+    return decorate
+
+
+def range_filters(
+    min_handling_time_seconds: Optional[float] = None,
+    max_handling_time_seconds: Optional[float] = None,
+    min_hold_time_seconds: Optional[float] = None,
+    max_hold_time_seconds: Optional[float] = None,
+    min_transfer_count: Optional[float] = None,
+    max_transfer_count: Optional[float] = None,
+    min_estimated_cost_dollars: Optional[float] = None,
+    max_estimated_cost_dollars: Optional[float] = None,
+    min_root_cause_confidence: Optional[float] = None,
+    max_root_cause_confidence: Optional[float] = None
+) -> Dict[str, Optional[float]]:
+    """Inclusive numeric range query parameters, shared by the filtered endpoints."""
+    return {
+        "min_handling_time_seconds": min_handling_time_seconds,
+        "max_handling_time_seconds": max_handling_time_seconds,
+        "min_hold_time_seconds": min_hold_time_seconds,
+        "max_hold_time_seconds": max_hold_time_seconds,
+        "min_transfer_count": min_transfer_count,
+        "max_transfer_count": max_transfer_count,
+        "min_estimated_cost_dollars": min_estimated_cost_dollars,
+        "max_estimated_cost_dollars": max_estimated_cost_dollars,
+        "min_root_cause_confidence": min_root_cause_confidence,
+        "max_root_cause_confidence": max_root_cause_confidence,
+    }
+
+
 def filter_interactions(
-    interactions: List[Dict],
-    from_date: str = None,
-    to_date: str = None,
-    line_of_business: str = None,
-    call_reason: str = None,
-    product: str = None,
-    region: str = None,
-    team_leader: str = None,
-    agent_id: str = None,
-    complaints_only: bool = False,
-    channel: str = None,
-    segment: str = None
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    selection: Optional[int] = None
 ) -> List[Dict]:
-    """Apply filters to interaction list."""
-    result = interactions
+    """Apply a compiled filter (or a selection bitmap, which replaces it) to the interaction snapshot."""
+    return list(iter_filtered_interactions(snapshot, query, selection))
+
+
+def iter_filtered_interactions(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    selection: Optional[int] = None
+) -> Iterator[Dict]:
+    """Lazily yield interactions matching a compiled filter (or a selection bitmap), in storage order."""
+    if selection is not None:
+        return snapshot.iter_rows(selection)
+    return query.iter_rows(snapshot)
+
+
+def iter_filtered_with_calendar(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    columns: Tuple[str, ...],
+    selection: Optional[int] = None,
+    within: Optional[int] = None
+) -> Iterator[Tuple[Dict, Tuple[int, ...]]]:
+    """Like iter_filtered_interactions, also yielding each row's calendar ids for columns (among the rows of within)."""
+    if selection is not None:
+        return snapshot.iter_rows_with_calendar(selection if within is None else selection & within, columns)
+    return query.iter_rows_with_calendar(snapshot, columns, within)
+
+
+def scan_counters(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    selection: Optional[int] = None,
+    group_by: GroupBy = None,
+    within: Optional[int] = None
+) -> Dict[Any, Dict[str, float]]:
+    """Counters of the rows matching a compiled filter (or a selection bitmap), among the rows of within."""
+    if selection is not None:
+        rows = snapshot.iter_rows(selection if within is None else selection & within)
+    else:
+        rows = query.iter_rows(snapshot, within)
+    return counters_from_rows(rows, group_by)
+
+
+def trend_counts(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    column: str,
+    selection: Optional[int] = None,
+    within: Optional[int] = None
+) -> Dict[int, Dict[str, float]]:
+    """Volume, handling time, first-contact resolutions and complaints per calendar id of column."""
+    counts = defaultdict(lambda: {"count": 0, "handling_time": 0, "resolved": 0, "complaints": 0})
+    for interaction, (key,) in iter_filtered_with_calendar(snapshot, query, (column,), selection, within):
+        counts[key]["count"] += 1
+        counts[key]["handling_time"] += interaction["handling_time_seconds"]
+        if interaction["resolved_on_first_contact"]:
+            counts[key]["resolved"] += 1
+        if interaction["is_complaint"]:
+            counts[key]["complaints"] += 1
+    return dict(counts)
+
+
+def merge_trend_counts(
+    target: Dict[int, Dict[str, float]],
+    source: Dict[int, Dict[str, float]]
+) -> Dict[int, Dict[str, float]]:
+    """Add partial trend counts into target."""
+    for key, counts in source.items():
+        if key in target:
+            for field, value in counts.items():
+                target[key][field] += value
+        else:
+            target[key] = counts
+    return target
+
+
+# Scans that parallel_scan can split, by name: (scan, merge of two partial results)
+SCAN_TASKS: Dict[str, Tuple[Callable, Callable]] = {
+    "counters": (scan_counters, merge_grouped),
+    "trends": (trend_counts, merge_trend_counts),
+}
+
+
+def _run_scan(scan: Callable, **params: Any) -> Any:
+    """Worker side of parallel_scan: one chunk against the worker's snapshot."""
+    return scan(get_snapshot(), **params)
+
+
+register("scan_counters", functools.partial(_run_scan, scan_counters))
+register("scan_trends", functools.partial(_run_scan, trend_counts))
+
+
+def parallel_scan(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    selection: Optional[int],
+    task: str,
+    **params: Any
+) -> Optional[Any]:
+    """
+    Run a scan of SCAN_TASKS over row-range chunks of the candidate rows, side by side in
+    the analytics pool, and merge the partial results in row order. None when the scan is
+    too small to split, or the pool cannot serve this snapshot within
+    PARALLEL_SCAN_TIMEOUT_SECONDS, for a serial scan instead.
+    """
+    if ANALYTICS_POOL.workers < 2:
+        return None
+    candidates = selection if selection is not None else query.bitmap(snapshot)[0]
+    if candidates.bit_count() < PARALLEL_SCAN_MIN_ROWS:
+        return None
+
+    chunks = split_bitmap(candidates, ANALYTICS_POOL.workers)
+    if selection is not None:
+        calls = [{"query": None, "selection": chunk, **params} for chunk in chunks]
+    else:
+        calls = [{"query": query, "within": chunk, **params} for chunk in chunks]
+    parts = ANALYTICS_POOL.map("scan_" + task, snapshot.version, calls, PARALLEL_SCAN_TIMEOUT_SECONDS)
+    if parts is None:
+        return None
+
+    merge = SCAN_TASKS[task][1]
+    result = parts[0]
+    for part in parts[1:]:
+        merge(result, part)
+    return result
 
-    if from_date:
-        try:
-            from_dt = datetime.fromisoformat(from_date.replace('Z', ''))
-            result = [i for i in result if datetime.fromisoformat(i["timestamp"]) >= from_dt]
-        except:
-            pass
 
-    if to_date:
-        try:
-            to_dt = datetime.fromisoformat(to_date.replace('Z', ''))
-            result = [i for i in result if datetime.fromisoformat(i["timestamp"]) <= to_dt]
-        except:
-            pass
+def aggregate_query(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    selection: Optional[int] = None,
+    group_by: GroupBy = None,
+    sketches: bool = False
+) -> Dict[Any, Dict[str, float]]:
+    """
+    Counters of a compiled filter (or a selection bitmap) by group. Cube-answerable
+    queries come from the cube; scans are split across cores when large enough.
+    """
+    if selection is None and not query.scans(group_by):
+        return query.aggregate(snapshot, group_by, sketches)
+    grouped = parallel_scan(snapshot, query, selection, "counters", group_by=group_by)
+    return grouped if grouped is not None else scan_counters(snapshot, query, selection, group_by)
+
+
+def duration_percentiles(data: Dict[str, float]) -> Dict[str, Dict[str, Optional[float]]]:
+    """p50/p90/p99 handling time (minutes) and hold time (seconds) from a group's sketches."""
+    return {
+        "handling_time_percentiles_minutes": sketch_percentiles(data["handling_time_sketch"], scale=60),
+        "hold_time_percentiles_seconds": sketch_percentiles(data["hold_time_sketch"], digits=0)
+    }
 
-    if line_of_business:
-        result = [i for i in result if i["line_of_business"] == line_of_business]
 
-    if call_reason:
-        result = [i for i in result if i["call_reason"] == call_reason]
+def breakdown_entry(label: Any, data: Dict[str, float]) -> Dict[str, Any]:
+    """Breakdown KPIs of one group of counters."""
+    count = data["count"]
+    return {
+        "label": label,
+        "count": count,
+        "complaint_count": data["complaints"],
+        "complaint_rate": round(data["complaints"] / count * 100, 1) if count > 0 else 0,
+        "avg_handling_time_minutes": round(data["handling_time"] / count / 60, 2) if count > 0 else 0,
+        "fcr_rate": round(data["resolved"] / count * 100, 1) if count > 0 else 0,
+        "total_cost": round(data["cost"], 2),
+        **duration_percentiles(data)
+    }
 
-    if product:
-        result = [i for i in result if i["product"] == product]
 
-    if region:
-        result = [i for i in result if i["region"] == region]
+def agent_kpis(data: Dict[str, float]) -> Dict[str, Any]:
+    """Agent performance KPIs of one group of counters."""
+    count = data["count"]
+    return {
+        "interaction_count": count,
+        "complaint_count": data["complaints"],
+        "complaint_rate": round(data["complaints"] / count * 100, 1) if count > 0 else 0,
+        "avg_handling_time_minutes": round(data["handling_time"] / count / 60, 2) if count > 0 else 0,
+        "fcr_rate": round(data["resolved"] / count * 100, 1) if count > 0 else 0,
+        "escalation_rate": round(data["escalated"] / count * 100, 1) if count > 0 else 0
+    }
 
-    if team_leader:
-        result = [i for i in result if i["team_leader"] == team_leader]
 
-    if agent_id:
-        result = [i for i in result if i["agent_id"] == agent_id]
+def coaching_stats(data: Dict[str, float]) -> Dict[str, Any]:
+    """Coaching profile stats of one group of counters."""
+    count = data["count"]
+    if not count:
+        return {"count": 0, "complaint_rate": 0, "fcr_rate": 0, "aht": 0, "transfer_rate": 0}
+    return {
+        "count": count,
+        "complaint_rate": round(data["complaints"] / count * 100, 1),
+        "fcr_rate": round(data["resolved"] / count * 100, 1),
+        "aht": round(data["handling_time"] / count / 60, 1),
+        "transfer_rate": round(data["transfers"] / count, 2)
+    }
 
-    if complaints_only:
-        result = [i for i in result if i["is_complaint"]]
 
-    if channel:
-        result = [i for i in result if i["channel"] == channel]
+def coaching_gaps(agent_stats: Dict[str, Any], team_stats: Dict[str, Any]) -> Dict[str, float]:
+    """Agent minus team average, per coaching stat."""
+    return {
+        "complaint_rate": round(agent_stats["complaint_rate"] - team_stats["complaint_rate"], 1),
+        "fcr_rate": round(agent_stats["fcr_rate"] - team_stats["fcr_rate"], 1),
+        "aht": round(agent_stats["aht"] - team_stats["aht"], 1),
+        "transfer_rate": round(agent_stats["transfer_rate"] - team_stats["transfer_rate"], 2)
+    }
 
-    if segment:
-        result = [i for i in result if i["customer_segment"] == segment]
 
-    return result
+def build_coaching_plan(
+    top_category: Optional[str],
+    agent_stats: Dict[str, Any],
+    team_stats: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Coaching items for an agent: top complaint category, FCR below team, transfers over 1.5x team."""
+    coaching_plan = []
+    if top_category:
+        coaching_plan.append({
+            "priority": 1,
+            "focus": f"{top_category} Training",
+            "actions": [
+                f"Schedule {top_category.lower()} handling workshop",
+                f"Assign mentor from {top_category.lower()}-specialist team"
+            ]
+        })
+
+    if agent_stats["fcr_rate"] < team_stats["fcr_rate"]:
+        coaching_plan.append({
+            "priority": 2,
+            "focus": "Resolution Improvement",
+            "actions": [
+                "Review knowledge base articles",
+                "Shadow top performer for call handling techniques"
+            ]
+        })
+
+    if agent_stats["transfer_rate"] > team_stats["transfer_rate"] * 1.5:
+        coaching_plan.append({
+            "priority": 3,
+            "focus": "Transfer Reduction",
+            "actions": [
+                "Review escalation decision tree",
+                "Weekly 1:1 with team leader on complex cases"
+            ]
+        })
+
+    return coaching_plan
+
+
+def approximate_query(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    group_of: Optional[Callable[[Dict[str, Any]], Any]] = None
+) -> Optional[Tuple[Dict[Any, Estimate], Dict[str, Any]]]:
+    """Sampled estimates for a query, or None when the scope is small enough to answer exactly."""
+    return approximate(
+        snapshot, query, group_of,
+        budget=APPROX_SAMPLE_BUDGET,
+        exact_max_rows=APPROX_EXACT_MAX_ROWS
+    )
+
+
+def estimated_kpis(
+    estimate: Estimate,
+    spec: Iterable[Tuple[str, str, Optional[str], float, int]]
+) -> Tuple[Dict[str, float], Dict[str, List[float]]]:
+    """KPI estimates of one group and their 95% intervals, rounded like the exact values."""
+    values = {}
+    intervals = {}
+    for name, numerator, denominator, scale, digits in spec:
+        if denominator:
+            value, half_width = estimate.ratio(numerator, denominator)
+        else:
+            value, half_width = estimate.total(numerator)
+        if value is None:
+            values[name], intervals[name] = 0, [0, 0]
+            continue
+        low, high = max(value - half_width, 0) * scale, (value + half_width) * scale
+        if digits:
+            values[name] = round(value * scale, digits)
+            intervals[name] = [round(low, digits), round(high, digits)]
+        else:
+            values[name] = round(value * scale)
+            intervals[name] = [round(low), round(high)]
+    return values, intervals
+
+
+def _selection_entry(snapshot: StoreSnapshot, token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Cached selection (bitmap and filters) behind a token for this snapshot; None when no token is given."""
+    if not token:
+        return None
+    entry = SELECTIONS.get(token, snapshot.version)
+    if entry is None:
+        raise HTTPException(status_code=410, detail="Selection expired or invalidated by new data; create a new one")
+    return entry
+
+
+def _resolve_selection(
+    snapshot: StoreSnapshot,
+    token: Optional[str],
+    query: Optional[CompiledFilter] = None
+) -> Optional[int]:
+    """
+    Row bitmap behind a selection token for this snapshot, narrowed to the rows of any
+    filters given along with it; None when no token is given.
+    """
+    entry = _selection_entry(snapshot, token)
+    if entry is None:
+        return None
+    if query is None or query.unfiltered:
+        return entry["bitmap"]
+    return entry["bitmap"] & query.exact_bitmap(snapshot)
+
+
+def _apply_ingest_defaults(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill fields an ingest client may omit: id, agent details and estimated cost."""
+    record = dict(raw)
+    record.setdefault("interaction_id", str(uuid.uuid4()))
+
+    agent = AGENT_LOOKUP.get(record.get("agent_id"), {})
+    for field in ("agent_name", "team_leader", "region", "tenure_band"):
+        if record.get(field) is None and field in agent:
+            record[field] = agent[field]
+
+    # $0.75/min, as in the data generator
+    if record.get("estimated_cost_dollars") is None and record.get("handling_time_seconds") is not None:
+        record["estimated_cost_dollars"] = round(float(record["handling_time_seconds"]) / 60 * 0.75, 2)
+
+    return record
 
 
 # API Endpoints
 
 @app.get("/api/options")
+@coalesced
 def get_options():
     """Return all taxonomy lists, regions, leaders, agents."""
     # Get unique team leaders from actual data
@@ -140,29 +634,73 @@ def get_options():
     }
 
 
-@app.get("/api/interactions")
+@app.post("/api/selections")
+def create_selection(filters: FiltersModel):
+    """
+    Evaluate a filter set once and return a selection token for it. Endpoints that take
+    a `selection` parameter use the cached rows, narrowed by any filter parameters given
+    along with it.
+    """
+    query = compile_query(filters.model_dump())
+    snapshot = get_snapshot()
+    entry = SELECTIONS.put(snapshot.version, query.exact_bitmap(snapshot), filters.model_dump())
+
+    return {
+        "selection": entry["token"],
+        "count": entry["count"],
+        "version": entry["version"],
+        "expires_in_seconds": SELECTIONS.ttl_seconds,
+        "filters": entry["filters"]
+    }
+
+
+@app.get("/api/selections/{token}")
+def get_selection(token: str):
+    """Return the filters and row count behind a selection token."""
+    snapshot = get_snapshot()
+    entry = SELECTIONS.get(token, snapshot.version)
+    if entry is None:
+        raise HTTPException(status_code=410, detail="Selection expired or invalidated by new data; create a new one")
+
+    return {
+        "selection": entry["token"],
+        "count": entry["count"],
+        "version": entry["version"],
+        "filters": entry["filters"]
+    }
+
+
+@app.delete("/api/selections/{token}")
+def delete_selection(token: str):
+    """Release a selection before it expires."""
+    if not SELECTIONS.delete(token):
+        raise HTTPException(status_code=404, detail="Selection not found")
+    return {"deleted": token}
+
+
+@app.get("/api/interactions", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_interactions(
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None,
-    team_leader: Optional[str] = None,
-    agent_id: Optional[str] = None,
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None),
+    agent_id: Optional[List[str]] = Query(None),
     complaints_only: bool = False,
-    channel: Optional[str] = None,
-    segment: Optional[str] = None,
+    channel: Optional[List[str]] = Query(None),
+    segment: Optional[List[str]] = Query(None),
     page: int = 1,
     page_size: int = 50,
     sort_by: str = "timestamp",
-    sort_order: str = "desc"
+    sort_order: str = "desc",
+    ranges: Dict[str, Optional[float]] = Depends(range_filters),
+    selection: Optional[str] = None
 ):
     """Return paginated list of interactions with filters."""
-    all_interactions = get_all_interactions()
-
-    filtered = filter_interactions(
-        all_interactions,
+    query = compile_query(
         from_date=from_date,
         to_date=to_date,
         line_of_business=line_of_business,
@@ -173,8 +711,12 @@ def get_interactions(
         agent_id=agent_id,
         complaints_only=complaints_only,
         channel=channel,
-        segment=segment
+        segment=segment,
+        **ranges
     )
+    snapshot = get_snapshot()
+    rows = _resolve_selection(snapshot, selection, query)
+    filtered = filter_interactions(snapshot, query, rows)
 
     # Sort
     reverse = sort_order == "desc"
@@ -196,10 +738,184 @@ def get_interactions(
     }
 
 
+def _export_columns(export_format: str, columns: Optional[str]) -> List[str]:
+    """Export columns: 400 for unknown ones, 501 for the Arrow formats without pyarrow."""
+    try:
+        fields = resolve_columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if export_format in ARROW_FORMATS and not arrow_available():
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow to be installed")
+    return fields
+
+
+def _export_body(
+    export_format: str,
+    fields: List[str],
+    query: CompiledFilter,
+    selection: Optional[str]
+) -> Iterator[Any]:
+    """The serialized extract of the matching rows (or a selection's) of the latest snapshot."""
+    snapshot = get_snapshot()
+    selection_bitmap = _resolve_selection(snapshot, selection, query)
+    if export_format in ARROW_FORMATS:
+        # Cold segments' rows go out as their mapped Arrow columns, without decoding
+        bitmap = selection_bitmap if selection_bitmap is not None else query.exact_bitmap(snapshot)
+        rows = snapshot.iter_rows_or_tables(bitmap, fields)
+    else:
+        rows = iter_filtered_interactions(snapshot, query, selection_bitmap)
+
+    serializers = {
+        "ndjson": iter_ndjson,
+        "csv": iter_csv,
+        "arrow": iter_arrow_stream,
+        "parquet": iter_parquet,
+    }
+    return serializers[export_format](rows, fields)
+
+
+def _release_after(body: Iterable[Any], release: Callable[[], None]) -> Iterator[Any]:
+    """Stream body, then release its admission slot, also when it fails or the client goes away."""
+    try:
+        yield from body
+    finally:
+        release()
+
+
+@app.get("/api/interactions/export")
+def export_interactions(
+    export_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv|arrow|parquet)$"),
+    columns: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None),
+    agent_id: Optional[List[str]] = Query(None),
+    complaints_only: bool = False,
+    channel: Optional[List[str]] = Query(None),
+    segment: Optional[List[str]] = Query(None),
+    ranges: Dict[str, Optional[float]] = Depends(range_filters),
+    selection: Optional[str] = None,
+    release: Callable[[], None] = Depends(BULK_REQUESTS.admit_until_released)
+):
+    """Stream every matching interaction as NDJSON, CSV, Arrow IPC or Parquet, in storage order."""
+    try:
+        fields = _export_columns(export_format, columns)
+        query = compile_query(
+            from_date=from_date,
+            to_date=to_date,
+            line_of_business=line_of_business,
+            call_reason=call_reason,
+            product=product,
+            region=region,
+            team_leader=team_leader,
+            agent_id=agent_id,
+            complaints_only=complaints_only,
+            channel=channel,
+            segment=segment,
+            **ranges
+        )
+        body = _export_body(export_format, fields, query, selection)
+    except BaseException:
+        release()
+        raise
+
+    return StreamingResponse(
+        _release_after(body, release),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="interactions.{EXPORT_EXTENSIONS[export_format]}"'}
+    )
+
+
+@app.post("/api/interactions/ingest")
+def ingest_interactions(request: IngestRequest):
+    """
+    Append a batch of interactions. Root causes are classified where missing.
+    The batch is applied all-or-nothing: any invalid record rejects it with 422.
+    """
+    store = get_store()
+
+    prepared = []
+    errors = []
+    batch_ids = set()
+    for index, raw in enumerate(request.interactions):
+        try:
+            interaction = prepare_interaction(_apply_ingest_defaults(raw))
+        except (ValueError, TypeError) as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+
+        interaction_id = interaction["interaction_id"]
+        if interaction_id in store or interaction_id in batch_ids:
+            errors.append({"index": index, "error": f"Duplicate interaction_id: {interaction_id}"})
+            continue
+
+        batch_ids.add(interaction_id)
+        prepared.append(interaction)
+
+    if errors:
+        raise HTTPException(status_code=422, detail={"rejected": len(errors), "errors": errors[:100]})
+
+    # The check above is a fast path; the store re-checks under its write lock, which
+    # catches a concurrent batch that appended one of these ids in the meantime
+    try:
+        ingested = store.append(prepared)
+    except DuplicateInteractionError as e:
+        errors = [{"error": f"Duplicate interaction_id: {interaction_id}"} for interaction_id in e.interaction_ids]
+        raise HTTPException(status_code=422, detail={"rejected": len(errors), "errors": errors[:100]})
+    register_agents(prepared)
+
+    return {
+        "ingested": ingested,
+        "total_interactions": len(store)
+    }
+
+
+@app.post("/api/interactions/upsert")
+def upsert_interactions(request: IngestRequest):
+    """
+    Insert or correct interactions keyed by interaction_id. Records for existing ids
+    may be partial and are merged onto the stored version; their old contribution is
+    retracted from every index and aggregate. Re-sending a batch is a no-op.
+    """
+    store = get_store()
+
+    prepared = []
+    errors = []
+    for index, raw in enumerate(request.interactions):
+        interaction_id = raw.get("interaction_id")
+        if not interaction_id:
+            errors.append({"index": index, "error": "interaction_id is required for upsert"})
+            continue
+
+        existing = store.get(interaction_id)
+        record = merge_correction(existing, raw) if existing else raw
+        try:
+            prepared.append(prepare_interaction(_apply_ingest_defaults(record)))
+        except (ValueError, TypeError) as e:
+            errors.append({"index": index, "error": str(e)})
+
+    if errors:
+        raise HTTPException(status_code=422, detail={"rejected": len(errors), "errors": errors[:100]})
+
+    register_agents(prepared)
+    result = store.upsert(prepared)
+
+    return {
+        **result,
+        "total_interactions": len(store)
+    }
+
+
 @app.get("/api/interactions/{interaction_id}")
 def get_interaction_detail(interaction_id: str):
     """Return full interaction detail with AI summary."""
-    interaction = get_interaction_by_id(interaction_id)
+    snapshot = get_snapshot()
+    interaction = snapshot.get(interaction_id)
 
     if not interaction:
         raise HTTPException(status_code=404, detail="Interaction not found")
@@ -207,19 +923,10 @@ def get_interaction_detail(interaction_id: str):
     # Generate AI summary
     ai_summary = generate_ai_summary(interaction)
 
-    # Determine concentration for this root cause
-    all_interactions = get_all_interactions()
-    same_root_cause = [
-        i for i in all_interactions
-        if i["root_cause_label"] == interaction["root_cause_label"] and i["is_complaint"]
-    ]
+    # Agent concentration for this root cause, from the maintained concentration table
+    agent_counts = snapshot.root_cause_agents.get(interaction["root_cause_label"], {})
 
-    # Calculate agent concentration for this root cause
-    agent_counts = defaultdict(int)
-    for i in same_root_cause:
-        agent_counts[i["agent_id"]] += 1
-
-    total_for_cause = len(same_root_cause)
+    total_for_cause = sum(agent_counts.values())
     top_3 = sorted(agent_counts.items(), key=lambda x: x[1], reverse=True)[:3]
     top_3_share = sum(c for _, c in top_3) / total_for_cause if total_for_cause > 0 else 0
     concentration = "Agent-Concentrated" if top_3_share >= 0.4 else "Systemic"
@@ -247,36 +954,27 @@ def get_related_interactions(
     limit: int = 20
 ):
     """Return related interactions based on mode."""
-    interaction = get_interaction_by_id(interaction_id)
+    snapshot = get_snapshot()
+    interaction = snapshot.get(interaction_id)
 
     if not interaction:
         raise HTTPException(status_code=404, detail="Interaction not found")
 
-    all_interactions = get_all_interactions()
-
     if mode == "same_reason_product":
-        related = [
-            i for i in all_interactions
-            if i["call_reason"] == interaction["call_reason"]
-            and i["product"] == interaction["product"]
-            and i["interaction_id"] != interaction_id
-        ]
+        equals = {"call_reason": interaction["call_reason"], "product": interaction["product"]}
     elif mode == "same_agent":
-        related = [
-            i for i in all_interactions
-            if i["agent_id"] == interaction["agent_id"]
-            and i["interaction_id"] != interaction_id
-        ]
+        equals = {"agent_id": interaction["agent_id"]}
     elif mode == "same_complaint_category":
         if not interaction["is_complaint"]:
             return {"data": [], "total": 0, "mode": mode}
-        related = [
-            i for i in all_interactions
-            if i.get("complaint_category") == interaction.get("complaint_category")
-            and i["interaction_id"] != interaction_id
-        ]
+        equals = {"complaint_category": interaction.get("complaint_category")}
     else:
-        related = []
+        equals = None
+
+    related = [
+        i for i in snapshot.iter_rows(snapshot.select(equals))
+        if i["interaction_id"] != interaction_id
+    ] if equals else []
 
     # Sort by timestamp desc and limit
     related.sort(key=lambda x: x["timestamp"], reverse=True)
@@ -296,37 +994,28 @@ def get_related_interactions(
     }
 
 
-@app.post("/api/root_cause")
+@app.post("/api/root_cause", dependencies=[Depends(HEAVY_REQUESTS.admit)])
+@offloaded()
 def analyze_root_cause(request: RootCauseRequest):
     """Analyze interactions for root causes."""
-    all_interactions = get_all_interactions()
+    snapshot = get_snapshot()
 
     if request.interaction_ids:
         # Analyze specific interactions
         interactions = [
-            i for i in all_interactions
-            if i["interaction_id"] in request.interaction_ids
+            snapshot.get(interaction_id) for interaction_id in dict.fromkeys(request.interaction_ids)
+            if interaction_id in snapshot
         ]
     elif request.filters:
         # Apply filters
-        f = request.filters
-        interactions = filter_interactions(
-            all_interactions,
-            from_date=f.get("from_date"),
-            to_date=f.get("to_date"),
-            line_of_business=f.get("line_of_business"),
-            call_reason=f.get("call_reason"),
-            product=f.get("product"),
-            region=f.get("region"),
-            team_leader=f.get("team_leader"),
-            agent_id=f.get("agent_id"),
-            complaints_only=f.get("complaints_only", True),
-            channel=f.get("channel"),
-            segment=f.get("segment")
-        )
+        query = compile_query(request.filters)
+        # Root cause analysis defaults to complaints unless the filters say otherwise
+        if not {"complaints_only", "complaintsOnly"} & set(request.filters):
+            query.equals["is_complaint"] = (True,)
+        interactions = filter_interactions(snapshot, query)
     else:
         # Default: all complaints
-        interactions = [i for i in all_interactions if i["is_complaint"]]
+        interactions = list(snapshot.iter_rows(snapshot.select({"is_complaint": True})))
 
     # Cap at 500 for analysis
     if len(interactions) > 500:
@@ -336,25 +1025,25 @@ def analyze_root_cause(request: RootCauseRequest):
     return result
 
 
-@app.get("/api/root_cause/trends")
+@app.get("/api/root_cause/trends", dependencies=[Depends(HEAVY_REQUESTS.admit)])
+@offloaded()
 def get_root_cause_trends(
     root_cause: str = Query(..., description="Root cause category to get trends for"),
     weeks: int = Query(8, ge=4, le=16),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None)
 ):
     """Return weekly trends for a specific root cause category."""
-    all_interactions = get_all_interactions()
+    snapshot = get_snapshot()
 
     # Calculate date range for the past N weeks
     end_date = datetime.now()
     start_date = end_date - timedelta(weeks=weeks)
 
     # Filter to complaints only and apply other filters
-    filtered = filter_interactions(
-        all_interactions,
+    query = compile_query(
         from_date=start_date.strftime("%Y-%m-%d"),
         to_date=end_date.strftime("%Y-%m-%d"),
         line_of_business=line_of_business,
@@ -363,14 +1052,12 @@ def get_root_cause_trends(
         region=region,
         complaints_only=True
     )
+    filtered = iter_filtered_with_calendar(snapshot, query, ("week_index",))
 
-    # Group by week (ISO week number)
+    # Group by ISO week id
     weekly = defaultdict(lambda: {"total": 0, "root_cause_count": 0})
 
-    for interaction in filtered:
-        date = datetime.fromisoformat(interaction["timestamp"].replace("Z", ""))
-        week_key = f"{date.isocalendar()[0]}-W{date.isocalendar()[1]:02d}"
-
+    for interaction, (week_key,) in filtered:
         weekly[week_key]["total"] += 1
         # Check if this complaint matches the root cause
         if interaction.get("root_cause_label") == root_cause:
@@ -385,7 +1072,7 @@ def get_root_cause_trends(
 
     for week_key in sorted_weeks:
         w = weekly[week_key]
-        labels.append(week_key)
+        labels.append(calendar_week(week_key)["week_key"])
         values.append(w["root_cause_count"])
         percentages.append(round(w["root_cause_count"] / w["total"] * 100, 1) if w["total"] > 0 else 0)
 
@@ -410,23 +1097,27 @@ def get_root_cause_trends(
     }
 
 
-@app.get("/api/metrics")
+@app.get("/api/metrics", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_metrics(
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None,
-    team_leader: Optional[str] = None,
-    agent_id: Optional[str] = None,
-    complaints_only: bool = False
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None),
+    agent_id: Optional[List[str]] = Query(None),
+    complaints_only: bool = False,
+    ranges: Dict[str, Optional[float]] = Depends(range_filters),
+    selection: Optional[str] = None,
+    approx: bool = False
 ):
-    """Return aggregated KPI metrics."""
-    all_interactions = get_all_interactions()
-
-    filtered = filter_interactions(
-        all_interactions,
+    """
+    Return aggregated KPI metrics. With approx=true, filters that would need a row
+    scan over a large scope are estimated from the sample, with 95% intervals.
+    """
+    query = compile_query(
         from_date=from_date,
         to_date=to_date,
         line_of_business=line_of_business,
@@ -435,35 +1126,34 @@ def get_metrics(
         region=region,
         team_leader=team_leader,
         agent_id=agent_id,
-        complaints_only=complaints_only
+        complaints_only=complaints_only,
+        **ranges
     )
+    snapshot = get_snapshot()
+    rows = _resolve_selection(snapshot, selection, query)
+
+    sampled = approximate_query(snapshot, query) if approx and rows is None and not query.cube_only else None
+    if sampled is not None:
+        estimates, info = sampled
+        estimate = estimates.get(None, Estimate())
+        values, intervals = estimated_kpis(estimate, METRIC_ESTIMATES)
+        return {**values, **duration_percentiles(estimate.sample), **info, "confidence_intervals": intervals}
+
+    # Cube-only filters are summed from pre-aggregated cells instead of scanning
+    grouped = aggregate_query(snapshot, query, rows, sketches=True)
+    counters = grouped.get(None, new_counters())
+
+    total = counters["count"]
+    complaints = counters["complaints"]
+    resolved = counters["resolved"]
+    escalated = counters["escalated"]
+    transfers = counters["transfers"]
+    handling_time = counters["handling_time"]
+    digital_eligible = counters["digital_eligible"]
+    deflection_success = counters["deflection_success"]
+    total_cost = counters["cost"]
 
-    if not filtered:
-        return {
-            "total_interactions": 0,
-            "total_complaints": 0,
-            "complaint_rate": 0,
-            "avg_handling_time_seconds": 0,
-            "avg_handling_time_minutes": 0,
-            "fcr_rate": 0,
-            "escalation_rate": 0,
-            "avg_transfers": 0,
-            "digital_eligible_count": 0,
-            "deflection_rate": 0,
-            "total_cost": 0
-        }
-
-    total = len(filtered)
-    complaints = sum(1 for i in filtered if i["is_complaint"])
-    resolved = sum(1 for i in filtered if i["resolved_on_first_contact"])
-    escalated = sum(1 for i in filtered if i["escalated"])
-    transfers = sum(i["transfer_count"] for i in filtered)
-    handling_time = sum(i["handling_time_seconds"] for i in filtered)
-    digital_eligible = sum(1 for i in filtered if i["digital_eligible"])
-    deflection_success = sum(1 for i in filtered if i["deflection_success"])
-    total_cost = sum(i["estimated_cost_dollars"] for i in filtered)
-
-    return {
+    response = {
         "total_interactions": total,
         "total_complaints": complaints,
         "complaint_rate": round(complaints / total * 100, 1) if total > 0 else 0,
@@ -474,50 +1164,71 @@ def get_metrics(
         "avg_transfers": round(transfers / total, 2) if total > 0 else 0,
         "digital_eligible_count": digital_eligible,
         "deflection_rate": round(deflection_success / digital_eligible * 100, 1) if digital_eligible > 0 else 0,
-        "total_cost": round(total_cost, 2)
+        "total_cost": round(total_cost, 2),
+        **duration_percentiles(counters)
     }
+    if approx:
+        response["approximate"] = False
+    return response
 
 
-@app.get("/api/trends")
+@app.get("/api/trends", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_trends(
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None,
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
     complaints_only: bool = False,
-    aggregation: str = "daily"
+    aggregation: str = "daily",
+    ranges: Dict[str, Optional[float]] = Depends(range_filters),
+    selection: Optional[str] = None,
+    approx: bool = False
 ):
-    """Return time series data for trends."""
-    all_interactions = get_all_interactions()
-
-    filtered = filter_interactions(
-        all_interactions,
+    """
+    Return time series data for trends. With approx=true, large scopes are
+    estimated from the sample, with 95% intervals per point.
+    """
+    query = compile_query(
         from_date=from_date,
         to_date=to_date,
         line_of_business=line_of_business,
         call_reason=call_reason,
         product=product,
         region=region,
-        complaints_only=complaints_only
+        complaints_only=complaints_only,
+        **ranges
     )
+    snapshot = get_snapshot()
+    rows = _resolve_selection(snapshot, selection, query)
 
-    # Group by date
-    daily = defaultdict(lambda: {"count": 0, "handling_time": 0, "resolved": 0, "complaints": 0})
+    weekly = aggregation == "weekly"
 
-    for interaction in filtered:
-        dt = datetime.fromisoformat(interaction["timestamp"])
-        if aggregation == "weekly":
-            dt = dt - timedelta(days=dt.weekday())
-        key = dt.date().isoformat()
-
-        daily[key]["count"] += 1
-        daily[key]["handling_time"] += interaction["handling_time_seconds"]
-        if interaction["resolved_on_first_contact"]:
-            daily[key]["resolved"] += 1
-        if interaction["is_complaint"]:
-            daily[key]["complaints"] += 1
+    sampled = None
+    if approx and rows is None:
+        sampled = approximate_query(
+            snapshot, query,
+            lambda i: day_index(i["timestamp"][:10]) // 7 if weekly else day_index(i["timestamp"][:10])
+        )
+    if sampled is not None:
+        estimates, info = sampled
+        response = {"labels": [], **{name: [] for name, *_ in TREND_ESTIMATES}}
+        intervals = {name: [] for name, *_ in TREND_ESTIMATES}
+        for date_key in sorted(estimates):
+            values, bounds = estimated_kpis(estimates[date_key], TREND_ESTIMATES)
+            response["labels"].append(calendar_week(date_key)["week_start"] if weekly else calendar_day(date_key)["date"])
+            for name in intervals:
+                response[name].append(values[name])
+                intervals[name].append(bounds[name])
+        return {**response, **info, "confidence_intervals": intervals}
+
+    # Group by calendar day or week id
+    column = "week_index" if weekly else "day_index"
+    daily = parallel_scan(snapshot, query, rows, "trends", column=column)
+    if daily is None:
+        daily = trend_counts(snapshot, query, column, rows)
 
     # Build response
     sorted_dates = sorted(daily.keys())
@@ -530,40 +1241,43 @@ def get_trends(
 
     for date_key in sorted_dates:
         d = daily[date_key]
-        labels.append(date_key)
+        labels.append(calendar_week(date_key)["week_start"] if weekly else calendar_day(date_key)["date"])
         volume.append(d["count"])
         aht.append(round(d["handling_time"] / d["count"] / 60, 2) if d["count"] > 0 else 0)
         fcr.append(round(d["resolved"] / d["count"] * 100, 1) if d["count"] > 0 else 0)
         complaint_volume.append(d["complaints"])
 
-    return {
+    response = {
         "labels": labels,
         "volume": volume,
         "avg_handling_time": aht,
         "fcr_rate": fcr,
         "complaint_volume": complaint_volume
     }
+    if approx:
+        response["approximate"] = False
+    return response
 
 
-@app.get("/api/trends/weekly")
+@app.get("/api/trends/weekly", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_weekly_trends(
     metric: str = Query("volume", regex="^(volume|complaint_rate|fcr_rate|avg_handling_time|escalation_rate|transfer_rate|complaint_volume_rate)$"),
     weeks: int = Query(8, ge=4, le=16),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None,
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
     complaints_only: bool = False
 ):
     """Return weekly aggregated trends for a specific metric."""
-    all_interactions = get_all_interactions()
+    snapshot = get_snapshot()
 
     # Calculate date range for the past N weeks
     end_date = datetime.now()
     start_date = end_date - timedelta(weeks=weeks)
 
-    filtered = filter_interactions(
-        all_interactions,
+    query = compile_query(
         from_date=start_date.strftime("%Y-%m-%d"),
         to_date=end_date.strftime("%Y-%m-%d"),
         line_of_business=line_of_business,
@@ -572,8 +1286,9 @@ def get_weekly_trends(
         region=region,
         complaints_only=complaints_only
     )
+    filtered = iter_filtered_with_calendar(snapshot, query, ("week_index",))
 
-    # Group by week (ISO week number)
+    # Group by ISO week id
     weekly = defaultdict(lambda: {
         "count": 0,
         "handling_time": 0,
@@ -583,13 +1298,7 @@ def get_weekly_trends(
         "transferred": 0
     })
 
-    for interaction in filtered:
-        date = datetime.fromisoformat(interaction["timestamp"].replace("Z", ""))
-        # Get ISO week as "YYYY-WXX" format
-        week_key = f"{date.isocalendar()[0]}-W{date.isocalendar()[1]:02d}"
-        week_start = date - timedelta(days=date.weekday())
-
-        weekly[week_key]["week_start"] = week_start.strftime("%Y-%m-%d")
+    for interaction, (week_key,) in filtered:
         weekly[week_key]["count"] += 1
         weekly[week_key]["handling_time"] += interaction["handling_time_seconds"]
         if interaction["resolved_on_first_contact"]:
@@ -610,7 +1319,7 @@ def get_weekly_trends(
 
     for week_key in sorted_weeks:
         w = weekly[week_key]
-        labels.append(week_key)
+        labels.append(calendar_week(week_key)["week_key"])
 
         if metric == "volume":
             values.append(w["count"])
@@ -654,109 +1363,213 @@ def get_weekly_trends(
     return response
 
 
-@app.get("/api/breakdown")
+@app.get("/api/breakdown", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_breakdown(
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None,
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
     complaints_only: bool = False,
-    group_by: str = "line_of_business"
+    group_by: str = "line_of_business",
+    ranges: Dict[str, Optional[float]] = Depends(range_filters),
+    selection: Optional[str] = None,
+    approx: bool = False
 ):
-    """Return breakdown by specified dimension."""
-    all_interactions = get_all_interactions()
-
-    filtered = filter_interactions(
-        all_interactions,
+    """
+    Return breakdown by specified dimension. With approx=true, groupings that would
+    need a row scan over a large scope are estimated from the sample, with 95% intervals.
+    """
+    query = compile_query(
         from_date=from_date,
         to_date=to_date,
         line_of_business=line_of_business,
         call_reason=call_reason,
         product=product,
         region=region,
-        complaints_only=complaints_only
+        complaints_only=complaints_only,
+        **ranges
     )
-
-    # Group
-    grouped = defaultdict(lambda: {
-        "count": 0,
-        "handling_time": 0,
-        "resolved": 0,
-        "complaints": 0,
-        "cost": 0
-    })
-
-    for interaction in filtered:
-        key = interaction.get(group_by, "Unknown")
-        grouped[key]["count"] += 1
-        grouped[key]["handling_time"] += interaction["handling_time_seconds"]
-        grouped[key]["cost"] += interaction["estimated_cost_dollars"]
-        if interaction["resolved_on_first_contact"]:
-            grouped[key]["resolved"] += 1
-        if interaction["is_complaint"]:
-            grouped[key]["complaints"] += 1
+    snapshot = get_snapshot()
+    rows = _resolve_selection(snapshot, selection, query)
+
+    sampled = None
+    if approx and rows is None and not (query.cube_only and group_by in CUBE_DIMENSIONS):
+        sampled = approximate_query(snapshot, query, lambda i: i.get(group_by, "Unknown"))
+    if sampled is not None:
+        estimates, info = sampled
+        breakdown = []
+        for label, estimate in estimates.items():
+            values, intervals = estimated_kpis(estimate, BREAKDOWN_ESTIMATES)
+            breakdown.append({
+                "label": label,
+                **values,
+                **duration_percentiles(estimate.sample),
+                "confidence_intervals": intervals
+            })
+        breakdown.sort(key=lambda x: x["count"], reverse=True)
+        return {"group_by": group_by, "data": breakdown, **info}
+
+    # Grouping on a cube dimension rolls up pre-aggregated cells
+    grouped = aggregate_query(snapshot, query, rows, group_by, sketches=True)
 
     # Build response
-    breakdown = []
-    for label, data in grouped.items():
-        count = data["count"]
-        breakdown.append({
-            "label": label,
-            "count": count,
-            "complaint_count": data["complaints"],
-            "complaint_rate": round(data["complaints"] / count * 100, 1) if count > 0 else 0,
-            "avg_handling_time_minutes": round(data["handling_time"] / count / 60, 2) if count > 0 else 0,
-            "fcr_rate": round(data["resolved"] / count * 100, 1) if count > 0 else 0,
-            "total_cost": round(data["cost"], 2)
-        })
-
+    breakdown = [breakdown_entry(label, data) for label, data in grouped.items()]
     breakdown.sort(key=lambda x: x["count"], reverse=True)
 
-    return {
+    response = {
         "group_by": group_by,
         "data": breakdown
     }
+    if approx:
+        response["approximate"] = False
+    return response
 
 
-@app.get("/api/agents/performance")
-def get_agent_performance(
+@app.get("/api/breakdown/tree", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
+def get_breakdown_tree(
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    region: Optional[str] = None,
-    team_leader: Optional[str] = None
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
+    complaints_only: bool = False,
+    levels: str = "line_of_business,call_reason,product",
+    depth: Optional[int] = Query(None, ge=1),
+    ranges: Dict[str, Optional[float]] = Depends(range_filters),
+    selection: Optional[str] = None
 ):
-    """Return agent performance metrics."""
-    all_interactions = get_all_interactions()
+    """
+    Return a hierarchical breakdown (by default LOB -> call reason -> product) with
+    the same KPIs as /api/breakdown on every node. The deepest level is aggregated
+    in one pass and parents are rolled up from their children.
+    """
+    try:
+        tree_levels = parse_group_fields(levels, "levels")
+    except FilterError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if depth is not None:
+        tree_levels = tree_levels[:depth]
 
-    filtered = filter_interactions(
-        all_interactions,
+    query = compile_query(
         from_date=from_date,
         to_date=to_date,
+        line_of_business=line_of_business,
+        call_reason=call_reason,
+        product=product,
         region=region,
-        team_leader=team_leader
+        complaints_only=complaints_only,
+        **ranges
     )
+    snapshot = get_snapshot()
+    rows = _resolve_selection(snapshot, selection, query)
+
+    # Sketches are merged too, so every node reports percentiles whichever path answers the query
+    grouped = aggregate_query(snapshot, query, rows, tree_levels, sketches=True)
+
+    # Roll leaf groups up into every ancestor node, keyed by path prefix
+    nodes: Dict[tuple, Dict[str, float]] = {}
+    for path, data in grouped.items():
+        for length in range(1, len(path) + 1):
+            merge_counters(nodes.setdefault(path[:length], new_counters()), data)
+
+    children = defaultdict(list)
+    for path in nodes:
+        children[path[:-1]].append(path)
+
+    def build(path: tuple) -> Dict[str, Any]:
+        node = breakdown_entry(path[-1], nodes[path])
+        node["level"] = tree_levels[len(path) - 1]
+        if len(path) < len(tree_levels):
+            node["children"] = build_level(path)
+        return node
+
+    def build_level(parent: tuple) -> List[Dict[str, Any]]:
+        level = [build(path) for path in children[parent]]
+        level.sort(key=lambda x: x["count"], reverse=True)
+        return level
 
-    # Group by agent
-    agent_data = defaultdict(lambda: {
-        "count": 0,
-        "handling_time": 0,
-        "resolved": 0,
-        "complaints": 0,
-        "escalated": 0
-    })
+    return {
+        "levels": list(tree_levels),
+        "total": sum(data["count"] for data in grouped.values()),
+        "data": build_level(())
+    }
+
+
+@app.get("/api/facets", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
+def get_facets(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None),
+    agent_id: Optional[List[str]] = Query(None),
+    complaints_only: bool = False,
+    channel: Optional[List[str]] = Query(None),
+    segment: Optional[List[str]] = Query(None),
+    ranges: Dict[str, Optional[float]] = Depends(range_filters)
+):
+    """
+    Return, for every filterable dimension, how many interactions each value would
+    match under the current filters, ignoring that dimension's own filter.
+    """
+    query = compile_query(
+        from_date=from_date,
+        to_date=to_date,
+        line_of_business=line_of_business,
+        call_reason=call_reason,
+        product=product,
+        region=region,
+        team_leader=team_leader,
+        agent_id=agent_id,
+        complaints_only=complaints_only,
+        channel=channel,
+        segment=segment,
+        **ranges
+    )
+    snapshot = get_snapshot()
+    total, counts = query.facet_counts(snapshot, FACET_FIELDS)
+
+    facets = {}
+    for field, values in counts.items():
+        selected = query.equals.get(field, ())
+        facets[field] = sorted(
+            ({"value": value, "count": count, "selected": value in selected} for value, count in values.items()),
+            key=lambda x: x["count"],
+            reverse=True
+        )
+
+    return {
+        "total": total,
+        "facets": facets
+    }
 
-    for interaction in filtered:
-        agent_id = interaction["agent_id"]
-        agent_data[agent_id]["count"] += 1
-        agent_data[agent_id]["handling_time"] += interaction["handling_time_seconds"]
-        if interaction["resolved_on_first_contact"]:
-            agent_data[agent_id]["resolved"] += 1
-        if interaction["is_complaint"]:
-            agent_data[agent_id]["complaints"] += 1
-        if interaction["escalated"]:
-            agent_data[agent_id]["escalated"] += 1
+
+@app.get("/api/agents/performance", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
+def get_agent_performance(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None)
+):
+    """Return agent performance metrics."""
+    snapshot = get_snapshot()
+
+    query = compile_query(from_date=from_date, to_date=to_date, region=region, team_leader=team_leader)
+
+    # Group by agent, merging the agent cube's daily cells (sketches included)
+    agent_data = defaultdict(new_counters)
+    for (_, _, agent_id), cells in query.agent_daily(snapshot).items():
+        for counters in cells.values():
+            merge_counters(agent_data[agent_id], counters)
 
     # Build response with agent details
     agent_lookup = get_agent_lookup()
@@ -764,7 +1577,6 @@ def get_agent_performance(
 
     for agent_id, data in agent_data.items():
         agent_info = agent_lookup.get(agent_id, {})
-        count = data["count"]
 
         performance.append({
             "agent_id": agent_id,
@@ -772,12 +1584,8 @@ def get_agent_performance(
             "team_leader": agent_info.get("team_leader", ""),
             "region": agent_info.get("region", ""),
             "tenure_band": agent_info.get("tenure_band", ""),
-            "interaction_count": count,
-            "complaint_count": data["complaints"],
-            "complaint_rate": round(data["complaints"] / count * 100, 1) if count > 0 else 0,
-            "avg_handling_time_minutes": round(data["handling_time"] / count / 60, 2) if count > 0 else 0,
-            "fcr_rate": round(data["resolved"] / count * 100, 1) if count > 0 else 0,
-            "escalation_rate": round(data["escalated"] / count * 100, 1) if count > 0 else 0
+            **agent_kpis(data),
+            **duration_percentiles(data)
         })
 
     # Sort by complaint rate desc (worst performers first)
@@ -789,38 +1597,176 @@ def get_agent_performance(
     }
 
 
-@app.get("/api/metrics/comparison")
+@app.get("/api/agents/rollup", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
+def get_agent_rollup(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None)
+):
+    """
+    Return region -> team leader -> agent KPIs, each node with a daily series
+    (interactions and complaints per day, aligned with "days") for sparklines.
+    """
+    snapshot = get_snapshot()
+    query = compile_query(from_date=from_date, to_date=to_date, region=region, team_leader=team_leader)
+    daily = query.agent_daily(snapshot)
+
+    # Dense day axis over the requested period, or the days with data
+    seen = {day for cells in daily.values() for day in cells}
+    first = day_index(query.from_dt.date().isoformat()) if query.from_dt else min(map(day_index, seen), default=0)
+    last = day_index(query.to_dt.date().isoformat()) if query.to_dt else max(map(day_index, seen), default=-1)
+    days = [calendar_day(index)["date"] for index in range(first, last + 1)]
+    day_pos = {day: n for n, day in enumerate(days)}
+
+    # Roll agent cells up into team leaders and regions, keyed by path prefix
+    nodes: Dict[tuple, Dict[str, Any]] = {}
+    for key, cells in daily.items():
+        for length in range(1, len(key) + 1):
+            node = nodes.setdefault(key[:length], {
+                "counters": new_counters(),
+                "count": [0] * len(days),
+                "complaints": [0] * len(days)
+            })
+            for day, counters in cells.items():
+                merge_counters(node["counters"], counters)
+                node["count"][day_pos[day]] += counters["count"]
+                node["complaints"][day_pos[day]] += counters["complaints"]
+
+    children = defaultdict(list)
+    for path in nodes:
+        children[path[:-1]].append(path)
+
+    agent_lookup = get_agent_lookup()
+
+    def rollup_node(path: tuple) -> Dict[str, Any]:
+        node = nodes[path]
+        entry = {
+            **agent_kpis(node["counters"]),
+            "daily": {"count": node["count"], "complaints": node["complaints"]}
+        }
+        if len(path) == 1:
+            entry = {"region": path[0], **entry, "team_leaders": rollup_level(path)}
+        elif len(path) == 2:
+            entry = {"team_leader": path[1], **entry, "agents": rollup_level(path)}
+        else:
+            agent_info = agent_lookup.get(path[2], {})
+            entry = {
+                "agent_id": path[2],
+                "agent_name": agent_info.get("agent_name", path[2]),
+                "tenure_band": agent_info.get("tenure_band", ""),
+                **entry
+            }
+        return entry
+
+    def rollup_level(parent: tuple) -> List[Dict[str, Any]]:
+        level = [rollup_node(path) for path in children[parent]]
+        level.sort(key=lambda x: x["complaint_rate"], reverse=True)
+        return level
+
+    overall = new_counters()
+    for path in children[()]:
+        merge_counters(overall, nodes[path]["counters"])
+
+    return {
+        "days": days,
+        "summary": agent_kpis(overall),
+        "regions": rollup_level(()),
+        "total_agents": sum(1 for path in nodes if len(path) == 3)
+    }
+
+
+@app.get("/api/agents/coaching", dependencies=[Depends(HEAVY_REQUESTS.admit)])
+@offloaded()
+def get_coaching_queue(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    Return coaching plans for every agent in scope (region / team leader), ranked
+    by priority: agents with more coaching items first, then by complaint-rate gap
+    to their team. Uses the same rules as the agent profile.
+    """
+    snapshot = get_snapshot()
+    query = compile_query(from_date=from_date, to_date=to_date, region=region, team_leader=team_leader)
+
+    # Agent and team counters from the agent cube
+    agents = defaultdict(new_counters)
+    teams = defaultdict(new_counters)
+    agent_teams = {}
+    for (_, leader, aid), cells in query.agent_daily(snapshot).items():
+        for counters in cells.values():
+            merge_counters(agents[aid], counters)
+            merge_counters(teams[leader], counters)
+        agent_teams[aid] = leader
+
+    # Complaint categories per agent, from one pass over the complaints in scope
+    complaint_query = compile_query(
+        from_date=from_date,
+        to_date=to_date,
+        region=region,
+        team_leader=team_leader,
+        complaints_only=True
+    )
+    categories = defaultdict(lambda: defaultdict(int))
+    for interaction in complaint_query.iter_rows(snapshot):
+        categories[interaction["agent_id"]][interaction.get("complaint_category", "Unknown")] += 1
+
+    agent_lookup = get_agent_lookup()
+    team_stats = {leader: coaching_stats(counters) for leader, counters in teams.items()}
+    queue = []
+    for aid, counters in agents.items():
+        agent_info = agent_lookup.get(aid, {})
+        agent_stats = coaching_stats(counters)
+        team_average = team_stats[agent_teams[aid]]
+        agent_categories = categories.get(aid, {})
+        # Ties keep the first category seen, as the profile's stable sort does
+        top_category = max(agent_categories, key=agent_categories.get) if agent_categories else None
+        gaps = coaching_gaps(agent_stats, team_average)
+
+        queue.append({
+            "agent_id": aid,
+            "agent_name": agent_info.get("agent_name", aid),
+            "team_leader": agent_info.get("team_leader", agent_teams[aid]),
+            "region": agent_info.get("region", ""),
+            "stats": agent_stats,
+            "team_average": team_average,
+            "gaps": gaps,
+            "top_complaint_category": top_category,
+            "coaching_plan": build_coaching_plan(top_category, agent_stats, team_average)
+        })
+
+    queue.sort(key=lambda x: (len(x["coaching_plan"]), x["gaps"]["complaint_rate"]), reverse=True)
+    for rank, entry in enumerate(queue, 1):
+        entry["rank"] = rank
+
+    return {
+        "data": queue[:limit] if limit else queue,
+        "total_agents": len(queue)
+    }
+
+
+@app.get("/api/metrics/comparison", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_metrics_comparison(
     current_from: str = Query(..., alias="currentFrom"),
     current_to: str = Query(..., alias="currentTo"),
     previous_from: Optional[str] = Query(None, alias="previousFrom"),
     previous_to: Optional[str] = Query(None, alias="previousTo"),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None,
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
     complaints_only: bool = False
 ):
     """Return metrics comparison between two periods (week-over-week, etc.)."""
-    all_interactions = get_all_interactions()
-
-    # If no previous period specified, calculate previous period of same length
-    try:
-        current_from_dt = datetime.fromisoformat(current_from.replace('Z', ''))
-        current_to_dt = datetime.fromisoformat(current_to.replace('Z', ''))
-        period_days = (current_to_dt - current_from_dt).days + 1
-
-        if not previous_from or not previous_to:
-            previous_to_dt = current_from_dt - timedelta(days=1)
-            previous_from_dt = previous_to_dt - timedelta(days=period_days - 1)
-            previous_from = previous_from_dt.isoformat()
-            previous_to = previous_to_dt.isoformat()
-    except:
-        pass
+    snapshot = get_snapshot()
 
-    # Get current period metrics
-    current_filtered = filter_interactions(
-        all_interactions,
+    current_query = compile_query(
         from_date=current_from,
         to_date=current_to,
         line_of_business=line_of_business,
@@ -829,21 +1775,26 @@ def get_metrics_comparison(
         region=region,
         complaints_only=complaints_only
     )
+    if not current_query.from_dt or not current_query.to_dt:
+        raise HTTPException(status_code=422, detail="currentFrom and currentTo are required")
 
-    # Get previous period metrics
-    previous_filtered = filter_interactions(
-        all_interactions,
-        from_date=previous_from,
-        to_date=previous_to,
-        line_of_business=line_of_business,
-        call_reason=call_reason,
-        product=product,
-        region=region,
-        complaints_only=complaints_only
-    )
-
-    def calc_metrics(interactions):
-        if not interactions:
+    # If no previous period specified, calculate previous period of same length
+    if not previous_from or not previous_to:
+        period_days = (current_query.to_dt - current_query.from_dt).days + 1
+        previous_to_dt = current_query.from_dt - timedelta(days=1)
+        previous_from_dt = previous_to_dt - timedelta(days=period_days - 1)
+        previous_from = previous_from_dt.isoformat()
+        previous_to = previous_to_dt.isoformat()
+    previous_dates = compile_query(from_date=previous_from, to_date=previous_to)
+    previous_query = current_query.between(previous_dates.from_dt, previous_dates.to_dt)
+
+    # Both periods come from prefix sums over fully covered days plus the boundary-day rows
+    current_counters = current_query.aggregate(snapshot).get(None, new_counters())
+    previous_counters = previous_query.aggregate(snapshot).get(None, new_counters())
+
+    def calc_metrics(counters):
+        total = counters["count"]
+        if not total:
             return {
                 "total_interactions": 0, "total_complaints": 0, "complaint_rate": 0,
                 "avg_handling_time_minutes": 0, "fcr_rate": 0, "escalation_rate": 0,
@@ -851,34 +1802,26 @@ def get_metrics_comparison(
                 "total_cost": 0, "high_severity_count": 0
             }
 
-        total = len(interactions)
-        complaints = [i for i in interactions if i["is_complaint"]]
-        complaint_count = len(complaints)
-        resolved = sum(1 for i in interactions if i["resolved_on_first_contact"])
-        escalated = sum(1 for i in interactions if i["escalated"])
-        transfers = sum(1 for i in interactions if i["transfer_count"] > 0)
-        handling_time = sum(i["handling_time_seconds"] for i in interactions)
-        digital_eligible = [i for i in interactions if i["digital_eligible"]]
-        deflection_success = sum(1 for i in digital_eligible if i["deflection_success"])
-        total_cost = sum(i["estimated_cost_dollars"] for i in interactions)
-        high_severity = sum(1 for i in complaints if i.get("complaint_severity") == "High")
+        complaint_count = counters["complaints"]
+        digital_eligible = counters["digital_eligible"]
+        total_cost = counters["cost"]
 
         return {
             "total_interactions": total,
             "total_complaints": complaint_count,
             "complaint_rate": round(complaint_count / total * 100, 1) if total > 0 else 0,
-            "avg_handling_time_minutes": round(handling_time / total / 60, 2) if total > 0 else 0,
-            "fcr_rate": round(resolved / total * 100, 1) if total > 0 else 0,
-            "escalation_rate": round(escalated / total * 100, 1) if total > 0 else 0,
-            "transfer_rate": round(transfers / total * 100, 1) if total > 0 else 0,
-            "digital_deflection_rate": round(deflection_success / len(digital_eligible) * 100, 1) if digital_eligible else 0,
+            "avg_handling_time_minutes": round(counters["handling_time"] / total / 60, 2) if total > 0 else 0,
+            "fcr_rate": round(counters["resolved"] / total * 100, 1) if total > 0 else 0,
+            "escalation_rate": round(counters["escalated"] / total * 100, 1) if total > 0 else 0,
+            "transfer_rate": round(counters["transferred"] / total * 100, 1) if total > 0 else 0,
+            "digital_deflection_rate": round(counters["deflection_success"] / digital_eligible * 100, 1) if digital_eligible else 0,
             "cost_per_call": round(total_cost / total, 2) if total > 0 else 0,
             "total_cost": round(total_cost, 2),
-            "high_severity_count": high_severity
+            "high_severity_count": counters["high_severity"]
         }
 
-    current = calc_metrics(current_filtered)
-    previous = calc_metrics(previous_filtered)
+    current = calc_metrics(current_counters)
+    previous = calc_metrics(previous_counters)
 
     # Calculate deltas
     deltas = {}
@@ -912,32 +1855,26 @@ def get_metrics_comparison(
 
 class AISummaryRequest(BaseModel):
     filters: Optional[Dict[str, Any]] = None
+    selection: Optional[str] = None
 
 
-@app.post("/api/ai/summary")
+@app.post("/api/ai/summary", dependencies=[Depends(HEAVY_REQUESTS.admit)])
+# Selection tokens live only in this process, so requests using one are not offloaded
+@offloaded(inline_when=lambda request=None: bool(request and request.selection))
 def get_ai_summary(request: AISummaryRequest = None):
     """Generate AI executive summary for current data view."""
-    all_interactions = get_all_interactions()
-
-    # Apply filters if provided
-    filters = request.filters if request else {}
-    if filters:
-        filtered = filter_interactions(
-            all_interactions,
-            from_date=filters.get("from_date"),
-            to_date=filters.get("to_date"),
-            line_of_business=filters.get("lineOfBusiness") or filters.get("line_of_business"),
-            call_reason=filters.get("callReason") or filters.get("call_reason"),
-            product=filters.get("product"),
-            region=filters.get("region"),
-            team_leader=filters.get("team_leader"),
-            agent_id=filters.get("agent_id"),
-            complaints_only=filters.get("complaints_only", False),
-            channel=filters.get("channel"),
-            segment=filters.get("segment")
-        )
-    else:
-        filtered = all_interactions
+    snapshot = get_snapshot()
+
+    # A selection stands in for its filters; they are still used for the period comparison,
+    # which is why filters cannot be combined with one here
+    if request and request.selection and request.filters:
+        raise HTTPException(status_code=400, detail="Pass either selection or filters, not both")
+    # One lookup for bitmap and filters, so an eviction in between cannot split them
+    entry = _selection_entry(snapshot, request.selection if request else None)
+    rows = entry["bitmap"] if entry else None
+    filters = entry["filters"] if entry else (request.filters if request else {})
+    query = compile_query(filters)
+    filtered = filter_interactions(snapshot, query, rows)
 
     if not filtered:
         return {
@@ -992,36 +1929,25 @@ def get_ai_summary(request: AISummaryRequest = None):
         previous_to = current_from - timedelta(days=1)
         previous_from = previous_to - timedelta(days=6)
 
-        current_filtered = filter_interactions(
-            all_interactions,
-            from_date=current_from.strftime("%Y-%m-%d"),
-            to_date=current_to.strftime("%Y-%m-%d"),
-            line_of_business=filters.get("lineOfBusiness") or filters.get("line_of_business") if filters else None,
-            call_reason=filters.get("callReason") or filters.get("call_reason") if filters else None,
-            product=filters.get("product") if filters else None,
-            region=filters.get("region") if filters else None
-        )
-
-        previous_filtered = filter_interactions(
-            all_interactions,
-            from_date=previous_from.strftime("%Y-%m-%d"),
-            to_date=previous_to.strftime("%Y-%m-%d"),
-            line_of_business=filters.get("lineOfBusiness") or filters.get("line_of_business") if filters else None,
-            call_reason=filters.get("callReason") or filters.get("call_reason") if filters else None,
-            product=filters.get("product") if filters else None,
-            region=filters.get("region") if filters else None
-        )
-
-        if current_filtered and previous_filtered:
-            curr_complaints = sum(1 for i in current_filtered if i["is_complaint"])
-            prev_complaints = sum(1 for i in previous_filtered if i["is_complaint"])
-            curr_rate = curr_complaints / len(current_filtered) * 100 if current_filtered else 0
-            prev_rate = prev_complaints / len(previous_filtered) * 100 if previous_filtered else 0
-
-            curr_resolved = sum(1 for i in current_filtered if i["resolved_on_first_contact"])
-            prev_resolved = sum(1 for i in previous_filtered if i["resolved_on_first_contact"])
-            curr_fcr = curr_resolved / len(current_filtered) * 100 if current_filtered else 0
-            prev_fcr = prev_resolved / len(previous_filtered) * 100 if previous_filtered else 0
+        period_query = CompiledFilter({
+            field: value for field, value in query.equals.items()
+            if field in ("line_of_business", "call_reason", "product", "region")
+        })
+        current_counters = period_query.between(
+            parse_filter_date(current_from.strftime("%Y-%m-%d"), "from"),
+            parse_filter_date(current_to.strftime("%Y-%m-%d"), "to")
+        ).aggregate(snapshot).get(None, new_counters())
+        previous_counters = period_query.between(
+            parse_filter_date(previous_from.strftime("%Y-%m-%d"), "from"),
+            parse_filter_date(previous_to.strftime("%Y-%m-%d"), "to")
+        ).aggregate(snapshot).get(None, new_counters())
+
+        if current_counters["count"] and previous_counters["count"]:
+            curr_rate = current_counters["complaints"] / current_counters["count"] * 100
+            prev_rate = previous_counters["complaints"] / previous_counters["count"] * 100
+
+            curr_fcr = current_counters["resolved"] / current_counters["count"] * 100
+            prev_fcr = previous_counters["resolved"] / previous_counters["count"] * 100
 
             comparison = {
                 "deltas": {
@@ -1054,29 +1980,28 @@ def get_ai_summary(request: AISummaryRequest = None):
     }
 
 
-@app.get("/api/ai/root-cause/{root_cause_label}")
+@app.get("/api/ai/root-cause/{root_cause_label}", dependencies=[Depends(HEAVY_REQUESTS.admit)])
+@offloaded()
 def get_enhanced_root_cause(
     root_cause_label: str,
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None)
 ):
     """Get AI-enhanced analysis for a specific root cause category."""
-    all_interactions = get_all_interactions()
+    snapshot = get_snapshot()
 
-    # Filter to complaints with this root cause
-    filtered = filter_interactions(
-        all_interactions,
+    # Complaints with this root cause
+    query = compile_query(
         line_of_business=line_of_business,
         call_reason=call_reason,
         product=product,
         region=region,
-        complaints_only=True
+        complaints_only=True,
+        root_cause_label=root_cause_label
     )
-
-    # Get interactions matching this root cause
-    rc_interactions = [i for i in filtered if i.get("root_cause_label") == root_cause_label]
+    rc_interactions = filter_interactions(snapshot, query)
 
     if not rc_interactions:
         raise HTTPException(status_code=404, detail="No data found for this root cause category")
@@ -1108,20 +2033,20 @@ def get_enhanced_root_cause(
     }
 
 
-@app.get("/api/metrics/severity-breakdown")
+@app.get("/api/metrics/severity-breakdown", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_severity_breakdown(
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    call_reason: Optional[str] = None,
-    product: Optional[str] = None,
-    region: Optional[str] = None
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None)
 ):
     """Return complaint severity breakdown for pyramid visualization."""
-    all_interactions = get_all_interactions()
+    snapshot = get_snapshot()
 
-    filtered = filter_interactions(
-        all_interactions,
+    query = compile_query(
         from_date=from_date,
         to_date=to_date,
         line_of_business=line_of_business,
@@ -1130,6 +2055,7 @@ def get_severity_breakdown(
         region=region,
         complaints_only=True
     )
+    filtered = iter_filtered_interactions(snapshot, query)
 
     severity_counts = {"High": 0, "Medium": 0, "Low": 0}
     for interaction in filtered:
@@ -1151,24 +2077,29 @@ def get_severity_breakdown(
     }
 
 
-@app.get("/api/metrics/heatmap")
+@app.get("/api/metrics/heatmap", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
 def get_complaint_heatmap(
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to"),
-    line_of_business: Optional[str] = Query(None, alias="lob"),
-    region: Optional[str] = None
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    region: Optional[List[str]] = Query(None),
+    selection: Optional[str] = None
 ):
     """Return Product x Complaint Category heatmap data."""
-    all_interactions = get_all_interactions()
-
-    filtered = filter_interactions(
-        all_interactions,
+    query = compile_query(
         from_date=from_date,
         to_date=to_date,
         line_of_business=line_of_business,
         region=region,
         complaints_only=True
     )
+    snapshot = get_snapshot()
+    rows = _resolve_selection(snapshot, selection, query)
+    if rows is not None:
+        rows &= snapshot.select({"is_complaint": True})
+
+    filtered = iter_filtered_interactions(snapshot, query, rows)
 
     # Build matrix: product -> category -> count
     matrix = defaultdict(lambda: defaultdict(int))
@@ -1203,14 +2134,91 @@ def get_complaint_heatmap(
     }
 
 
-@app.get("/api/agents/{agent_id}/profile")
+@app.get("/api/metrics/intraday-heatmap", dependencies=[Depends(STANDARD_REQUESTS.admit)])
+@coalesced
+def get_intraday_heatmap(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    line_of_business: Optional[List[str]] = Query(None, alias="lob"),
+    call_reason: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    region: Optional[List[str]] = Query(None),
+    team_leader: Optional[List[str]] = Query(None),
+    agent_id: Optional[List[str]] = Query(None),
+    complaints_only: bool = False,
+    channel: Optional[List[str]] = Query(None),
+    segment: Optional[List[str]] = Query(None),
+    ranges: Dict[str, Optional[float]] = Depends(range_filters),
+    selection: Optional[str] = None
+):
+    """
+    Return a weekday x hour-of-day matrix of volume, AHT and complaint rate for staffing.
+    Built in one pass over the matching rows, grouping on the stored weekday/hour ids.
+    """
+    query = compile_query(
+        from_date=from_date,
+        to_date=to_date,
+        line_of_business=line_of_business,
+        call_reason=call_reason,
+        product=product,
+        region=region,
+        team_leader=team_leader,
+        agent_id=agent_id,
+        complaints_only=complaints_only,
+        channel=channel,
+        segment=segment,
+        **ranges
+    )
+    snapshot = get_snapshot()
+    rows = _resolve_selection(snapshot, selection, query)
+
+    filtered = iter_filtered_with_calendar(snapshot, query, ("weekday", "hour", "day_index"), rows)
+
+    # (weekday, hour) -> counts; weekday -> distinct days, for per-day averages
+    cells = defaultdict(lambda: {"count": 0, "handling_time": 0, "complaints": 0})
+    weekday_days = defaultdict(set)
+
+    for interaction, (weekday, hour, day) in filtered:
+        cell = cells[(weekday, hour)]
+        cell["count"] += 1
+        cell["handling_time"] += interaction["handling_time_seconds"]
+        if interaction["is_complaint"]:
+            cell["complaints"] += 1
+        weekday_days[weekday].add(day)
+
+    hours = list(range(min(h for _, h in cells), max(h for _, h in cells) + 1)) if cells else []
+
+    heatmap = []
+    for weekday, weekday_label in enumerate(WEEKDAY_LABELS):
+        days = len(weekday_days[weekday])
+        row = {"weekday": weekday_label, "days": days, "hours": {}}
+        for hour in hours:
+            c = cells.get((weekday, hour), {"count": 0, "handling_time": 0, "complaints": 0})
+            row["hours"][hour_label(hour)] = {
+                "volume": c["count"],
+                "avg_daily_volume": round(c["count"] / days, 1) if days > 0 else 0,
+                "avg_handling_time_minutes": round(c["handling_time"] / c["count"] / 60, 2) if c["count"] > 0 else 0,
+                "complaint_rate": round(c["complaints"] / c["count"] * 100, 1) if c["count"] > 0 else 0
+            }
+        heatmap.append(row)
+
+    return {
+        "weekdays": list(WEEKDAY_LABELS),
+        "hours": [hour_label(hour) for hour in hours],
+        "data": heatmap,
+        "total_interactions": sum(c["count"] for c in cells.values())
+    }
+
+
+@app.get("/api/agents/{agent_id}/profile", dependencies=[Depends(HEAVY_REQUESTS.admit)])
+@offloaded()
 def get_agent_profile(
     agent_id: str,
     from_date: Optional[str] = Query(None, alias="from"),
     to_date: Optional[str] = Query(None, alias="to")
 ):
     """Return detailed agent coaching profile."""
-    all_interactions = get_all_interactions()
+    snapshot = get_snapshot()
     agent_lookup = get_agent_lookup()
 
     agent_info = agent_lookup.get(agent_id)
@@ -1218,46 +2226,22 @@ def get_agent_profile(
         raise HTTPException(status_code=404, detail="Agent not found")
 
     # Get agent's interactions
-    agent_interactions = filter_interactions(
-        all_interactions,
-        from_date=from_date,
-        to_date=to_date,
-        agent_id=agent_id
-    )
+    query = compile_query(from_date=from_date, to_date=to_date, agent_id=agent_id)
+    agent_interactions = filter_interactions(snapshot, query)
 
     # Get team average for comparison
-    team_interactions = filter_interactions(
-        all_interactions,
-        from_date=from_date,
-        to_date=to_date,
-        team_leader=agent_info["team_leader"]
-    )
+    team_query = compile_query(from_date=from_date, to_date=to_date, team_leader=agent_info["team_leader"])
+    team_interactions = filter_interactions(snapshot, team_query)
 
-    def calc_stats(interactions):
-        if not interactions:
-            return {"count": 0, "complaint_rate": 0, "fcr_rate": 0, "aht": 0, "transfer_rate": 0}
-        total = len(interactions)
-        complaints = sum(1 for i in interactions if i["is_complaint"])
-        resolved = sum(1 for i in interactions if i["resolved_on_first_contact"])
-        transfers = sum(i["transfer_count"] for i in interactions)
-        handling = sum(i["handling_time_seconds"] for i in interactions)
-        return {
-            "count": total,
-            "complaint_rate": round(complaints / total * 100, 1),
-            "fcr_rate": round(resolved / total * 100, 1),
-            "aht": round(handling / total / 60, 1),
-            "transfer_rate": round(transfers / total, 2)
-        }
-
-    agent_stats = calc_stats(agent_interactions)
-    team_stats = calc_stats(team_interactions)
+    agent_stats = coaching_stats(counters_from_rows(agent_interactions)[None])
+    team_stats = coaching_stats(counters_from_rows(team_interactions)[None])
 
     # Calculate percentile among all agents
     all_agent_stats = []
     for aid in agent_lookup:
-        agent_ints = [i for i in all_interactions if i["agent_id"] == aid]
-        if agent_ints:
-            comp_rate = sum(1 for i in agent_ints if i["is_complaint"]) / len(agent_ints) * 100
+        stats = snapshot.agent_stats.get(aid)
+        if stats and stats["count"]:
+            comp_rate = stats["complaints"] / stats["count"] * 100
             all_agent_stats.append({"agent_id": aid, "complaint_rate": comp_rate})
 
     all_agent_stats.sort(key=lambda x: x["complaint_rate"])
@@ -1276,48 +2260,17 @@ def get_agent_profile(
     sample_complaints = [c.get("complaint_text", "") for c in agent_complaints[:5] if c.get("complaint_text")]
 
     # Generate coaching recommendations based on top complaint categories
-    coaching_plan = []
-    if sorted_categories:
-        top_category = sorted_categories[0][0]
-        coaching_plan.append({
-            "priority": 1,
-            "focus": f"{top_category} Training",
-            "actions": [
-                f"Schedule {top_category.lower()} handling workshop",
-                f"Assign mentor from {top_category.lower()}-specialist team"
-            ]
-        })
-
-    if agent_stats["fcr_rate"] < team_stats["fcr_rate"]:
-        coaching_plan.append({
-            "priority": 2,
-            "focus": "Resolution Improvement",
-            "actions": [
-                "Review knowledge base articles",
-                "Shadow top performer for call handling techniques"
-            ]
-        })
-
-    if agent_stats["transfer_rate"] > team_stats["transfer_rate"] * 1.5:
-        coaching_plan.append({
-            "priority": 3,
-            "focus": "Transfer Reduction",
-            "actions": [
-                "Review escalation decision tree",
-                "Weekly 1:1 with team leader on complex cases"
-            ]
-        })
+    coaching_plan = build_coaching_plan(
+        sorted_categories[0][0] if sorted_categories else None,
+        agent_stats,
+        team_stats
+    )
 
     return {
         "agent": agent_info,
         "stats": agent_stats,
         "team_average": team_stats,
-        "gaps": {
-            "complaint_rate": round(agent_stats["complaint_rate"] - team_stats["complaint_rate"], 1),
-            "fcr_rate": round(agent_stats["fcr_rate"] - team_stats["fcr_rate"], 1),
-            "aht": round(agent_stats["aht"] - team_stats["aht"], 1),
-            "transfer_rate": round(agent_stats["transfer_rate"] - team_stats["transfer_rate"], 2)
-        },
+        "gaps": coaching_gaps(agent_stats, team_stats),
         "percentile": percentile,
         "category_breakdown": [{"category": c, "count": n, "percentage": round(n / len(agent_complaints) * 100, 1) if agent_complaints else 0} for c, n in sorted_categories],
         "sample_complaints": sample_complaints,
@@ -1328,14 +2281,13 @@ def get_agent_profile(
 @app.get("/api/health")
 def health_check():
     """Health check endpoint."""
-    interactions = get_all_interactions()
-    complaints = sum(1 for i in interactions if i["is_complaint"])
+    totals = get_snapshot().totals
 
     return {
         "status": "healthy",
-        "total_interactions": len(interactions),
-        "total_complaints": complaints,
-        "complaint_rate": round(complaints / len(interactions) * 100, 1) if interactions else 0,
+        "total_interactions": totals["count"],
+        "total_complaints": totals["complaints"],
+        "complaint_rate": round(totals["complaints"] / totals["count"] * 100, 1) if totals["count"] else 0,
         "total_agents": len(get_all_agents()),
         "timestamp": datetime.now().isoformat()
     }
@@ -0,0 +1,256 @@
+"""
+Process-pool offload for CPU-bound endpoints.
+Workers are forked from the API process once, at startup and before it starts any
+other thread, so no worker inherits a lock that some thread held at the fork. They
+attach to its in-memory dataset copy-on-write instead of loading or receiving rows:
+only a call's arguments go out and its (already aggregated) response comes back.
+
+Workers follow the data: every write the store logs is forwarded to each worker's feed
+and applied to the worker's copy of the store by a thread in the worker, so a call
+waits (briefly) for its worker to reach the version it was submitted at. It is reported
+unavailable, for the caller to run in-process, when the worker cannot catch up within
+catch_up_seconds, or when the pool is broken: a broken pool is not re-forked, as the
+process has threads by then. Identical concurrent calls share one task; a call can also
+be split into tasks that run side by side (map), e.g. the row-range chunks of one large
+scan, which see exactly the version the call was split at.
+
+Every worker applies every write, so ingest also costs CPU in each worker, and a
+worker's memory grows with the rows written since startup: segments the API process
+moves to cold storage later on stay in memory in the workers.
+"""
+import asyncio
+import multiprocessing
+import random
+import threading
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Callable, Hashable, List, Optional
+
+from fastapi import HTTPException
+
+# Offloadable functions by name, registered before any worker is forked
+_TASKS: Dict[str, Callable] = {}
+_current_version: Callable[[], int] = lambda: 0
+# Set in workers, which never dispatch tasks of their own
+_in_worker = False
+# Worker side: notified as forwarded writes are applied; set if applying one failed
+_applied = threading.Condition()
+_catch_up_seconds = 0.0
+_follow_failed = False
+
+_OK, _HTTP_ERROR, _STALE = "ok", "http_error", "stale"
+
+
+class OffloadUnavailable(Exception):
+    """No up-to-date pool can take the call; run it in-process."""
+
+
+def register(name: str, fn: Callable) -> None:
+    _TASKS[name] = fn
+
+
+def _init_worker(
+    feeds: List[Any],
+    claimed: Any,
+    prepare: Callable[[], None],
+    apply_write: Callable[[str, Any], None],
+    catch_up_seconds: float
+) -> None:
+    global _in_worker, _catch_up_seconds
+    _in_worker = True
+    _catch_up_seconds = catch_up_seconds
+    # Forked workers would otherwise all share the parent's random state
+    random.seed()
+    with claimed.get_lock():
+        feed = feeds[claimed.value]
+        claimed.value += 1
+    prepare()
+    threading.Thread(target=_follow, args=(feed, apply_write), name="offload-follow", daemon=True).start()
+
+
+def _follow(feed: Any, apply_write: Callable[[str, Any], None]) -> None:
+    """Worker side: apply forwarded writes in order, skipping those the fork already included."""
+    global _follow_failed
+    while True:
+        version, op, payload = feed.get()
+        try:
+            if version > _current_version():
+                apply_write(op, payload)
+            if _current_version() < version:
+                raise RuntimeError(f"Applying {op} left the worker behind version {version}")
+        except Exception:
+            traceback.print_exc()
+            with _applied:
+                _follow_failed = True
+                _applied.notify_all()
+            return
+        with _applied:
+            _applied.notify_all()
+
+
+def _run_task(name: str, version: int, exact: bool, kwargs: Dict[str, Any]):
+    """
+    Worker side: run a registered function against the worker's dataset, once it has
+    caught up with version (and is still at it, if exact).
+    """
+    with _applied:
+        _applied.wait_for(lambda: _follow_failed or _current_version() >= version, _catch_up_seconds)
+    current = _current_version()
+    if _follow_failed or current < version or (exact and current != version):
+        return _STALE, None
+    try:
+        return _OK, _TASKS[name](**kwargs)
+    except HTTPException as e:
+        # HTTPException does not survive pickling; send its fields instead
+        return _HTTP_ERROR, (e.status_code, e.detail, e.headers)
+
+
+class ProcessOffloader:
+    """
+    Fork-based worker pool, forked once by start() and kept current by forward(),
+    which the store calls for every write. Workers run prepare() after the fork and
+    apply_write(op, payload) for each forwarded write.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        current_version: Callable[[], int],
+        prepare_worker: Callable[[], None],
+        apply_write: Callable[[str, Any], None],
+        catch_up_seconds: float = 5.0
+    ):
+        global _current_version
+        _current_version = current_version
+        self.workers = workers if "fork" in multiprocessing.get_all_start_methods() else 0
+        self.prepare_worker = prepare_worker
+        self.apply_write = apply_write
+        self.catch_up_seconds = catch_up_seconds
+        self.offloaded = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._feeds: List[Any] = []
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and not _in_worker
+
+    def start(self) -> None:
+        """
+        Fork the workers. Call at startup, before this process starts any other thread;
+        calls made before then, or once the pool is shut down or broken, run in-process.
+        """
+        with self._lock:
+            if not self.enabled or self._pool is not None:
+                return
+            context = multiprocessing.get_context("fork")
+            self._feeds = [context.Queue() for _ in range(self.workers)]
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._feeds, context.Value("i", 0), self.prepare_worker, self.apply_write, self.catch_up_seconds)
+            )
+            pool = self._pool
+        # With the fork context every worker is forked by the first submit, in this thread
+        try:
+            pool.submit(int).result()
+        except BrokenProcessPool:
+            self.shutdown()
+
+    def forward(self, version: int, op: str, payload: Any) -> None:
+        """Store write listener: queue a write, as of the version it publishes, for every worker."""
+        if isinstance(payload, list):
+            # Queues pickle in the background; the caller may reuse its list by then
+            payload = list(payload)
+        for feed in self._feeds:
+            feed.put((version, op, payload))
+
+    def _submit(self, name: str, key: Hashable, kwargs: Dict[str, Any]) -> Future:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            if self._pool is None:
+                raise OffloadUnavailable()
+            try:
+                future = self._pool.submit(_run_task, name, _current_version(), False, kwargs)
+            except (BrokenProcessPool, RuntimeError):
+                self._discard_pool()
+                raise OffloadUnavailable()
+            self.offloaded += 1
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _discard_pool(self, wait: bool = False) -> None:
+        """Drop a broken or shut down pool and its feeds. Caller holds the lock."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+        for feed in self._feeds:
+            feed.cancel_join_thread()
+            feed.close()
+        self._feeds = []
+
+    async def call(self, name: str, key: Hashable, kwargs: Dict[str, Any]) -> Any:
+        """Result of a registered function run in the pool; raises OffloadUnavailable to fall back."""
+        if not self.enabled:
+            raise OffloadUnavailable()
+        try:
+            status, payload = await asyncio.wrap_future(self._submit(name, key, kwargs))
+        except BrokenProcessPool:
+            with self._lock:
+                self._discard_pool()
+            raise OffloadUnavailable()
+        if status == _STALE:
+            raise OffloadUnavailable()
+        if status == _HTTP_ERROR:
+            status_code, detail, headers = payload
+            raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+        return payload
+
+    def map(self, name: str, version: int, calls: List[Dict[str, Any]], timeout: float) -> Optional[List[Any]]:
+        """
+        Results of a registered function for each kwargs in calls, run side by side in the
+        pool and waited for up to timeout seconds; None when the pool cannot serve exactly
+        that data version in time. Tasks still queued then are cancelled; running ones
+        finish in the background and their results are dropped.
+        """
+        if not self.enabled or version != _current_version():
+            return None
+        with self._lock:
+            if self._pool is None:
+                return None
+            try:
+                futures = [self._pool.submit(_run_task, name, version, True, kwargs) for kwargs in calls]
+            except (BrokenProcessPool, RuntimeError):
+                self._discard_pool()
+                return None
+            self.offloaded += len(futures)
+        _, pending = wait(futures, timeout)
+        if pending:
+            for future in pending:
+                future.cancel()
+            return None
+        try:
+            outcomes = [future.result() for future in futures]
+        except BrokenProcessPool:
+            with self._lock:
+                self._discard_pool()
+            return None
+        if any(status != _OK for status, _ in outcomes):
+            return None
+        return [payload for _, payload in outcomes]
+
+    def shutdown(self) -> None:
+        """Stop the workers once their running tasks finish; later calls run in-process."""
+        with self._lock:
+            self._discard_pool(wait=True)
@@ -0,0 +1,343 @@
+"""
+Snapshot, checkpoint and write-ahead log persistence for the interaction dataset.
+A snapshot (the bulk loader's output) is the agent roster plus every interaction
+record, pickled to one file. A checkpoint is the roster plus a list of the store's
+row segments in order: hot segments are pickled to files of their own, which later
+checkpoints reuse while the segment is unchanged, and cold segments are listed by
+the Arrow file they already live in. Writes made after a checkpoint are appended
+to numbered WAL segment files and replayed on top of it at startup, so recovery
+only re-applies the writes made since the last checkpoint.
+"""
+import glob
+import os
+import pickle
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+
+from store import SEGMENT_SIZE
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Checkpoints written as one snapshot of every row still load
+CHECKPOINT_FORMAT_VERSION = 2
+
+# WAL frame header: payload length, payload crc32
+WAL_HEADER = struct.Struct("<II")
+
+CHECKPOINT_FILENAME = "interactions.snapshot"
+WAL_SEGMENT_PATTERN = "wal-{:08d}.log"
+
+# Directory next to the checkpoint holding its hot segment files
+CHECKPOINT_SEGMENT_DIR = "checkpoint-segments"
+
+
+def save_snapshot(
+    path: str,
+    agents: List[Dict],
+    interactions: List[Dict[str, Any]],
+    wal_segment: int = 0
+) -> None:
+    """
+    Write a snapshot atomically (temp file + rename).
+    wal_segment is the first WAL segment whose writes are not included.
+    """
+    _write_pickle(path, {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "wal_segment": wal_segment,
+        "agents": agents,
+        "interactions": interactions,
+    })
+
+
+def _write_pickle(path: str, payload: Any) -> None:
+    """Pickle payload to path atomically (temp file + rename)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> Tuple[List[Dict], List[Dict[str, Any]], int]:
+    """Read a snapshot written by save_snapshot. Returns (agents, interactions, wal_segment)."""
+    with open(path, "rb") as f:
+        payload = pickle.load(f)
+
+    version = payload.get("format_version")
+    if version != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {version}")
+
+    return payload["agents"], payload["interactions"], payload.get("wal_segment", 0)
+
+
+def save_checkpoint(
+    path: str,
+    agents: List[Dict],
+    segments: List[Dict[str, Any]],
+    wal_segment: int
+) -> None:
+    """
+    Write a checkpoint atomically: the roster plus one entry per row segment, in
+    storage order, either {"hot": file name, "length"} for a segment written with
+    write_hot_segment or a cold segment's own entry (which has a "cold" key).
+    wal_segment is the first WAL segment whose writes are not included.
+    """
+    _write_pickle(path, {
+        "format_version": CHECKPOINT_FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "wal_segment": wal_segment,
+        "agents": agents,
+        "segments": segments,
+    })
+
+
+def load_checkpoint(
+    path: str,
+    open_cold: Callable[[Dict[str, Any]], Any]
+) -> Tuple[List[Dict], List[Tuple[Any, Optional[Dict[str, Any]]]], int]:
+    """
+    Read a checkpoint written by save_checkpoint. Returns (agents, [(segment, entry)],
+    wal_segment), where hot segments are read back as row tuples and cold ones are
+    opened with open_cold(entry), which maps their file rather than reading it.
+    A checkpoint in the snapshot format comes back as hot segments without entries.
+    """
+    with open(path, "rb") as f:
+        payload = pickle.load(f)
+
+    version = payload.get("format_version")
+    if version == SNAPSHOT_FORMAT_VERSION:
+        rows = payload["interactions"]
+        segments = [(tuple(rows[i:i + SEGMENT_SIZE]), None) for i in range(0, len(rows), SEGMENT_SIZE)]
+        return payload["agents"], segments, payload.get("wal_segment", 0)
+    if version != CHECKPOINT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint format version: {version}")
+
+    directory = os.path.join(os.path.dirname(path), CHECKPOINT_SEGMENT_DIR)
+    segments = []
+    for entry in payload["segments"]:
+        if "hot" in entry:
+            segments.append((read_hot_segment(directory, entry["hot"]), entry))
+        else:
+            segments.append((open_cold(entry), entry))
+    return payload["agents"], segments, payload["wal_segment"]
+
+
+def write_hot_segment(directory: str, segment: Tuple[Optional[Dict[str, Any]], ...]) -> str:
+    """Pickle a hot row segment to a new file in directory. Returns the file name."""
+    name = f"hot-{uuid.uuid4().hex}.pickle"
+    _write_pickle(os.path.join(directory, name), segment)
+    return name
+
+
+def read_hot_segment(directory: str, name: str) -> Tuple[Optional[Dict[str, Any]], ...]:
+    with open(os.path.join(directory, name), "rb") as f:
+        return pickle.load(f)
+
+
+def wal_segments(directory: str) -> List[Tuple[int, str]]:
+    """(segment number, path) for every WAL segment in a directory, oldest first."""
+    segments = []
+    for path in glob.glob(os.path.join(directory, "wal-*.log")):
+        name = os.path.basename(path)
+        try:
+            segments.append((int(name[4:-4]), path))
+        except ValueError:
+            continue
+    return sorted(segments)
+
+
+def read_wal(directory: str, from_segment: int = 0) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (operation, payload) records from WAL segments >= from_segment, in write order:
+    the interactions of an append or upsert, the cutoff day of a drop_before.
+    Each segment is read up to its first torn or corrupt frame, which is what a crash
+    in the middle of a write leaves behind.
+    """
+    for segment, path in wal_segments(directory):
+        if segment < from_segment:
+            continue
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(WAL_HEADER.size)
+                if len(header) < WAL_HEADER.size:
+                    break
+                length, crc = WAL_HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length or zlib.crc32(data) != crc:
+                    break
+                record = pickle.loads(data)
+                # Segments written before drop_before was logged keep payloads under "interactions"
+                yield record["op"], record["payload"] if "payload" in record else record["interactions"]
+
+
+class WriteAheadLog:
+    """
+    Append-only log of store writes with group commit.
+
+    write() frames a record into the current segment and returns a ticket; it is
+    cheap and is called under the store's write lock so the log order matches the
+    apply order. sync(ticket) returns once that record is on disk. Concurrent
+    writers waiting in sync() share a single fsync: whoever gets the sync lock
+    flushes everything written so far, optionally after a short commit delay to
+    let more writers join the group.
+    """
+
+    def __init__(self, directory: str, segment: int, commit_delay: float = 0.0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.commit_delay = commit_delay
+        self.segment = segment
+        self._file = open(self._segment_path(segment), "ab")
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self.fsyncs = 0
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, WAL_SEGMENT_PATTERN.format(segment))
+
+    def write(self, op: str, payload: Any) -> int:
+        """Append a record to the log buffer. Returns the ticket to pass to sync()."""
+        data = pickle.dumps({"op": op, "payload": payload}, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._write_lock:
+            self._file.write(WAL_HEADER.pack(len(data), zlib.crc32(data)))
+            self._file.write(data)
+            self._written += 1
+            return self._written
+
+    def sync(self, ticket: int) -> None:
+        """Block until the record with this ticket (and every earlier one) is durable."""
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            with self._write_lock:
+                self._file.flush()
+                target = self._written
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self.fsyncs += 1
+            self._synced = target
+
+    def rotate(self) -> int:
+        """
+        Start a new segment and return its number. Records written before the
+        rotation are flushed and stay in the older segments.
+        """
+        with self._sync_lock, self._write_lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._synced = self._written
+            self.segment += 1
+            self._file = open(self._segment_path(self.segment), "ab")
+            return self.segment
+
+    def truncate_before(self, segment: int) -> None:
+        """Delete segments older than segment, once a snapshot covers them."""
+        for number, path in wal_segments(self.directory):
+            if number < segment:
+                os.remove(path)
+
+    def close(self) -> None:
+        with self._sync_lock, self._write_lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class Checkpointer:
+    """
+    Periodically checkpoints the store and drops the WAL segments the checkpoint covers,
+    which bounds how much log has to be replayed after a restart.
+
+    Segments are immutable, so a hot segment that is the same object as at the
+    last checkpoint keeps its file, and a checkpoint only writes the hot segments
+    changed since then (usually just the one being filled) plus the small list of
+    entries; cold segments are never rewritten. The segments of the latest
+    checkpoint are held until the next one replaces it, so the cold files it
+    lists stay on disk while a restart may still need them.
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        wal: WriteAheadLog,
+        path: str,
+        get_agents: Callable[[], List[Dict]],
+        interval: float = 300.0,
+        checkpointed: List[Tuple[Any, Optional[Dict[str, Any]]]] = ()
+    ):
+        self.store = store
+        self.wal = wal
+        self.path = path
+        self.get_agents = get_agents
+        self.interval = interval
+        self.segment_dir = os.path.join(os.path.dirname(path), CHECKPOINT_SEGMENT_DIR)
+        # id(segment) -> (segment, entry) for the latest checkpoint, e.g. the one loaded at startup
+        self._checkpointed: Dict[int, Tuple[Any, Optional[Dict[str, Any]]]] = {
+            id(segment): (segment, entry) for segment, entry in checkpointed
+        }
+        self._checkpointed_segments: Optional[Tuple] = None
+        self._checkpoint_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def checkpoint(self, force: bool = False) -> bool:
+        """
+        Checkpoint the store if its segments changed since the last checkpoint, which
+        includes moving segments to cold storage. Returns whether one was written.
+        """
+        with self._checkpoint_lock:
+            if not force and self.store.snapshot().segments is self._checkpointed_segments:
+                return False
+
+            snapshot, wal_segment = self.store.checkpoint_view()
+            os.makedirs(self.segment_dir, exist_ok=True)
+            checkpointed = {}
+            for segment in snapshot.segments:
+                segment_id = id(segment)
+                previous, entry = self._checkpointed.get(segment_id, (None, None))
+                if previous is not segment or entry is None:
+                    if isinstance(segment, tuple):
+                        entry = {"hot": write_hot_segment(self.segment_dir, segment), "length": len(segment)}
+                    else:
+                        entry = segment.checkpoint_entry()
+                checkpointed[segment_id] = (segment, entry)
+            entries = [checkpointed[id(segment)][1] for segment in snapshot.segments]
+            save_checkpoint(self.path, list(self.get_agents()), entries, wal_segment)
+
+            self.wal.truncate_before(wal_segment)
+            self._checkpointed = checkpointed
+            self._checkpointed_segments = snapshot.segments
+            listed = {entry["hot"] for entry in entries if "hot" in entry}
+            for name in os.listdir(self.segment_dir):
+                if name not in listed:
+                    os.remove(os.path.join(self.segment_dir, name))
+            return True
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpointer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and write a final checkpoint."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.checkpoint()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.checkpoint()
@@ -0,0 +1,452 @@
+"""
+Filter compilation and planning.
+Endpoints turn their filter parameters (query params, or a filters dict in a
+request body) into a CompiledFilter. Compiling normalizes the aliases clients
+use (lob / lineOfBusiness / line_of_business, from / from_date, ...) to record
+fields and rejects unknown filters, bad values and inverted ranges with a
+FilterError. Categorical filters take one value or an IN-list of values, and
+numeric fields take min_/max_ bounds. At execution time predicates are ordered
+by their estimated row counts, read from the index cardinalities, partition
+sizes and range bins, so the smallest bitmap is applied first and an empty
+result stops evaluation early.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, Optional, Iterator, Iterable, List, Tuple, Set
+
+from store import (
+    StoreSnapshot, GroupBy, AGENT_DIMENSIONS, CUBE_DIMENSIONS, RANGE_BIN_EDGES, add_interaction,
+    counters_from_rows, new_counters, merge_counters, merge_grouped, agent_key, day_key, range_bin, iter_bits,
+    bitmap_from_positions
+)
+
+# Accepted filter names, mapped to the canonical filter (record field for equality filters)
+FILTER_ALIASES = {
+    "from": "from_date",
+    "from_date": "from_date",
+    "fromDate": "from_date",
+    "to": "to_date",
+    "to_date": "to_date",
+    "toDate": "to_date",
+    "lob": "line_of_business",
+    "lineOfBusiness": "line_of_business",
+    "line_of_business": "line_of_business",
+    "callReason": "call_reason",
+    "call_reason": "call_reason",
+    "product": "product",
+    "region": "region",
+    "teamLeader": "team_leader",
+    "team_leader": "team_leader",
+    "agentId": "agent_id",
+    "agent_id": "agent_id",
+    "channel": "channel",
+    "segment": "customer_segment",
+    "customerSegment": "customer_segment",
+    "customer_segment": "customer_segment",
+    "complaintCategory": "complaint_category",
+    "complaint_category": "complaint_category",
+    "rootCause": "root_cause_label",
+    "root_cause_label": "root_cause_label",
+    "complaintsOnly": "complaints_only",
+    "complaints_only": "complaints_only",
+}
+
+# Range bounds: min_<field> / max_<field>, also accepted in camelCase (minHandlingTimeSeconds)
+for _field in RANGE_BIN_EDGES:
+    for _bound in ("min", "max"):
+        _name = f"{_bound}_{_field}"
+        FILTER_ALIASES[_name] = _name
+        FILTER_ALIASES[_bound + "".join(part.title() for part in _field.split("_"))] = _name
+
+# Fields rows can be grouped by (breakdown tree levels): the categorical filter fields
+GROUP_FIELDS = (
+    "line_of_business", "call_reason", "product", "region", "team_leader", "agent_id",
+    "channel", "customer_segment", "complaint_category", "root_cause_label", "is_complaint"
+)
+
+_FLAG_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+
+class FilterError(ValueError):
+    """A filter that cannot be compiled: unknown name, conflicting aliases or invalid value."""
+
+
+class CompiledFilter:
+    """
+    Validated filters: IN-list predicates on indexed record fields (a single value
+    is a one-item list), inclusive ranges on numeric fields and an optional
+    timestamp range. Evaluates against any store snapshot.
+    """
+
+    def __init__(
+        self,
+        equals: Optional[Dict[str, Tuple]] = None,
+        from_dt: Optional[datetime] = None,
+        to_dt: Optional[datetime] = None,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None
+    ):
+        self.equals = dict(equals or {})
+        self.from_dt = from_dt
+        self.to_dt = to_dt
+        self.ranges = dict(ranges or {})
+
+    @property
+    def unfiltered(self) -> bool:
+        """Whether the filter matches every row."""
+        return not (self.equals or self.from_dt or self.to_dt or self.ranges)
+
+    @property
+    def cube_only(self) -> bool:
+        """Whether every predicate is an equality on a cube dimension (dates aside)."""
+        return not self.ranges and all(field in CUBE_DIMENSIONS for field in self.equals)
+
+    def plan(self, snapshot: StoreSnapshot) -> Tuple[List[Dict[str, Any]], Dict[str, Set]]:
+        """
+        Predicates in execution order, most selective first, with their estimated
+        row counts; and, per date or range predicate, the boundary day partitions or
+        bins whose rows need a per-row check. A bound that prunes nothing is not a predicate.
+        """
+        steps = [
+            {
+                "kind": "equals",
+                "predicate": field,
+                "value": values,
+                "estimate": sum(snapshot.filter_indexes[field].get(v, 0).bit_count() for v in values),
+            }
+            for field, values in self.equals.items()
+        ]
+        edges = {}
+
+        if self.from_dt or self.to_dt:
+            covered, boundary = snapshot.prune_partitions(self.from_dt, self.to_dt)
+            days = covered + boundary
+            if len(days) < len(snapshot.partition_days):
+                steps.append({
+                    "kind": "date",
+                    "predicate": "timestamp",
+                    "value": days,
+                    "estimate": sum(snapshot.partitions[day]["count"] for day in days),
+                })
+            if boundary:
+                edges["timestamp"] = set(boundary)
+
+        for field, (low, high) in self.ranges.items():
+            covered, boundary = snapshot.prune_bins(field, low, high)
+            bins = covered + boundary
+            index = snapshot.filter_indexes[field]
+            if len(bins) < len(index):
+                steps.append({
+                    "kind": "range",
+                    "predicate": field,
+                    "value": bins,
+                    "estimate": sum(index[n].bit_count() for n in bins),
+                })
+            if boundary:
+                edges[field] = set(boundary)
+
+        steps.sort(key=lambda step: step["estimate"])
+        return steps, edges
+
+    def bitmap(self, snapshot: StoreSnapshot) -> Tuple[int, Dict[str, Set]]:
+        """
+        Candidate rows, plus the boundary days and bins whose rows still need a
+        per-row check. Stops as soon as the intersection is empty.
+        """
+        steps, edges = self.plan(snapshot)
+        if steps and not steps[0]["estimate"]:
+            return 0, {}
+
+        bitmap = snapshot.all_rows()
+        for step in steps:
+            if step["kind"] == "date":
+                bitmap &= snapshot.partition_rows(step["value"])
+            elif step["kind"] == "range":
+                bitmap &= snapshot.bin_rows(step["predicate"], step["value"])
+            else:
+                bitmap &= snapshot.value_rows(step["predicate"], step["value"])
+            if not bitmap:
+                return 0, {}
+        return bitmap, edges
+
+    def exact_bitmap(self, snapshot: StoreSnapshot) -> int:
+        """Row bitmap of the filter, with boundary rows outside the dates or ranges removed."""
+        bitmap, edges = self.bitmap(snapshot)
+        if edges:
+            edge = 0
+            for name, keys in edges.items():
+                edge |= snapshot.partition_rows(keys) if name == "timestamp" else snapshot.bin_rows(name, keys)
+            candidates = bitmap & edge
+            outside = [
+                pos for pos, row in zip(iter_bits(candidates), snapshot.iter_rows(candidates))
+                if not self.in_bounds(row)
+            ]
+            bitmap &= ~bitmap_from_positions(outside)
+        return bitmap
+
+    def in_date_range(self, interaction: Dict[str, Any]) -> bool:
+        ts = datetime.fromisoformat(interaction["timestamp"])
+        return not ((self.from_dt and ts < self.from_dt) or (self.to_dt and ts > self.to_dt))
+
+    def in_bounds(self, interaction: Dict[str, Any]) -> bool:
+        """Whether a row satisfies the date and numeric ranges."""
+        for field, (low, high) in self.ranges.items():
+            value = interaction.get(field)
+            if value is None or (low is not None and value < low) or (high is not None and value > high):
+                return False
+        return self.in_date_range(interaction)
+
+    def matches(self, interaction: Dict[str, Any]) -> bool:
+        """Whether a row satisfies every predicate, checked on the row itself."""
+        for field, values in self.equals.items():
+            if interaction.get(field) not in values:
+                return False
+        return self.in_bounds(interaction)
+
+    def _on_edge(self, interaction: Dict[str, Any], edges: Dict[str, Set]) -> bool:
+        """Whether a row sits in a boundary day or bin, and so needs the per-row check."""
+        for name, keys in edges.items():
+            key = day_key(interaction) if name == "timestamp" else range_bin(name, interaction.get(name))
+            if key in keys:
+                return True
+        return False
+
+    def iter_rows(self, snapshot: StoreSnapshot, within: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Lazily yield matching interactions in storage order, among the rows of within if given."""
+        bitmap, edges = self.bitmap(snapshot)
+        if within is not None:
+            bitmap &= within
+        for i in snapshot.iter_rows(bitmap):
+            if edges and self._on_edge(i, edges) and not self.in_bounds(i):
+                continue
+            yield i
+
+    def iter_rows_with_calendar(
+        self,
+        snapshot: StoreSnapshot,
+        columns: Iterable[str],
+        within: Optional[int] = None
+    ) -> Iterator[Tuple[Dict[str, Any], Tuple[int, ...]]]:
+        """Like iter_rows, also yielding each row's calendar ids for columns."""
+        bitmap, edges = self.bitmap(snapshot)
+        if within is not None:
+            bitmap &= within
+        for i, ids in snapshot.iter_rows_with_calendar(bitmap, columns):
+            if edges and self._on_edge(i, edges) and not self.in_bounds(i):
+                continue
+            yield i, ids
+
+    def scans(self, group_by: GroupBy = None) -> bool:
+        """Whether aggregating by group_by scans the matching rows rather than summing cube cells."""
+        group_fields = group_by if isinstance(group_by, tuple) else (group_by,) if group_by else ()
+        return not self.cube_only or any(field not in CUBE_DIMENSIONS for field in group_fields)
+
+    def aggregate(
+        self,
+        snapshot: StoreSnapshot,
+        group_by: GroupBy = None,
+        sketches: bool = False
+    ) -> Dict[Any, Dict[str, float]]:
+        """
+        Counters of the matching rows, grouped by a field or a tuple of fields. Filters
+        and grouping on cube dimensions are answered from the prefix sums, scanning only
+        the rows of boundary days; anything else scans the matching rows. Quantile
+        sketches are only complete with sketches=True.
+        """
+        if self.scans(group_by):
+            return counters_from_rows(self.iter_rows(snapshot), group_by)
+
+        if not self.from_dt and not self.to_dt:
+            return snapshot.aggregate_cube(self.equals, group_by, sketches=sketches)
+
+        covered, boundary = snapshot.prune_partitions(self.from_dt, self.to_dt)
+        # Only the first and last day of the range can straddle a bound, so covered days are contiguous
+        if covered:
+            grouped = snapshot.range_totals(self.equals, covered[0], covered[-1], group_by, sketches)
+        else:
+            grouped = defaultdict(new_counters)
+
+        bitmap = snapshot.select(self.equals) & snapshot.partition_rows(boundary)
+        edge_rows = (i for i in snapshot.iter_rows(bitmap) if self.in_date_range(i))
+        return merge_grouped(grouped, counters_from_rows(edge_rows, group_by))
+
+    def agent_daily(self, snapshot: StoreSnapshot) -> Dict[Tuple, Dict[str, Dict[str, float]]]:
+        """
+        Counters of the matching rows per (region, team_leader, agent_id) and day.
+        Filters on those fields and dates are answered from the agent cube, scanning
+        only the rows of boundary days; anything else scans the matching rows.
+        Counters may be the snapshot's own cells, so callers merge rather than mutate them.
+        """
+        daily = defaultdict(dict)
+        if self.ranges or any(field not in AGENT_DIMENSIONS for field in self.equals):
+            rows = self.iter_rows(snapshot)
+        else:
+            checks = [(AGENT_DIMENSIONS.index(field), set(values)) for field, values in self.equals.items()]
+            covered, boundary = snapshot.prune_partitions(self.from_dt, self.to_dt)
+            for day in covered:
+                for key, counters in snapshot.agent_cube.get(day, {}).items():
+                    if all(key[i] in values for i, values in checks):
+                        daily[key][day] = counters
+            bitmap = snapshot.select(self.equals) & snapshot.partition_rows(boundary)
+            rows = (i for i in snapshot.iter_rows(bitmap) if self.in_date_range(i))
+
+        for interaction in rows:
+            add_interaction(daily[agent_key(interaction)].setdefault(day_key(interaction), new_counters()), interaction)
+        return daily
+
+    def predicate_rows(self, snapshot: StoreSnapshot) -> Dict[str, int]:
+        """
+        Exact row bitmap of each predicate on its own, keyed by field ("timestamp"
+        for the dates). Only boundary days and bins are checked row by row.
+        """
+        predicates = {field: snapshot.value_rows(field, values) for field, values in self.equals.items()}
+
+        if self.from_dt or self.to_dt:
+            covered, boundary = snapshot.prune_partitions(self.from_dt, self.to_dt)
+            edge = snapshot.partition_rows(boundary)
+            inside = [pos for pos in iter_bits(edge) if self.in_date_range(snapshot.row(pos))]
+            predicates["timestamp"] = snapshot.partition_rows(covered) | bitmap_from_positions(inside)
+
+        for field, (low, high) in self.ranges.items():
+            covered, boundary = snapshot.prune_bins(field, low, high)
+            edge = snapshot.bin_rows(field, boundary)
+            inside = [
+                pos for pos in iter_bits(edge)
+                if (low is None or snapshot.row(pos)[field] >= low) and (high is None or snapshot.row(pos)[field] <= high)
+            ]
+            predicates[field] = snapshot.bin_rows(field, covered) | bitmap_from_positions(inside)
+
+        return predicates
+
+    def facet_counts(self, snapshot: StoreSnapshot, fields: Iterable[str]) -> Tuple[int, Dict[str, Dict[Any, int]]]:
+        """
+        Matching row count, and per field the count of each indexed value under
+        every predicate except the field's own. Each predicate bitmap is built once;
+        the "all but one" intersections come from prefix and suffix products, and each
+        value count is one AND and popcount.
+        """
+        predicates = self.predicate_rows(snapshot)
+        names = list(predicates)
+        bitmaps = [predicates[name] for name in names]
+
+        prefix = [snapshot.all_rows()]
+        for bitmap in bitmaps:
+            prefix.append(prefix[-1] & bitmap)
+        suffix = [snapshot.all_rows()]
+        for bitmap in reversed(bitmaps):
+            suffix.append(suffix[-1] & bitmap)
+        suffix.reverse()
+
+        facets = {}
+        for field in fields:
+            if field in predicates:
+                n = names.index(field)
+                base = prefix[n] & suffix[n + 1]
+            else:
+                base = prefix[-1]
+            facets[field] = {
+                value: (base & rows).bit_count()
+                for value, rows in snapshot.filter_indexes[field].items() if value is not None
+            }
+        return prefix[-1].bit_count(), facets
+
+    def between(self, from_dt: Optional[datetime], to_dt: Optional[datetime]) -> "CompiledFilter":
+        """The same predicates over another date range."""
+        return CompiledFilter(self.equals, from_dt, to_dt, self.ranges)
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]] = None, **params: Any) -> Dict[str, Any]:
+    """
+    Map filter names to canonical filters, dropping unset values.
+    Unknown names and different values for aliases of one filter raise FilterError.
+    """
+    normalized = {}
+    for source in (filters or {}, params):
+        for name, value in source.items():
+            field = FILTER_ALIASES.get(name)
+            if field is None:
+                raise FilterError(f"Unknown filter: {name}")
+            # Unset values, including an unset complaints_only flag or an empty list, filter nothing
+            if value is None or value == "" or value is False or value == []:
+                continue
+            if field in normalized and normalized[field] != value:
+                raise FilterError(f"Conflicting values for {field}: {normalized[field]!r} and {value!r}")
+            normalized[field] = value
+    return normalized
+
+
+def parse_filter_date(value: Any, name: str) -> Optional[datetime]:
+    """Parse a from/to filter (YYYY-MM-DD or ISO timestamp, optional Z); empty means unbounded."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '')).replace(tzinfo=None)
+    except ValueError:
+        raise FilterError(f"Invalid {name} date: {value!r} (expected YYYY-MM-DD or an ISO timestamp)")
+
+
+def _parse_bound(value: Any, name: str) -> Optional[float]:
+    """A numeric range bound (number or numeric string)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise FilterError(f"Invalid {name}: {value!r} (expected a number)")
+
+
+def _parse_values(value: Any, field: str) -> Tuple[str, ...]:
+    """One value or an IN-list of values, as a tuple without duplicates."""
+    values = value if isinstance(value, (list, tuple)) else [value]
+    for v in values:
+        if not isinstance(v, str) or not v:
+            raise FilterError(f"Invalid {field}: {v!r} (expected a string or a list of strings)")
+    return tuple(dict.fromkeys(values))
+
+
+def parse_group_fields(value: str, name: str) -> Tuple[str, ...]:
+    """A comma-separated list of distinct GROUP_FIELDS. Raises FilterError otherwise."""
+    fields = tuple(field.strip() for field in value.split(",") if field.strip())
+    if not fields or len(set(fields)) != len(fields):
+        raise FilterError(f"{name} must be a comma-separated list of distinct fields")
+    unknown = [field for field in fields if field not in GROUP_FIELDS]
+    if unknown:
+        raise FilterError(f"Unknown {name}: {', '.join(unknown)} (expected any of {', '.join(GROUP_FIELDS)})")
+    return fields
+
+
+def compile_filters(filters: Optional[Dict[str, Any]] = None, **params: Any) -> CompiledFilter:
+    """
+    Compile a filters dict and/or keyword filters (any accepted alias) into a
+    CompiledFilter. Raises FilterError for invalid input.
+    """
+    normalized = normalize_filters(filters, **params)
+
+    from_dt = parse_filter_date(normalized.pop("from_date", None), "from")
+    to_dt = parse_filter_date(normalized.pop("to_date", None), "to")
+    if from_dt and to_dt and from_dt > to_dt:
+        raise FilterError(f"Invalid date range: from {from_dt.isoformat()} is after to {to_dt.isoformat()}")
+
+    complaints_only = normalized.pop("complaints_only", False)
+    if isinstance(complaints_only, str):
+        complaints_only = _FLAG_VALUES.get(complaints_only.lower(), complaints_only)
+    if not isinstance(complaints_only, bool):
+        raise FilterError(f"Invalid complaints_only: {complaints_only!r} (expected true or false)")
+
+    ranges = {}
+    for field in RANGE_BIN_EDGES:
+        low = _parse_bound(normalized.pop(f"min_{field}", None), f"min_{field}")
+        high = _parse_bound(normalized.pop(f"max_{field}", None), f"max_{field}")
+        if low is not None and high is not None and low > high:
+            raise FilterError(f"Invalid {field} range: min {low} is above max {high}")
+        if low is not None or high is not None:
+            ranges[field] = (low, high)
+
+    equals = {field: _parse_values(value, field) for field, value in normalized.items()}
+    if complaints_only:
+        equals["is_complaint"] = (True,)
+
+    return CompiledFilter(equals, from_dt, to_dt, ranges)
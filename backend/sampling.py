@@ -0,0 +1,171 @@
+"""
+Approximate aggregation from the store's stratified row sample.
+
+The store keeps nested hash samples of the rows (level k holds about 1 in 4^k rows,
+see store.sample_level). An approximate query picks the densest level whose rows in
+scope fit a budget and estimates every counter stratum by stratum: strata are slices
+of the KPI cube (line of business x region x complaint flag), whose exact row counts
+over the covered days come from the prefix sums, so only the share of each stratum
+matching the remaining filters is estimated.
+Rows of the (at most two) boundary days are aggregated exactly. Totals get the usual
+stratified-sampling variance, rates and averages a linearized one, and intervals are
+normal at 95%.
+"""
+import math
+from collections import defaultdict
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from query_planner import CompiledFilter
+from store import (
+    StoreSnapshot, CUBE_DIMENSIONS, COUNTER_FIELDS, SAMPLE_LEVELS,
+    add_interaction, new_counters, sample_level
+)
+
+DEFAULT_SAMPLE_BUDGET = 10000
+DEFAULT_EXACT_MAX_ROWS = 50000
+
+# Normal quantile for two-sided 95% intervals
+Z_95 = 1.96
+
+# Cube dimensions whose value combinations form the strata
+STRATA_DIMENSIONS = ("line_of_business", "region", "is_complaint")
+
+# Strata with fewer sampled rows are pooled into one, so no variance rests on a handful of rows
+MIN_STRATUM_SAMPLE = 5
+_POOLED = "__pooled__"
+
+_FIELD_INDEX = {field: n for n, field in enumerate(COUNTER_FIELDS)}
+
+
+def _stratum_variance(population: int, size: int, total: float, squares: float) -> float:
+    """Variance contribution of one stratum to an estimated total (with finite population correction)."""
+    if size < 2 or size >= population:
+        return 0.0
+    sample_variance = max(squares - total * total / size, 0.0) / (size - 1)
+    return population * population * (1 - size / population) * sample_variance / size
+
+
+class Estimate:
+    """Estimated counters of one group: sampled strata plus rows counted exactly."""
+
+    def __init__(self):
+        # stratum -> [population, sample size, per-counter sums, per-counter sums of squares]
+        self.strata: Dict[Any, List] = {}
+        self.exact = new_counters()
+        # Sampled matching rows only, for quantile sketches (every row has the same weight)
+        self.sample = new_counters()
+
+    def add(self, stratum: Any, population: int, size: int, sums: List[float], squares: List[float]) -> None:
+        entry = self.strata.get(stratum)
+        if entry is None:
+            self.strata[stratum] = [population, size, list(sums), list(squares)]
+            return
+        for n in range(len(sums)):
+            entry[2][n] += sums[n]
+            entry[3][n] += squares[n]
+
+    def total(self, field: str) -> Tuple[float, float]:
+        """Estimated total of a counter and the half-width of its 95% interval."""
+        n = _FIELD_INDEX[field]
+        value = self.exact[field]
+        variance = 0.0
+        for population, size, sums, squares in self.strata.values():
+            value += population / size * sums[n]
+            variance += _stratum_variance(population, size, sums[n], squares[n])
+        return value, Z_95 * math.sqrt(variance)
+
+    def ratio(self, numerator: str, denominator: str) -> Tuple[Optional[float], float]:
+        """
+        Estimated numerator / denominator and the half-width of its 95% interval.
+        The denominator must be a 0/1 counter that is 1 wherever the numerator is
+        non-zero (count for averages, digital_eligible for the deflection rate).
+        """
+        num, _ = self.total(numerator)
+        den, _ = self.total(denominator)
+        if den <= 0:
+            return None, 0.0
+        ratio = num / den
+        i, j = _FIELD_INDEX[numerator], _FIELD_INDEX[denominator]
+        variance = 0.0
+        for population, size, sums, squares in self.strata.values():
+            # Residuals d = y - ratio * x; with x as above, sum(x * y) = sum(y) and sum(x^2) = sum(x)
+            d_sum = sums[i] - ratio * sums[j]
+            d_squares = squares[i] - 2 * ratio * sums[i] + ratio * ratio * sums[j]
+            variance += _stratum_variance(population, size, d_sum, d_squares)
+        return ratio, Z_95 * math.sqrt(variance) / den
+
+
+def approximate(
+    snapshot: StoreSnapshot,
+    query: CompiledFilter,
+    group_of: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    budget: int = DEFAULT_SAMPLE_BUDGET,
+    exact_max_rows: int = DEFAULT_EXACT_MAX_ROWS
+) -> Optional[Tuple[Dict[Any, Estimate], Dict[str, Any]]]:
+    """
+    Estimates per group (group_of(row), or a single None group) and sampling info,
+    or None when the rows in scope are few enough to aggregate exactly.
+    """
+    cube_equals = {field: values for field, values in query.equals.items() if field in CUBE_DIMENSIONS}
+    covered, boundary = snapshot.prune_partitions(query.from_dt, query.to_dt)
+    if not covered:
+        return None
+
+    strata = snapshot.range_totals(cube_equals, covered[0], covered[-1], STRATA_DIMENSIONS)
+    population = sum(counters["count"] for counters in strata.values())
+    if population <= exact_max_rows:
+        return None
+
+    level = 1
+    while level < SAMPLE_LEVELS and population / 4 ** level > budget:
+        level += 1
+
+    scope = snapshot.select(cube_equals) & snapshot.sample_rows(level)
+    if query.from_dt or query.to_dt:
+        scope &= snapshot.partition_rows(covered)
+
+    estimates = defaultdict(Estimate)
+    sampled = defaultdict(int)
+    sums: Dict[Tuple, Tuple[List[float], List[float]]] = {}
+    for interaction in snapshot.iter_rows(scope):
+        stratum = tuple(interaction[dim] for dim in STRATA_DIMENSIONS)
+        sampled[stratum] += 1
+        if not query.matches(interaction):
+            continue
+        group = group_of(interaction) if group_of else None
+        counters = new_counters()
+        add_interaction(counters, interaction)
+        add_interaction(estimates[group].sample, interaction)
+        totals, squares = sums.setdefault((group, stratum), ([0] * len(COUNTER_FIELDS), [0] * len(COUNTER_FIELDS)))
+        for n, field in enumerate(COUNTER_FIELDS):
+            value = counters[field]
+            totals[n] += value
+            squares[n] += value * value
+
+    pooled = {stratum for stratum in strata if sampled.get(stratum, 0) < MIN_STRATUM_SAMPLE}
+    pooled_population = sum(strata[stratum]["count"] for stratum in pooled)
+    pooled_size = sum(sampled.get(stratum, 0) for stratum in pooled)
+    for (group, stratum), (totals, squares) in sums.items():
+        if stratum in pooled:
+            estimates[group].add(_POOLED, pooled_population, pooled_size, totals, squares)
+        else:
+            estimates[group].add(stratum, strata[stratum]["count"], sampled[stratum], totals, squares)
+
+    if boundary:
+        bitmap = snapshot.select(query.equals) & snapshot.partition_rows(boundary)
+        for interaction in snapshot.iter_rows(bitmap):
+            if not query.in_bounds(interaction):
+                continue
+            estimate = estimates[group_of(interaction) if group_of else None]
+            add_interaction(estimate.exact, interaction)
+            if sample_level(interaction["interaction_id"]) >= level:
+                add_interaction(estimate.sample, interaction)
+
+    info = {
+        "approximate": True,
+        "confidence_level": 0.95,
+        "sampling_rate": 4 ** -level,
+        "sample_size": sum(sampled.values()),
+        "population": population,
+    }
+    return estimates, info
@@ -0,0 +1,158 @@
+"""
+Interaction record schema and normalization.
+Shared by the exporters and the bulk loader.
+"""
+import json
+from datetime import datetime
+from typing import Dict, Any
+
+from root_cause_engine import classify_interaction
+
+# Interaction record schema: field name -> value type, in record order
+INTERACTION_SCHEMA = {
+    "interaction_id": str,
+    "timestamp": str,
+    "channel": str,
+    "customer_segment": str,
+    "line_of_business": str,
+    "call_reason": str,
+    "product": str,
+    "region": str,
+    "team_leader": str,
+    "agent_id": str,
+    "agent_name": str,
+    "tenure_band": str,
+    "handling_time_seconds": int,
+    "hold_time_seconds": int,
+    "transfer_count": int,
+    "escalated": bool,
+    "resolved_on_first_contact": bool,
+    "disposition": str,
+    "is_complaint": bool,
+    "complaint_category": str,
+    "complaint_severity": str,
+    "complaint_text": str,
+    "agent_notes": str,
+    "digital_eligible": bool,
+    "deflection_attempted": bool,
+    "deflection_success": bool,
+    "digital_failure_reason": str,
+    "revenue_opportunity_flag": bool,
+    "revenue_at_risk_flag": bool,
+    "estimated_cost_dollars": float,
+    "root_cause_label": str,
+    "root_cause_confidence": float,
+    "recommended_actions": list,
+}
+
+# Fields that are absent (None) rather than empty when a CSV cell is blank
+NULLABLE_FIELDS = {
+    "complaint_category",
+    "complaint_severity",
+    "digital_failure_reason",
+    "root_cause_label",
+    "root_cause_confidence",
+    "recommended_actions",
+}
+
+# Free-text fields that default to an empty string
+TEXT_FIELDS = {"complaint_text", "agent_notes"}
+
+TRUE_VALUES = {"true", "1", "yes", "y", "t"}
+
+
+def coerce_interaction(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a raw record (CSV strings or Parquet values) to the interaction schema.
+    Raises ValueError when a required field is missing or malformed.
+    """
+    interaction = {}
+    for field, field_type in INTERACTION_SCHEMA.items():
+        value = raw.get(field)
+        if value == "" and field not in TEXT_FIELDS:
+            value = None
+
+        if value is None:
+            if field in NULLABLE_FIELDS:
+                interaction[field] = None
+                continue
+            if field in TEXT_FIELDS:
+                interaction[field] = ""
+                continue
+            raise ValueError(f"Missing required field: {field}")
+
+        interaction[field] = _coerce_value(value, field_type)
+
+    # Normalize timestamps to the ISO format the generator emits
+    ts = raw["timestamp"]
+    ts = ts if isinstance(ts, datetime) else datetime.fromisoformat(str(ts).replace("Z", ""))
+    interaction["timestamp"] = ts.replace(tzinfo=None).isoformat()
+
+    return interaction
+
+
+def _coerce_value(value: Any, field_type: type) -> Any:
+    """Coerce a single value to its schema type."""
+    if field_type is bool:
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in TRUE_VALUES
+    if field_type is int:
+        return int(float(value))
+    if field_type is float:
+        return float(value)
+    if field_type is list:
+        return json.loads(value) if isinstance(value, str) else list(value)
+    return str(value)
+
+
+def prepare_interaction(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce a record and classify its root cause if the source did not provide one."""
+    interaction = coerce_interaction(raw)
+
+    if not interaction["root_cause_label"]:
+        root_cause_data = classify_interaction(
+            complaint_text=interaction["complaint_text"] if interaction["is_complaint"] else None,
+            call_reason=interaction["call_reason"],
+            product=interaction["product"],
+            is_complaint=interaction["is_complaint"]
+        )
+        interaction["root_cause_label"] = root_cause_data["root_cause_label"]
+        interaction["root_cause_confidence"] = root_cause_data["root_cause_confidence"]
+        interaction["recommended_actions"] = root_cause_data["recommended_actions"]
+
+    if interaction["root_cause_confidence"] is None:
+        interaction["root_cause_confidence"] = 0.0
+    if interaction["recommended_actions"] is None:
+        interaction["recommended_actions"] = []
+
+    return interaction
+
+
+# Fields the root cause classification depends on
+CLASSIFICATION_INPUTS = {"complaint_text", "is_complaint", "call_reason", "product"}
+
+# Fields derived from the agent roster
+AGENT_DETAIL_FIELDS = {"agent_name", "team_leader", "region", "tenure_band"}
+
+
+def merge_correction(existing: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply a partial correction to an existing record.
+    The root cause is reclassified when its inputs change and no label is supplied;
+    agent details are re-derived when the agent changes without them.
+    """
+    record = {**existing, **patch}
+
+    if "root_cause_label" not in patch and any(
+        field in patch and patch[field] != existing.get(field) for field in CLASSIFICATION_INPUTS
+    ):
+        record["root_cause_label"] = None
+        record["root_cause_confidence"] = None
+        record["recommended_actions"] = None
+
+    if patch.get("agent_id", existing["agent_id"]) != existing["agent_id"]:
+        for field in AGENT_DETAIL_FIELDS - set(patch):
+            record[field] = None
+
+    return record
@@ -0,0 +1,83 @@
+"""
+Selection handles: filter results cached server-side under a short token.
+A selection is the exact row bitmap of a filter set at one store version.
+Dashboard panels pass the token instead of re-sending (and re-evaluating) the
+filters. Handles expire after a TTL, are evicted least-recently-used when
+the entry count or memory budget is exceeded, and are invalid once the
+dataset version moves on.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MEMORY_BUDGET_MB = 64
+DEFAULT_TTL_SECONDS = 900
+
+
+class SelectionCache:
+    """Thread-safe LRU of selection bitmaps with a byte budget and TTL."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, version: int, bitmap: int, filters: Dict[str, Any]) -> Dict[str, Any]:
+        """Cache a selection for a store version and return its entry (with the new token)."""
+        entry = {
+            "token": uuid.uuid4().hex,
+            "version": version,
+            "bitmap": bitmap,
+            "count": bitmap.bit_count(),
+            "filters": filters,
+            "bytes": (bitmap.bit_length() + 7) // 8,
+            "expires_at": time.time() + self.ttl_seconds,
+        }
+
+        with self._lock:
+            # Selections from older versions can never be used again
+            for token in [t for t, e in self._entries.items() if e["version"] < version]:
+                self._remove(token)
+
+            self._entries[entry["token"]] = entry
+            self._bytes += entry["bytes"]
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._bytes > self.memory_budget_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+        return entry
+
+    def get(self, token: str, version: int) -> Optional[Dict[str, Any]]:
+        """The live entry for token at this store version, or None if unknown, expired or stale."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry["version"] != version or entry["expires_at"] < time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return entry
+
+    def delete(self, token: str) -> bool:
+        with self._lock:
+            if token not in self._entries:
+                return False
+            self._remove(token)
+            return True
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token)
+        self._bytes -= entry["bytes"]
@@ -0,0 +1,68 @@
+"""
+Single-flight request coalescing.
+Concurrent calls with the same key share one execution: the first caller runs the
+function and later callers wait for it and receive the same result (or exception).
+Nothing is cached; once a call has finished, the next caller runs it again.
+"""
+import threading
+from typing import Dict, Any, Callable, Hashable
+
+from pydantic import BaseModel
+
+
+def freeze(value: Any) -> Hashable:
+    """Hashable, normalized form of request parameters (models, dicts and lists included)."""
+    if isinstance(value, BaseModel):
+        return freeze(value.model_dump())
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((freeze(item) for item in value), key=repr))
+    return value
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-safe registry of in-flight calls by key."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs), or wait for the identical call already running under key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
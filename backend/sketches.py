@@ -0,0 +1,84 @@
+"""
+Mergeable quantile sketches (DDSketch) for duration KPIs.
+
+A sketch is a plain dict of bucket key -> count. Bucket k >= 1 holds values in
+(gamma^(k-2), gamma^(k-1)], so every value reported for a quantile is within
+RELATIVE_ACCURACY of the true value; values below 1 share bucket 0 and report 0.
+Because a sketch is only counts, two sketches merge by adding their buckets and
+a value is retracted by decrementing its bucket, which lets sketches live in
+the store's incrementally maintained cells like any other counter.
+"""
+import math
+from typing import Dict, Optional, Iterable
+
+RELATIVE_ACCURACY = 0.01
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Quantiles reported by the API, keyed by response name
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+def sketch_key(value: float) -> int:
+    """Bucket of a value."""
+    if value < 1:
+        return 0
+    return math.ceil(math.log(value) / _LOG_GAMMA) + 1
+
+
+def bucket_value(key: int) -> float:
+    """Representative value of a bucket (within RELATIVE_ACCURACY of any value in it)."""
+    if key <= 0:
+        return 0.0
+    return 2 * _GAMMA ** (key - 1) / (_GAMMA + 1)
+
+
+def add_value(sketch: Dict[int, int], value: Optional[float], sign: int = 1) -> None:
+    """Add (sign=1) or retract (sign=-1) one value. Empty buckets are dropped."""
+    if value is None:
+        return
+    key = sketch_key(value)
+    count = sketch.get(key, 0) + sign
+    if count:
+        sketch[key] = count
+    else:
+        del sketch[key]
+
+
+def merge_sketch(target: Dict[int, int], source: Dict[int, int], sign: int = 1) -> None:
+    """Add (or with sign=-1, subtract) every bucket of source into target."""
+    for key, count in source.items():
+        total = target.get(key, 0) + sign * count
+        if total:
+            target[key] = total
+        else:
+            target.pop(key, None)
+
+
+def sketch_quantile(sketch: Dict[int, int], q: float) -> Optional[float]:
+    """Approximate q-quantile (0 <= q <= 1) of the sketched values, or None when empty."""
+    total = sum(sketch.values())
+    if total <= 0:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for key in sorted(sketch):
+        seen += sketch[key]
+        if seen > rank:
+            return bucket_value(key)
+    return bucket_value(max(sketch))
+
+
+def sketch_percentiles(
+    sketch: Dict[int, int],
+    scale: float = 1.0,
+    digits: int = 2,
+    percentiles: Iterable[str] = PERCENTILES
+) -> Dict[str, Optional[float]]:
+    """Named percentiles of a sketch, divided by scale (e.g. 60 for minutes) and rounded."""
+    result = {}
+    for name in percentiles:
+        value = sketch_quantile(sketch, PERCENTILES[name])
+        result[name] = round(value / scale, digits) if value is not None else None
+    return result
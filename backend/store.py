@@ -0,0 +1,1179 @@
+"""
+In-memory interaction store with incrementally maintained indexes and aggregates.
+
+Rows are addressed by position. Equality filters are answered from per-value row
+bitmaps (Python ints, bit N = row position N), and additive KPIs from pre-aggregated
+cube cells, per-agent stats (overall and by day) and root-cause concentration tables.
+Appended batches are folded into every structure, and corrected rows retract their old contribution before
+adding the new one, so changes are queryable without a rebuild.
+
+Readers work on immutable StoreSnapshot versions. Rows live in fixed-size tuple
+segments, and a writer copies only the segments, index entries and aggregate cells a
+batch touches before publishing the next version with a single reference swap. A
+request that pins one snapshot therefore never sees a half-applied batch, and
+neither readers nor writers wait on each other.
+
+Numeric fields that users filter by range are indexed the same way, by value bin:
+bins have fixed edges, so a range query takes the bins it fully covers as they
+are and checks only the rows of the (at most two) bins it cuts through.
+
+Rows are also grouped into day partitions, each with its own row bitmap and
+min/max timestamp, so from/to filters only touch the days that overlap the range.
+Each cube slice also keeps its cells by day, from which cumulative (prefix-sum)
+daily counters are derived on demand, so totals over any run of days cost two
+lookups per slice.
+
+Alongside each row segment the store keeps calendar ids (day, ISO week, hour,
+weekday) as small integer array columns, filled once at ingest; see calendar_table.py.
+
+Rows are also sampled by a hash of their id into nested levels (about 1 in 4, 1 in
+16, ... rows), kept as bitmaps for approximate queries; see sampling.py.
+
+A segment may be any sequence of rows, such as a memory-mapped cold segment
+(see tiered_storage.py); rows dropped by retention leave a None slot behind.
+Segments other than tuples also provide take(offsets), which scans use to fetch
+all the rows they need from one segment at once.
+"""
+import bisect
+import threading
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple, Union
+
+from calendar_table import CALENDAR_COLUMNS, time_buckets
+from sketches import add_value, merge_sketch
+
+# Record fields with a per-value row bitmap
+INDEXED_FIELDS = [
+    "line_of_business",
+    "call_reason",
+    "product",
+    "region",
+    "team_leader",
+    "agent_id",
+    "channel",
+    "customer_segment",
+    "is_complaint",
+    "complaint_category",
+    "root_cause_label",
+]
+
+# Numeric fields with a per-bin row bitmap (range filters), and their ascending bin edges.
+# Bin n holds edges[n] <= value < edges[n + 1]; values below the first or from the last
+# edge on fall in the open-ended bins -1 and len(edges) - 1.
+RANGE_BIN_EDGES = {
+    "handling_time_seconds": tuple(range(0, 3601, 30)),
+    "hold_time_seconds": tuple(range(0, 1201, 15)),
+    "transfer_count": tuple(range(0, 11)),
+    "estimated_cost_dollars": tuple(n / 4 for n in range(0, 201)),
+    "root_cause_confidence": tuple(n / 100 for n in range(0, 101)),
+}
+
+# Range fields holding whole numbers, whose bins can be closed one below the next edge
+INTEGER_RANGE_FIELDS = ("handling_time_seconds", "hold_time_seconds", "transfer_count")
+
+# Every field with a row bitmap index
+INDEX_FIELDS = tuple(INDEXED_FIELDS) + tuple(RANGE_BIN_EDGES)
+
+# Dimensions of the KPI cube; every cell is also keyed by day (YYYY-MM-DD)
+CUBE_DIMENSIONS = ("line_of_business", "call_reason", "product", "region", "is_complaint")
+
+# Dimensions of the agent cube (agent rollups); every cell is also keyed by day
+AGENT_DIMENSIONS = ("region", "team_leader", "agent_id")
+
+# A grouping: one field, a tuple of fields, or None for a single group
+GroupBy = Optional[Union[str, Tuple[str, ...]]]
+
+# Nested hash samples of the rows: level k (1-based) holds about 1 in 4^k rows
+SAMPLE_LEVELS = 6
+
+# Rows per immutable row segment
+SEGMENT_SIZE = 4096
+
+# Bit offsets set in each byte value, for decoding bitmaps
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def new_counters() -> Dict[str, float]:
+    """Return an empty set of additive KPI counters."""
+    return {
+        "count": 0,
+        "complaints": 0,
+        "resolved": 0,
+        "escalated": 0,
+        "transfers": 0,
+        "transferred": 0,
+        "handling_time": 0,
+        "hold_time": 0,
+        "cost": 0.0,
+        "digital_eligible": 0,
+        "deflection_success": 0,
+        "high_severity": 0,
+        "handling_time_sketch": {},
+        "hold_time_sketch": {},
+    }
+
+
+# Quantile sketches kept with the counters, and the record field each one sketches
+SKETCH_FIELDS = {
+    "handling_time_sketch": "handling_time_seconds",
+    "hold_time_sketch": "hold_time_seconds",
+}
+
+# Additive counter names (everything but the sketches), in the order prefix sums store them
+COUNTER_FIELDS = tuple(field for field in new_counters() if field not in SKETCH_FIELDS)
+
+
+def add_interaction(counters: Dict[str, float], interaction: Dict[str, Any], sign: int = 1) -> None:
+    """Add one interaction's contribution to a set of counters (sign=-1 retracts it)."""
+    counters["count"] += sign
+    counters["handling_time"] += sign * interaction["handling_time_seconds"]
+    counters["hold_time"] += sign * interaction["hold_time_seconds"]
+    counters["transfers"] += sign * interaction["transfer_count"]
+    counters["cost"] += sign * interaction["estimated_cost_dollars"]
+    for sketch, field in SKETCH_FIELDS.items():
+        add_value(counters[sketch], interaction[field], sign)
+    if interaction["is_complaint"]:
+        counters["complaints"] += sign
+        if interaction.get("complaint_severity") == "High":
+            counters["high_severity"] += sign
+    if interaction["resolved_on_first_contact"]:
+        counters["resolved"] += sign
+    if interaction["escalated"]:
+        counters["escalated"] += sign
+    if interaction["transfer_count"] > 0:
+        counters["transferred"] += sign
+    if interaction["digital_eligible"]:
+        counters["digital_eligible"] += sign
+        if interaction["deflection_success"]:
+            counters["deflection_success"] += sign
+
+
+def merge_counters(target: Dict[str, float], source: Dict[str, float]) -> None:
+    """Add every counter (and merge every sketch) in source into target."""
+    for key in COUNTER_FIELDS:
+        target[key] += source[key]
+    for key in SKETCH_FIELDS:
+        merge_sketch(target[key], source[key])
+
+
+def copy_counters(counters: Dict[str, float]) -> Dict[str, float]:
+    """Independent copy of a set of counters (sketches included)."""
+    return {key: dict(value) if key in SKETCH_FIELDS else value for key, value in counters.items()}
+
+
+def counters_from_rows(
+    interactions: Iterable[Dict[str, Any]],
+    group_by: GroupBy = None
+) -> Dict[Any, Dict[str, float]]:
+    """
+    Aggregate rows into counters, grouped by a record field, by a tuple of fields
+    (keys are value tuples), or into a single None group.
+    """
+    grouped = defaultdict(new_counters)
+    for interaction in interactions:
+        if isinstance(group_by, tuple):
+            key = tuple(interaction.get(field, "Unknown") for field in group_by)
+        else:
+            key = interaction.get(group_by, "Unknown") if group_by else None
+        add_interaction(grouped[key], interaction)
+    return grouped
+
+
+def merge_grouped(
+    target: Dict[Any, Dict[str, float]],
+    source: Dict[Any, Dict[str, float]]
+) -> Dict[Any, Dict[str, float]]:
+    """Merge grouped counters into target, group by group; new groups keep source order."""
+    for key, counters in source.items():
+        merge_counters(target.setdefault(key, new_counters()), counters)
+    return target
+
+
+def bitmap_from_positions(positions: Iterable[int]) -> int:
+    """Build a row bitmap with the given positions set."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    data = bytearray(max(positions) // 8 + 1)
+    for pos in positions:
+        data[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(data, "little")
+
+
+def iter_bits(bitmap: int) -> Iterator[int]:
+    """Yield the set positions of a row bitmap in ascending order."""
+    if not bitmap:
+        return
+    # Skip the empty low end in one shift, so recent rows decode without touching old ones
+    start = ((bitmap & -bitmap).bit_length() - 1) & ~7
+    bitmap >>= start
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = start + (byte_index << 3)
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+
+def iter_segment_offsets(bitmap: int) -> Iterator[Tuple[int, List[int]]]:
+    """Yield (segment number, offsets within it) for the set positions of a row bitmap, in order."""
+    seg_no, offsets = -1, []
+    for pos in iter_bits(bitmap):
+        segment, offset = divmod(pos, SEGMENT_SIZE)
+        if segment != seg_no:
+            if offsets:
+                yield seg_no, offsets
+            seg_no, offsets = segment, []
+        offsets.append(offset)
+    if offsets:
+        yield seg_no, offsets
+
+
+def split_bitmap(bitmap: int, parts: int) -> List[int]:
+    """
+    Split a row bitmap into up to parts bitmaps over consecutive row ranges holding
+    about the same number of rows, so the ranges can be scanned in parallel.
+    """
+    total = bitmap.bit_count()
+    parts = max(1, min(parts, total))
+    chunks = []
+    lo = 0
+    for n in range(1, parts):
+        target = total * n // parts
+        # Smallest position whose prefix holds target rows
+        low, high = lo, bitmap.bit_length()
+        while low < high:
+            mid = (low + high) // 2
+            if (bitmap & ((1 << mid) - 1)).bit_count() < target:
+                low = mid + 1
+            else:
+                high = mid
+        chunks.append(bitmap & ((1 << low) - 1) & ~((1 << lo) - 1))
+        lo = low
+    chunks.append(bitmap & ~((1 << lo) - 1))
+    return chunks
+
+
+def range_bin(field: str, value: Any) -> Optional[int]:
+    """Index bin of a range field value (None stays None)."""
+    if value is None:
+        return None
+    return bisect.bisect_right(RANGE_BIN_EDGES[field], value) - 1
+
+
+def sample_level(interaction_id: str) -> int:
+    """
+    Deepest sample level a row belongs to (0 for none). Membership depends only on
+    the id, so it survives restarts and corrections, and level k+1 is a subset of level k.
+    """
+    digest = zlib.crc32(interaction_id.encode())
+    level = 0
+    while level < SAMPLE_LEVELS and digest % (4 ** (level + 1)) == 0:
+        level += 1
+    return level
+
+
+def index_key(interaction: Dict[str, Any], field: str) -> Any:
+    """Key of a row in a field's index: the value itself, or its bin for range fields."""
+    if field in RANGE_BIN_EDGES:
+        return range_bin(field, interaction.get(field))
+    return interaction.get(field)
+
+
+def _value_set(value: Any) -> frozenset:
+    """Values accepted by an equality (one value) or IN-list (a sequence) filter."""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(value)
+    return frozenset((value,))
+
+
+def cube_group(group_by: GroupBy) -> Callable[[Tuple], Any]:
+    """Map a cube cell key to its group key for a grouping on cube dimensions."""
+    if group_by is None:
+        return lambda key: None
+    if isinstance(group_by, tuple):
+        positions = tuple(CUBE_DIMENSIONS.index(field) for field in group_by)
+        return lambda key: tuple(key[i] for i in positions)
+    position = CUBE_DIMENSIONS.index(group_by)
+    return lambda key: key[position]
+
+
+def agent_key(interaction: Dict[str, Any]) -> Tuple:
+    """Agent cube cell key (without day) of an interaction."""
+    return tuple(interaction[dim] for dim in AGENT_DIMENSIONS)
+
+
+def day_key(interaction: Dict[str, Any]) -> str:
+    """Calendar day (YYYY-MM-DD) of an interaction."""
+    return interaction["timestamp"][:10]
+
+
+def cube_key(interaction: Dict[str, Any]) -> Tuple:
+    """Cube cell key (without day) of an interaction."""
+    return tuple(interaction[dim] for dim in CUBE_DIMENSIONS)
+
+
+class StoreSnapshot:
+    """
+    Immutable, consistent view of the store at one version.
+    Nothing reachable from a published snapshot is ever mutated, except the lazily
+    filled prefix-sum cache, which is guarded by its own lock.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        segments: Tuple[Tuple[Dict[str, Any], ...], ...],
+        row_count: int,
+        positions: Dict[str, int],
+        filter_indexes: Dict[str, Dict[Any, int]],
+        cube: Dict[str, Dict[Tuple, Dict[str, float]]],
+        agent_stats: Dict[str, Dict[str, float]],
+        agent_cube: Dict[str, Dict[Tuple, Dict[str, float]]],
+        root_cause_agents: Dict[str, Dict[str, int]],
+        totals: Dict[str, float],
+        partitions: Dict[str, Dict[str, Any]],
+        partition_days: Tuple[str, ...],
+        live: int,
+        slices: Dict[Tuple, Dict[str, Dict[str, float]]],
+        series: Dict[Tuple, Tuple[Tuple[str, ...], List[Tuple[float, ...]]]],
+        calendar_columns: Dict[str, Tuple[array, ...]],
+        samples: Tuple[int, ...]
+    ):
+        self.version = version
+        self.segments = segments
+        self.row_count = row_count
+        # Shared, append-only id -> position map; ids at positions >= row_count
+        # belong to later versions
+        self._positions = positions
+        # field -> value (bin number for range fields) -> row bitmap
+        self.filter_indexes = filter_indexes
+        # day -> cube key -> counters
+        self.cube = cube
+        # agent_id -> counters
+        self.agent_stats = agent_stats
+        # day -> (region, team_leader, agent_id) -> counters
+        self.agent_cube = agent_cube
+        # root_cause_label -> agent_id -> complaint count
+        self.root_cause_agents = root_cause_agents
+        self.totals = totals
+        # day -> {"base", "rows" (bitmap relative to base), "count", "min_ts", "max_ts"}
+        self.partitions = partitions
+        # Partition days in ascending order
+        self.partition_days = partition_days
+        # Bitmap of positions holding a row (not dropped by retention)
+        self.live = live
+        # cube key -> day -> counters (the same cell objects as the cube)
+        self.slices = slices
+        # cube key -> (days, cumulative counters per day); filled lazily, and
+        # carried over between versions for slices a write did not touch. The
+        # only state a published snapshot changes, so it is guarded by a lock
+        self._series = series
+        self._series_lock = threading.Lock()
+        # calendar column -> per-segment integer arrays, aligned with segments
+        self.calendar_columns = calendar_columns
+        # Row bitmap per sample level (index 0 is level 1); dropped rows stay set, so mask with live
+        self.samples = samples
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __contains__(self, interaction_id: str) -> bool:
+        return self._position(interaction_id) is not None
+
+    def _position(self, interaction_id: str) -> Optional[int]:
+        pos = self._positions.get(interaction_id)
+        if pos is None or pos >= self.row_count or self.row(pos) is None:
+            return None
+        return pos
+
+    def get(self, interaction_id: str) -> Optional[Dict[str, Any]]:
+        pos = self._position(interaction_id)
+        return self.row(pos) if pos is not None else None
+
+    def row(self, pos: int) -> Dict[str, Any]:
+        return self.segments[pos // SEGMENT_SIZE][pos % SEGMENT_SIZE]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Every row in storage order."""
+        return [row for segment in self.segments for row in segment if row is not None]
+
+    def all_rows(self) -> int:
+        """Bitmap with every live row position set."""
+        return self.live
+
+    def sample_rows(self, level: int) -> int:
+        """Bitmap of the live rows in a sample level (about 1 in 4^level rows)."""
+        return self.samples[level - 1] & self.live
+
+    def select(self, equals: Dict[str, Any]) -> int:
+        """
+        Intersect the value bitmaps for field == value filters, where a sequence of
+        values is an IN-list answered by the union of its bitmaps (None values are ignored).
+        """
+        bitmap = self.all_rows()
+        for field, value in equals.items():
+            if value is None:
+                continue
+            bitmap &= self.value_rows(field, value)
+            if not bitmap:
+                break
+        return bitmap
+
+    def value_rows(self, field: str, value: Any) -> int:
+        """Bitmap of rows whose field equals value, or any of a sequence of values."""
+        index = self.filter_indexes[field]
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            return index.get(value, 0)
+        bitmap = 0
+        for v in value:
+            bitmap |= index.get(v, 0)
+        return bitmap
+
+    def prune_bins(
+        self,
+        field: str,
+        low: Optional[float],
+        high: Optional[float]
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Non-empty bins of a range field overlapping [low, high], split into bins
+        lying entirely inside the range and boundary bins whose rows still need a
+        per-row value check. Either bound may be None (open).
+        """
+        edges = RANGE_BIN_EDGES[field]
+        closing = 1 if field in INTEGER_RANGE_FIELDS else 0
+        first = range_bin(field, low) if low is not None else -1
+        last = range_bin(field, high) if high is not None else len(edges) - 1
+
+        covered = []
+        boundary = []
+        index = self.filter_indexes[field]
+        for n in range(first, last + 1):
+            if n not in index:
+                continue
+            # Bin n holds values in [edges[n], edges[n + 1]), open-ended at either end
+            inside_low = low is None or (n >= 0 and edges[n] >= low)
+            inside_high = high is None or (n + 1 < len(edges) and edges[n + 1] - closing <= high)
+            (covered if inside_low and inside_high else boundary).append(n)
+        return covered, boundary
+
+    def bin_rows(self, field: str, bins: Iterable[int]) -> int:
+        """Bitmap of every row in the given bins of a range field."""
+        return self.value_rows(field, tuple(bins))
+
+    def prune_partitions(
+        self,
+        from_dt: Optional[datetime],
+        to_dt: Optional[datetime]
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Day partitions overlapping [from_dt, to_dt], split into days whose min/max
+        timestamps lie entirely inside the range and boundary days whose rows still
+        need a per-row timestamp check. Other days are skipped without being read.
+        """
+        days = self.partition_days
+        lo = bisect.bisect_left(days, from_dt.date().isoformat()) if from_dt else 0
+        hi = bisect.bisect_right(days, to_dt.date().isoformat()) if to_dt else len(days)
+
+        covered = []
+        boundary = []
+        for day in days[lo:hi]:
+            partition = self.partitions[day]
+            if (from_dt and partition["max_ts"] < from_dt) or (to_dt and partition["min_ts"] > to_dt):
+                continue
+            if (from_dt and partition["min_ts"] < from_dt) or (to_dt and partition["max_ts"] > to_dt):
+                boundary.append(day)
+            else:
+                covered.append(day)
+        return covered, boundary
+
+    def slice_series(self, key: Tuple) -> Tuple[Tuple[str, ...], List[Tuple[float, ...]]]:
+        """Sorted days of a cube slice and the running totals of its counters through each day."""
+        series = self._series.get(key)
+        if series is None:
+            cells = self.slices.get(key, {})
+            days = tuple(sorted(cells))
+            running = [0] * len(COUNTER_FIELDS)
+            prefix = []
+            for day in days:
+                cell = cells[day]
+                running = [total + cell[field] for total, field in zip(running, COUNTER_FIELDS)]
+                prefix.append(tuple(running))
+            with self._series_lock:
+                series = self._series.setdefault(key, (days, prefix))
+        return series
+
+    def carried_series(self, touched: Iterable[Tuple]) -> Dict[Tuple, Tuple[Tuple[str, ...], List[Tuple[float, ...]]]]:
+        """Copy of the series cache without the slices in touched, for the next version."""
+        with self._series_lock:
+            return {key: series for key, series in self._series.items() if key not in touched}
+
+    def range_totals(
+        self,
+        equals: Dict[str, Any],
+        first_day: Optional[str] = None,
+        last_day: Optional[str] = None,
+        group_by: GroupBy = None,
+        sketches: bool = False
+    ) -> Dict[Any, Dict[str, float]]:
+        """
+        Sum counters over days first_day..last_day (inclusive, open-ended when None)
+        for cube slices matching field == value (or IN-list) filters, grouped by cube dimensions.
+        Each slice costs two prefix-sum lookups, whatever the length of the range.
+        Sketches are left empty unless requested, since they merge day by day.
+        """
+        checks = [(CUBE_DIMENSIONS.index(f), _value_set(v)) for f, v in equals.items() if v is not None]
+        group_of = cube_group(group_by)
+
+        grouped = defaultdict(new_counters)
+        for key in self.slices:
+            if not all(key[i] in values for i, values in checks):
+                continue
+            days, prefix = self.slice_series(key)
+            hi = bisect.bisect_right(days, last_day) if last_day else len(days)
+            lo = bisect.bisect_left(days, first_day) if first_day else 0
+            if hi <= lo:
+                continue
+            upper = prefix[hi - 1]
+            lower = prefix[lo - 1] if lo else None
+            counters = grouped[group_of(key)]
+            for n, field in enumerate(COUNTER_FIELDS):
+                counters[field] += upper[n] - lower[n] if lower else upper[n]
+            if sketches:
+                cells = self.slices[key]
+                for day in days[lo:hi]:
+                    for sketch in SKETCH_FIELDS:
+                        merge_sketch(counters[sketch], cells[day][sketch])
+        return grouped
+
+    def partition_rows(self, days: Iterable[str]) -> int:
+        """Bitmap of every row in the given day partitions."""
+        bitmap = 0
+        for day in days:
+            partition = self.partitions[day]
+            bitmap |= partition["rows"] << partition["base"]
+        return bitmap
+
+    def iter_rows(self, bitmap: int) -> Iterator[Dict[str, Any]]:
+        """Yield the rows of a bitmap in storage order."""
+        segments = self.segments
+        for seg_no, offsets in iter_segment_offsets(bitmap):
+            segment = segments[seg_no]
+            if isinstance(segment, tuple):
+                for offset in offsets:
+                    yield segment[offset]
+            else:
+                yield from segment.take(offsets)
+
+    def iter_rows_or_tables(self, bitmap: int, columns: List[str]) -> Iterator[Any]:
+        """
+        Like iter_rows, except that the rows of each cold segment come as one Arrow table
+        of columns (see ColdSegment.take_table), for exports that need not decode them.
+        """
+        segments = self.segments
+        for seg_no, offsets in iter_segment_offsets(bitmap):
+            segment = segments[seg_no]
+            if isinstance(segment, tuple):
+                for offset in offsets:
+                    yield segment[offset]
+            else:
+                yield segment.take_table(offsets, columns)
+
+    def iter_rows_with_calendar(
+        self,
+        bitmap: int,
+        columns: Iterable[str]
+    ) -> Iterator[Tuple[Dict[str, Any], Tuple[int, ...]]]:
+        """Yield (row, calendar ids for columns) for the rows of a bitmap in storage order."""
+        arrays = [self.calendar_columns[column] for column in columns]
+        for seg_no, offsets in iter_segment_offsets(bitmap):
+            segment = self.segments[seg_no]
+            rows = segment if isinstance(segment, tuple) else dict(zip(offsets, segment.take(offsets)))
+            ids = [column[seg_no] for column in arrays]
+            for offset in offsets:
+                yield rows[offset], tuple(column[offset] for column in ids)
+
+    def aggregate_cube(
+        self,
+        equals: Dict[str, Any],
+        group_by: GroupBy = None,
+        days: Optional[Iterable[str]] = None,
+        sketches: bool = False
+    ) -> Dict[Any, Dict[str, float]]:
+        """
+        Sum cube cells matching field == value (or IN-list) filters on cube dimensions,
+        grouped by cube dimensions (or a single None group). Cells of explicit days
+        are merged one by one, sketches included.
+        """
+        if days is None:
+            return self.range_totals(equals, group_by=group_by, sketches=sketches)
+
+        checks = [(CUBE_DIMENSIONS.index(f), _value_set(v)) for f, v in equals.items() if v is not None]
+        group_of = cube_group(group_by)
+
+        grouped = defaultdict(new_counters)
+        for day in days:
+            for key, counters in self.cube.get(day, {}).items():
+                if all(key[i] in values for i, values in checks):
+                    merge_counters(grouped[group_of(key)], counters)
+        return grouped
+
+
+class _SnapshotBuilder:
+    """
+    Mutable working copy of a snapshot for one write.
+    Every container is copied the first time the batch touches it, so the base
+    snapshot and everything it shares stay untouched.
+    """
+
+    def __init__(self, base: StoreSnapshot):
+        self.base = base
+        self.segments = list(base.segments)
+        self.row_count = base.row_count
+        self.filter_indexes = dict(base.filter_indexes)
+        self.cube = dict(base.cube)
+        self.agent_stats = dict(base.agent_stats)
+        self.agent_cube = dict(base.agent_cube)
+        self.root_cause_agents = dict(base.root_cause_agents)
+        self.totals = copy_counters(base.totals)
+        self.partitions = dict(base.partitions)
+        self.live = base.live
+        self.samples = list(base.samples)
+        self.slices = dict(base.slices)
+        self._touched_slices = set()
+        self.calendar_columns = {name: list(arrays) for name, arrays in base.calendar_columns.items()}
+        self._copied = set()
+        self._copied_segments = set()
+        self._copied_calendar = set()
+
+    def _copy_once(self, tag: Any, container: Dict, key: Any, factory, copy=None) -> Any:
+        """
+        Return container[key], replaced by a private copy (made with copy, by default
+        a shallow one) on first access, or created with factory when missing.
+        """
+        current = container.get(key)
+        if (tag, key) not in self._copied:
+            self._copied.add((tag, key))
+            current = factory() if current is None else (copy or type(current))(current)
+            container[key] = current
+        elif current is None:
+            current = container[key] = factory()
+        return current
+
+    def _segment(self, seg_no: int) -> List[Dict[str, Any]]:
+        """Return a private, mutable copy of a row segment."""
+        if seg_no not in self._copied_segments:
+            self._copied_segments.add(seg_no)
+            if seg_no == len(self.segments):
+                self.segments.append([])
+            else:
+                self.segments[seg_no] = list(self.segments[seg_no])
+        return self.segments[seg_no]
+
+    def _calendar_segment(self, seg_no: int) -> Dict[str, array]:
+        """Private, mutable copies of one segment's calendar arrays."""
+        if seg_no not in self._copied_calendar:
+            self._copied_calendar.add(seg_no)
+            for name, typecode in CALENDAR_COLUMNS.items():
+                arrays = self.calendar_columns[name]
+                if seg_no == len(arrays):
+                    arrays.append(array(typecode))
+                else:
+                    arrays[seg_no] = array(typecode, arrays[seg_no])
+        return {name: arrays[seg_no] for name, arrays in self.calendar_columns.items()}
+
+    def append_rows(self, interactions: List[Dict[str, Any]]) -> int:
+        """Place rows after the last position. Returns the first new position."""
+        base = self.row_count
+        current_seg = None
+        for offset, interaction in enumerate(interactions):
+            seg_no = (base + offset) // SEGMENT_SIZE
+            if seg_no != current_seg:
+                current_seg = seg_no
+                segment = self._segment(seg_no)
+                calendar = list(self._calendar_segment(seg_no).values())
+            segment.append(interaction)
+            for column, value in zip(calendar, time_buckets(interaction["timestamp"])):
+                column.append(value)
+        self.row_count += len(interactions)
+        self.live |= ((1 << len(interactions)) - 1) << base
+        self.sample_rows(interactions, base)
+        self.index_rows(interactions, base)
+        self.update_partitions({base + offset: row for offset, row in enumerate(interactions)})
+        self.aggregate_rows(interactions)
+        return base
+
+    def append_segment(self, segment: Any) -> Dict[int, Dict[str, Any]]:
+        """
+        Place a stored segment (a row tuple or a cold segment, e.g. from a checkpoint)
+        after the last position as it is, without copying its rows; None slots stay
+        dropped. Only the last segment may be partly filled, so the segments before
+        it must be full. Returns the rows placed, by position.
+        """
+        base = self.row_count
+        if base % SEGMENT_SIZE:
+            raise ValueError("A stored segment must follow full segments")
+        slots = list(segment)
+        offsets = [offset for offset, row in enumerate(slots) if row is not None]
+        interactions = [slots[offset] for offset in offsets]
+
+        self.segments.append(segment)
+        buckets = [time_buckets(row["timestamp"]) if row is not None else None for row in slots]
+        for column, (name, typecode) in enumerate(CALENDAR_COLUMNS.items()):
+            self.calendar_columns[name].append(array(typecode, (ids[column] if ids else 0 for ids in buckets)))
+        self.row_count += len(slots)
+        self.live |= bitmap_from_positions(offsets) << base
+        self.sample_rows(interactions, base, offsets)
+        self.index_rows(interactions, base, offsets)
+        rows = {base + offset: row for offset, row in zip(offsets, interactions)}
+        self.update_partitions(rows)
+        self.aggregate_rows(interactions)
+        return rows
+
+    def replace_rows(self, changed: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        """Swap rows in place, moving index bits and counters from old to new values."""
+        for pos, (old, new) in changed.items():
+            self._segment(pos // SEGMENT_SIZE)[pos % SEGMENT_SIZE] = new
+
+        for field in INDEX_FIELDS:
+            cleared = defaultdict(list)
+            added = defaultdict(list)
+            for pos, (old, new) in changed.items():
+                old_key, new_key = index_key(old, field), index_key(new, field)
+                if old_key != new_key:
+                    cleared[old_key].append(pos)
+                    added[new_key].append(pos)
+            if not cleared:
+                continue
+
+            index = self._copy_once("index", self.filter_indexes, field, dict)
+            for value, positions in cleared.items():
+                remaining = index.get(value, 0) & ~bitmap_from_positions(positions)
+                if remaining:
+                    index[value] = remaining
+                else:
+                    index.pop(value, None)
+            for value, positions in added.items():
+                index[value] = index.get(value, 0) | bitmap_from_positions(positions)
+
+        moved = {pos: pair for pos, pair in changed.items() if pair[0]["timestamp"] != pair[1]["timestamp"]}
+        for pos, (_, new) in moved.items():
+            seg_no, offset = divmod(pos, SEGMENT_SIZE)
+            calendar = self._calendar_segment(seg_no)
+            for name, value in zip(CALENDAR_COLUMNS, time_buckets(new["timestamp"])):
+                calendar[name][offset] = value
+        if moved:
+            self.update_partitions({pos: old for pos, (old, _) in moved.items()}, sign=-1)
+            self.update_partitions({pos: new for pos, (_, new) in moved.items()})
+
+        self.aggregate_rows([old for old, _ in changed.values()], sign=-1)
+        self.aggregate_rows([new for _, new in changed.values()])
+
+    def drop_rows(self, dropped: Dict[int, Dict[str, Any]]) -> None:
+        """Remove rows for good: retract them everywhere and leave None in their slots."""
+        by_segment = defaultdict(list)
+        for pos in dropped:
+            by_segment[pos // SEGMENT_SIZE].append(pos % SEGMENT_SIZE)
+        for seg_no, offsets in by_segment.items():
+            segment = self.segments[seg_no]
+            if isinstance(segment, (list, tuple)):
+                segment = self._segment(seg_no)
+                for offset in offsets:
+                    segment[offset] = None
+            else:
+                # Cold segments stay on disk and just mask the dropped slots, until
+                # every slot is dropped and the file can go
+                segment = segment.without(offsets)
+                self.segments[seg_no] = segment if len(segment.dropped) < len(segment) else (None,) * len(segment)
+
+        for field in INDEX_FIELDS:
+            cleared = defaultdict(list)
+            for pos, interaction in dropped.items():
+                cleared[index_key(interaction, field)].append(pos)
+
+            index = self._copy_once("index", self.filter_indexes, field, dict)
+            for value, positions in cleared.items():
+                remaining = index.get(value, 0) & ~bitmap_from_positions(positions)
+                if remaining:
+                    index[value] = remaining
+                else:
+                    index.pop(value, None)
+
+        self.live &= ~bitmap_from_positions(dropped)
+        self.update_partitions(dropped, sign=-1)
+        self.aggregate_rows(list(dropped.values()), sign=-1)
+
+    def swap_segment(self, seg_no: int, segment: Any) -> None:
+        """Replace a segment with an equivalent representation (same rows)."""
+        self.segments[seg_no] = segment
+        self._copied_segments.discard(seg_no)
+
+    def sample_rows(self, interactions: List[Dict[str, Any]], base: int, offsets: Optional[List[int]] = None) -> None:
+        """Set new rows in their sample levels; offsets from base default to consecutive ones."""
+        sampled = defaultdict(list)
+        for offset, interaction in zip(offsets or range(len(interactions)), interactions):
+            for level in range(sample_level(interaction["interaction_id"])):
+                sampled[level].append(offset)
+        for level, level_offsets in sampled.items():
+            self.samples[level] |= bitmap_from_positions(level_offsets) << base
+
+    def index_rows(self, interactions: List[Dict[str, Any]], base: int, offsets: Optional[List[int]] = None) -> None:
+        """
+        OR each value's batch bitmap (built at offset 0, then shifted once) into the
+        index; offsets from base default to consecutive ones.
+        """
+        for field in INDEX_FIELDS:
+            positions = defaultdict(list)
+            for offset, interaction in zip(offsets or range(len(interactions)), interactions):
+                positions[index_key(interaction, field)].append(offset)
+
+            index = self._copy_once("index", self.filter_indexes, field, dict)
+            for value, value_offsets in positions.items():
+                index[value] = index.get(value, 0) | (bitmap_from_positions(value_offsets) << base)
+
+    def update_partitions(self, rows: Dict[int, Dict[str, Any]], sign: int = 1) -> None:
+        """
+        Add (sign=1) or remove (sign=-1) row positions in their day partitions.
+        Partition entries are replaced, never mutated. Min/max timestamps only
+        widen, which keeps them valid bounds after a removal.
+        """
+        by_day = defaultdict(list)
+        for pos, interaction in rows.items():
+            by_day[day_key(interaction)].append(pos)
+
+        for day, positions in by_day.items():
+            partition = self.partitions.get(day)
+            if sign < 0:
+                remaining = partition["rows"] & ~bitmap_from_positions(p - partition["base"] for p in positions)
+                count = partition["count"] - len(positions)
+                if count:
+                    self.partitions[day] = {**partition, "rows": remaining, "count": count}
+                else:
+                    del self.partitions[day]
+                continue
+
+            timestamps = [datetime.fromisoformat(rows[p]["timestamp"]) for p in positions]
+            base = min(positions)
+            if partition is None:
+                partition = {"base": base, "rows": 0, "count": 0, "min_ts": min(timestamps), "max_ts": max(timestamps)}
+            base = min(base, partition["base"])
+            self.partitions[day] = {
+                "base": base,
+                "rows": (partition["rows"] << (partition["base"] - base))
+                        | bitmap_from_positions(p - base for p in positions),
+                "count": partition["count"] + len(positions),
+                "min_ts": min(partition["min_ts"], *timestamps),
+                "max_ts": max(partition["max_ts"], *timestamps),
+            }
+
+    def aggregate_rows(self, interactions: List[Dict[str, Any]], sign: int = 1) -> None:
+        """
+        Add (sign=1) or retract (sign=-1) rows in the cube, per-agent stats,
+        agent cube, concentration table and totals. Entries that reach zero are dropped.
+        """
+        for interaction in interactions:
+            day = day_key(interaction)
+            day_cells = self._copy_once("day", self.cube, day, dict)
+            key = cube_key(interaction)
+            cell = self._copy_once(("cell", day), day_cells, key, new_counters, copy_counters)
+            add_interaction(cell, interaction, sign)
+            slice_cells = self._copy_once("slice", self.slices, key, dict)
+            slice_cells[day] = cell
+            self._touched_slices.add(key)
+            if not cell["count"]:
+                del day_cells[key]
+                if not day_cells:
+                    del self.cube[day]
+                del slice_cells[day]
+                if not slice_cells:
+                    del self.slices[key]
+
+            agent_id = interaction["agent_id"]
+            stats = self._copy_once("agent", self.agent_stats, agent_id, new_counters, copy_counters)
+            add_interaction(stats, interaction, sign)
+            if not stats["count"]:
+                del self.agent_stats[agent_id]
+
+            agent_cells = self._copy_once("agent_day", self.agent_cube, day, dict)
+            key = agent_key(interaction)
+            cell = self._copy_once(("agent_cell", day), agent_cells, key, new_counters, copy_counters)
+            add_interaction(cell, interaction, sign)
+            if not cell["count"]:
+                del agent_cells[key]
+                if not agent_cells:
+                    del self.agent_cube[day]
+
+            if interaction["is_complaint"]:
+                label = interaction["root_cause_label"]
+                agents = self._copy_once("root_cause", self.root_cause_agents, label, dict)
+                agents[agent_id] = agents.get(agent_id, 0) + sign
+                if not agents[agent_id]:
+                    del agents[agent_id]
+                    if not agents:
+                        del self.root_cause_agents[label]
+
+            add_interaction(self.totals, interaction, sign)
+
+    def build(self, new_version: bool = True) -> StoreSnapshot:
+        """Freeze the working copy. new_version=False is for changes that leave the data as is."""
+        return StoreSnapshot(
+            version=self.base.version + 1 if new_version else self.base.version,
+            segments=tuple(tuple(s) if isinstance(s, list) else s for s in self.segments),
+            row_count=self.row_count,
+            positions=self.base._positions,
+            filter_indexes=self.filter_indexes,
+            cube=self.cube,
+            agent_stats=self.agent_stats,
+            agent_cube=self.agent_cube,
+            root_cause_agents=self.root_cause_agents,
+            totals=self.totals,
+            partitions=self.partitions,
+            partition_days=(
+                self.base.partition_days if self.partitions.keys() == self.base.partitions.keys()
+                else tuple(sorted(self.partitions))
+            ),
+            live=self.live,
+            slices=self.slices,
+            series=self.base.carried_series(self._touched_slices),
+            calendar_columns={name: tuple(arrays) for name, arrays in self.calendar_columns.items()},
+            samples=tuple(self.samples)
+        )
+
+
+class DuplicateInteractionError(ValueError):
+    """Appended interaction_ids that are already stored or repeated within their batch."""
+
+    def __init__(self, interaction_ids: List[str]):
+        self.interaction_ids = interaction_ids
+        super().__init__(f"Duplicate interaction_id: {', '.join(interaction_ids[:10])}")
+
+
+class InteractionStore:
+    """
+    Versioned interaction store.
+
+    Readers call snapshot() once per request and work on that version only; they
+    never lock. Writers are serialized by a lock, build the next version from the
+    current one, and publish it by swapping a single reference. With a write-ahead
+    log attached, each write is logged in apply order and append/upsert return
+    only once it is durable.
+    """
+
+    def __init__(self, interactions: Iterable[Dict[str, Any]] = (), segments: Iterable[Any] = ()):
+        """
+        Start from stored row segments (e.g. a checkpoint's), kept as they are so
+        cold segments stay on disk, then append interactions after them.
+        """
+        # interaction_id -> row position; shared by every version, only ever extended
+        self.positions: Dict[str, int] = {}
+        self._current = StoreSnapshot(
+            version=0,
+            segments=(),
+            row_count=0,
+            positions=self.positions,
+            filter_indexes={field: {} for field in INDEX_FIELDS},
+            cube={},
+            agent_stats={},
+            agent_cube={},
+            root_cause_agents={},
+            totals=new_counters(),
+            partitions={},
+            partition_days=(),
+            live=0,
+            slices={},
+            series={},
+            calendar_columns={name: () for name in CALENDAR_COLUMNS},
+            samples=(0,) * SAMPLE_LEVELS
+        )
+        self._write_lock = threading.Lock()
+        self.wal = None
+        # Called with (version, op, payload) for every logged write, like the WAL
+        self.write_listeners: List[Callable[[int, str, Any], None]] = []
+
+        if segments:
+            builder = _SnapshotBuilder(self._current)
+            for segment in segments:
+                for pos, interaction in builder.append_segment(segment).items():
+                    self.positions[interaction["interaction_id"]] = pos
+            self._current = builder.build()
+        self.append(list(interactions))
+
+    def attach_wal(self, wal: Any) -> None:
+        """Log every subsequent write to wal (a persistence.WriteAheadLog)."""
+        with self._write_lock:
+            self.wal = wal
+
+    def add_write_listener(self, listener: Callable[[int, str, Any], None]) -> None:
+        """
+        Call listener(version, op, payload) for every subsequent write, in apply order
+        and under the write lock, with the op and payload the WAL logs and the version
+        the write publishes.
+        """
+        with self._write_lock:
+            self.write_listeners.append(listener)
+
+    def checkpoint_view(self) -> Tuple[StoreSnapshot, int]:
+        """
+        Current version plus the first WAL segment it does not include,
+        with the log rotated so the two line up exactly.
+        """
+        with self._write_lock:
+            segment = self.wal.rotate() if self.wal else 0
+            return self._current, segment
+
+    def snapshot(self) -> StoreSnapshot:
+        """The latest published version."""
+        return self._current
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    def __len__(self) -> int:
+        return len(self._current)
+
+    def __contains__(self, interaction_id: str) -> bool:
+        return interaction_id in self._current
+
+    def get(self, interaction_id: str) -> Optional[Dict[str, Any]]:
+        return self._current.get(interaction_id)
+
+    def append(self, interactions: List[Dict[str, Any]]) -> int:
+        """
+        Append prepared interactions with new ids and publish a new version.
+        The batch is all-or-nothing: an id already stored, or repeated within the
+        batch, raises DuplicateInteractionError and nothing is appended.
+        Returns the number of rows appended.
+        """
+        if not interactions:
+            return 0
+
+        with self._write_lock:
+            current = self._current
+            seen = set()
+            duplicates = []
+            for interaction in interactions:
+                interaction_id = interaction["interaction_id"]
+                if interaction_id in seen or interaction_id in current:
+                    duplicates.append(interaction_id)
+                seen.add(interaction_id)
+            if duplicates:
+                raise DuplicateInteractionError(duplicates)
+
+            builder = _SnapshotBuilder(current)
+            base = builder.append_rows(interactions)
+            snapshot = builder.build()
+            ticket = self._log(snapshot.version, "append", interactions)
+            self._publish(snapshot, interactions, base)
+
+        self._sync(ticket)
+        return len(interactions)
+
+    def upsert(self, interactions: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Insert new interaction_ids and replace existing ones in place, as one version.
+        A replaced row's old contribution is retracted from every index and
+        aggregate before the new version is applied. Re-applying the same
+        records is a no-op, and within a batch the last record for an id wins.
+        Returns inserted/updated/unchanged counts.
+        """
+        inserts: Dict[str, Dict[str, Any]] = {}
+        # position -> (row before this batch, final row)
+        updates: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        ticket = None
+
+        with self._write_lock:
+            current = self._current
+            for interaction in interactions:
+                interaction_id = interaction["interaction_id"]
+                pos = current._position(interaction_id)
+                if pos is None:
+                    inserts[interaction_id] = interaction
+                else:
+                    original = updates[pos][0] if pos in updates else current.row(pos)
+                    updates[pos] = (original, interaction)
+
+            changed = {pos: pair for pos, pair in updates.items() if pair[0] != pair[1]}
+            new_rows = list(inserts.values())
+            if changed or new_rows:
+                builder = _SnapshotBuilder(current)
+                if changed:
+                    builder.replace_rows(changed)
+                base = builder.append_rows(new_rows)
+                snapshot = builder.build()
+                # Only effective changes are logged, as full rows, so replay is idempotent
+                ticket = self._log(snapshot.version, "upsert", [new for _, new in changed.values()] + new_rows)
+                self._publish(snapshot, new_rows, base)
+
+        self._sync(ticket)
+        return {
+            "inserted": len(inserts),
+            "updated": len(changed),
+            "unchanged": len(updates) - len(changed),
+        }
+
+    def drop_before(self, cutoff_day: str) -> int:
+        """
+        Retention: drop every row dated before cutoff_day (YYYY-MM-DD) from the
+        rows, indexes and aggregates, as one new version, logged so that replaying
+        the WAL does not bring the rows back. Returns rows dropped.
+        """
+        with self._write_lock:
+            current = self._current
+            days = current.partition_days[:bisect.bisect_left(current.partition_days, cutoff_day)]
+            if not days:
+                return 0
+
+            rows = current.partition_rows(days)
+            dropped = dict(zip(iter_bits(rows), current.iter_rows(rows)))
+            builder = _SnapshotBuilder(current)
+            builder.drop_rows(dropped)
+            snapshot = builder.build()
+            ticket = self._log(snapshot.version, "drop_before", cutoff_day)
+            self._current = snapshot
+
+        self._sync(ticket)
+        return len(dropped)
+
+    def swap_segments(self, replacements: Dict[int, Tuple[Any, Any]]) -> int:
+        """
+        Replace segments with equivalent representations (e.g. hot -> cold), given
+        seg_no -> (expected current segment, replacement). A segment a writer has
+        changed since the replacement was prepared is left alone. The data version
+        does not change. Returns the number of segments swapped.
+        """
+        with self._write_lock:
+            builder = _SnapshotBuilder(self._current)
+            swapped = 0
+            for seg_no, (expected, segment) in replacements.items():
+                if builder.segments[seg_no] is expected:
+                    builder.swap_segment(seg_no, segment)
+                    swapped += 1
+            if swapped:
+                self._current = builder.build(new_version=False)
+            return swapped
+
+    def _log(self, version: int, op: str, payload: Any) -> Optional[int]:
+        """
+        Frame a write into the WAL and pass it to the write listeners, once its version
+        is built (so a failed build is never logged) and before it is published.
+        Caller holds the write lock.
+        """
+        for listener in self.write_listeners:
+            listener(version, op, payload)
+        return self.wal.write(op, payload) if self.wal else None
+
+    def _sync(self, ticket: Optional[int]) -> None:
+        """Wait for a logged write to be durable, outside the write lock so writers group-commit."""
+        if ticket is not None:
+            self.wal.sync(ticket)
+
+    def _publish(self, snapshot: StoreSnapshot, appended: List[Dict[str, Any]], base: int) -> None:
+        """Register appended ids, then make the new version visible. Caller holds the write lock."""
+        for offset, interaction in enumerate(appended):
+            self.positions[interaction["interaction_id"]] = base + offset
+        self._current = snapshot
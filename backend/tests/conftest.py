@@ -0,0 +1,61 @@
+"""
+Shared fixtures. Backend modules import each other by bare name, so the backend
+directory goes on sys.path; the generated demo dataset is the test data.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_generator  # noqa: E402
+from data_generator import get_snapshot  # noqa: E402
+from store import InteractionStore  # noqa: E402
+
+
+def _counters(counters):
+    """Counters with float sums rounded: retracting a value can leave float noise behind."""
+    return {field: round(value, 6) if isinstance(value, float) else value for field, value in counters.items()}
+
+
+def _nonzero(grouped):
+    """Aggregate cells with rows; retraction may leave emptied cells behind."""
+    return {key: _counters(counters) for key, counters in grouped.items() if counters["count"]}
+
+
+def snapshot_state(snapshot):
+    """Everything a snapshot derives from its rows, for comparing two ways of building it."""
+    return {
+        "rows": snapshot.rows(),
+        "totals": _counters(snapshot.totals),
+        "filter_indexes": {
+            field: {value: bitmap for value, bitmap in index.items() if bitmap}
+            for field, index in snapshot.filter_indexes.items()
+        },
+        "cube": {day: _nonzero(cells) for day, cells in snapshot.cube.items() if _nonzero(cells)},
+        "agent_stats": _nonzero(snapshot.agent_stats),
+        "agent_cube": {day: _nonzero(cells) for day, cells in snapshot.agent_cube.items() if _nonzero(cells)},
+        "root_cause_agents": {
+            label: {agent: n for agent, n in agents.items() if n}
+            for label, agents in snapshot.root_cause_agents.items() if any(agents.values())
+        },
+        "live": snapshot.live,
+        "samples": tuple(bitmap & snapshot.live for bitmap in snapshot.samples),
+        "days": tuple(day for day in snapshot.partition_days if snapshot.partitions[day]["count"]),
+    }
+
+
+@pytest.fixture(scope="session")
+def base_rows():
+    """The generated interactions in storage order (shared; copy before changing one)."""
+    return get_snapshot().rows()
+
+
+@pytest.fixture()
+def isolated_store(monkeypatch, base_rows):
+    """A private copy of the demo store behind the API, for tests that write to it."""
+    store = InteractionStore(base_rows)
+    monkeypatch.setattr(data_generator, "STORE", store)
+    monkeypatch.setattr(data_generator, "INTERACTION_INDEX", store.positions)
+    return store
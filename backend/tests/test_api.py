@@ -0,0 +1,394 @@
+"""
+API behaviour that spans the store and the request layer.
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from admission import AdmissionGate
+from data_generator import get_store
+from offload import register
+from query_planner import compile_filters
+from single_flight import SingleFlight, freeze
+from store import split_bitmap, bitmap_from_positions
+
+
+def _worker_row(interaction_id):
+    """A row as a worker's copy of the store has it."""
+    return get_store().get(interaction_id)
+
+
+def _worker_sleep(seconds):
+    time.sleep(seconds)
+
+
+# Registered before any pool is forked, like the endpoints
+register("worker_row", _worker_row)
+register("worker_sleep", _worker_sleep)
+
+
+@pytest.fixture()
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture()
+def parallel_pool(monkeypatch):
+    """Two analytics workers, forked for the test, splitting every scan however small."""
+    monkeypatch.setattr(main, "PARALLEL_SCAN_MIN_ROWS", 0)
+    monkeypatch.setattr(main.ANALYTICS_POOL, "workers", 2)
+    main.ANALYTICS_POOL.start()
+    yield main.ANALYTICS_POOL
+    main.ANALYTICS_POOL.shutdown()
+
+
+def test_selection_is_gone_after_new_version(client, isolated_store, base_rows):
+    token = client.post("/api/selections", json={"complaints_only": True}).json()["selection"]
+    assert client.get("/api/metrics", params={"selection": token}).status_code == 200
+
+    response = client.post("/api/interactions/ingest", json={"interactions": [{**base_rows[0], "interaction_id": "SELECTION-410"}]})
+    assert response.status_code == 200
+
+    assert client.get("/api/metrics", params={"selection": token}).status_code == 410
+    assert client.get(f"/api/selections/{token}").status_code == 410
+    assert client.post("/api/ai/summary", json={"selection": token}).status_code == 410
+    assert "SELECTION-410" in isolated_store
+
+
+def test_selection_is_narrowed_by_filters_given_with_it(client):
+    lob = client.get("/api/options").json()["lines_of_business"][0]
+    token = client.post("/api/selections", json={"complaints_only": True}).json()["selection"]
+
+    narrowed = client.get("/api/metrics", params={"selection": token, "lob": lob}).json()
+    filtered = client.get("/api/metrics", params={"complaints_only": True, "lob": lob}).json()
+    whole = client.get("/api/metrics", params={"selection": token}).json()
+
+    assert narrowed["total_interactions"] == filtered["total_interactions"] < whole["total_interactions"]
+    assert narrowed["total_cost"] == filtered["total_cost"]
+    summary = client.post("/api/ai/summary", json={"selection": token, "filters": {"lob": lob}})
+    assert summary.status_code == 400
+
+
+@pytest.mark.parametrize("levels", ["bogus", "region,interaction_id", "region,region", ","])
+def test_breakdown_tree_rejects_invalid_levels(client, levels):
+    response = client.get("/api/breakdown/tree", params={"levels": levels})
+
+    assert response.status_code == 422
+
+
+def test_breakdown_tree_accepts_group_fields(client):
+    response = client.get("/api/breakdown/tree", params={"levels": "channel,is_complaint"})
+
+    assert response.status_code == 200
+    assert {node["label"] for node in response.json()["data"]} == {"Phone", "Chat"}
+
+
+def test_export_holds_a_bulk_slot_until_streamed(client, monkeypatch):
+    gate = main.BULK_REQUESTS
+
+    assert client.get("/api/interactions/export", params={"format": "csv", "columns": "interaction_id"}).status_code == 200
+    assert client.get("/api/interactions/export", params={"columns": "no_such_column"}).status_code == 400
+    assert gate.active == 0
+
+    monkeypatch.setattr(gate, "active", gate.max_concurrent)
+    monkeypatch.setattr(gate, "max_queue", 0)
+    busy = client.get("/api/interactions/export")
+
+    assert busy.status_code == 503
+    assert int(busy.headers["Retry-After"]) >= 1
+
+
+def test_intraday_heatmap_counts_rows_by_weekday_and_hour(client, base_rows):
+    lob = base_rows[0]["line_of_business"]
+    response = client.get("/api/metrics/intraday-heatmap", params={"lob": lob}).json()
+
+    expected = {}
+    for row in base_rows:
+        if row["line_of_business"] == lob:
+            stamp = datetime.fromisoformat(row["timestamp"])
+            cell = (("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")[stamp.weekday()], f"{stamp.hour:02d}:00")
+            expected[cell] = expected.get(cell, 0) + 1
+    counted = {
+        (weekday["weekday"], hour): cell["volume"]
+        for weekday in response["data"] for hour, cell in weekday["hours"].items() if cell["volume"]
+    }
+    assert counted == expected
+    assert response["total_interactions"] == sum(expected.values())
+
+
+def test_filter_aliases_compile_to_one_query(client, base_rows):
+    lob, segment = base_rows[0]["line_of_business"], base_rows[0]["customer_segment"]
+    day = base_rows[0]["timestamp"][:10]
+    camel = compile_filters({"lineOfBusiness": [lob], "fromDate": day, "customerSegment": segment, "minHandlingTimeSeconds": "60"})
+    snake = compile_filters(line_of_business=lob, from_date=day, segment=[segment], min_handling_time_seconds=60)
+
+    assert (camel.equals, camel.from_dt, camel.to_dt, camel.ranges) == (snake.equals, snake.from_dt, snake.to_dt, snake.ranges)
+    assert camel.equals == {"line_of_business": (lob,), "customer_segment": (segment,)}
+    by_alias = [client.post("/api/root_cause", json={"filters": {name: lob}}).json() for name in ("lob", "lineOfBusiness", "line_of_business")]
+    assert by_alias[0] == by_alias[1] == by_alias[2]
+    assert client.get("/api/metrics", params={"lob": lob, "from": "yesterday"}).status_code == 422
+
+
+@pytest.mark.parametrize("filters", [
+    {"bogus": "x"},
+    {"lob": "Retail", "lineOfBusiness": "Cards"},
+    {"from": "yesterday"},
+    {"from": "2024-03-02", "to": "2024-03-01"},
+    {"complaints_only": "maybe"},
+    {"min_handling_time_seconds": "fast"},
+    {"minHandlingTimeSeconds": 600, "max_handling_time_seconds": 60},
+    {"channel": [1]},
+])
+def test_invalid_filters_are_rejected(client, filters):
+    response = client.post("/api/ai/summary", json={"filters": filters})
+
+    assert response.status_code == 422
+
+
+def test_facet_counts_ignore_their_own_filter(client, base_rows):
+    regions = sorted({row["region"] for row in base_rows})[:2]
+    filters = {"channel": {"Chat"}, "region": set(regions), "is_complaint": {True}}
+    response = client.get("/api/facets", params={
+        "channel": "Chat", "region": regions, "complaints_only": True, "min_handling_time_seconds": 300
+    }).json()
+
+    def matches(row, ignored=None):
+        return row["handling_time_seconds"] >= 300 and all(
+            row[field] in values for field, values in filters.items() if field != ignored
+        )
+
+    assert response["total"] == sum(matches(row) for row in base_rows)
+    for field, values in response["facets"].items():
+        expected = {}
+        for row in base_rows:
+            if matches(row, ignored=field):
+                expected[row[field]] = expected.get(row[field], 0) + 1
+        assert {value["value"]: value["count"] for value in values if value["count"]} == expected, field
+    assert {value["value"] for value in response["facets"]["region"] if value["selected"]} == set(regions)
+
+
+def test_agent_rollup_adds_up_to_brute_force_counts(client, base_rows):
+    days = sorted({row["timestamp"][:10] for row in base_rows})
+    from_date, to_date = days[1] + "T12:00:00", days[-2] + "T12:00:00"
+    rollup = client.get("/api/agents/rollup", params={"from": from_date, "to": to_date}).json()
+
+    expected = {}
+    for row in base_rows:
+        if from_date <= row["timestamp"] <= to_date:
+            for path in ((row["region"],), (row["region"], row["team_leader"]), (row["region"], row["team_leader"], row["agent_id"])):
+                daily = expected.setdefault(path, {})
+                daily[row["timestamp"][:10]] = daily.get(row["timestamp"][:10], 0) + 1
+
+    def counted(path, node):
+        return path, node["interaction_count"], {day: n for day, n in zip(rollup["days"], node["daily"]["count"]) if n}
+
+    nodes = []
+    for region in rollup["regions"]:
+        nodes.append(counted((region["region"],), region))
+        for team in region["team_leaders"]:
+            nodes.append(counted((region["region"], team["team_leader"]), team))
+            nodes += [counted((region["region"], team["team_leader"], agent["agent_id"]), agent) for agent in team["agents"]]
+
+    assert rollup["days"] == days[1:-1]
+    assert {path: daily for path, _, daily in nodes} == expected
+    assert all(count == sum(daily.values()) for _, count, daily in nodes)
+    assert rollup["summary"]["interaction_count"] == sum(sum(expected[path].values()) for path in expected if len(path) == 1)
+    assert rollup["total_agents"] == sum(1 for path in expected if len(path) == 3)
+
+
+def test_coaching_queue_matches_agent_profiles(client, base_rows):
+    days = sorted({row["timestamp"][:10] for row in base_rows})
+    params = {"from": days[2] + "T08:00:00", "to": days[-3], "team_leader": base_rows[0]["team_leader"]}
+    queue = client.get("/api/agents/coaching", params=params).json()
+
+    assert queue["total_agents"] == len(queue["data"]) > 1
+    assert [entry["rank"] for entry in queue["data"]] == list(range(1, len(queue["data"]) + 1))
+    for entry in queue["data"]:
+        profile = client.get(f"/api/agents/{entry['agent_id']}/profile", params={"from": params["from"], "to": params["to"]}).json()
+        top = profile["category_breakdown"][0]["category"] if profile["category_breakdown"] else None
+        assert (entry["stats"], entry["team_average"], entry["gaps"]) == (profile["stats"], profile["team_average"], profile["gaps"])
+        assert (entry["top_complaint_category"], entry["coaching_plan"]) == (top, profile["coaching_plan"])
+
+
+def test_approximate_intervals_cover_the_exact_metrics(client, monkeypatch, base_rows):
+    # Filters the cube cannot answer, estimated from about a quarter of the (small) demo dataset
+    monkeypatch.setattr(main, "APPROX_EXACT_MAX_ROWS", 0)
+    monkeypatch.setattr(main, "APPROX_SAMPLE_BUDGET", len(base_rows) // 3)
+    days = sorted({row["timestamp"][:10] for row in base_rows})
+    scope = {"from": days[1] + "T12:00:00", "to": days[-2] + "T12:00:00"}
+    queries = [
+        {"min_handling_time_seconds": 300},
+        {"product": base_rows[0]["product"], "max_transfer_count": 1},
+        {"team_leader": base_rows[0]["team_leader"], "max_hold_time_seconds": 120},
+        {"region": base_rows[0]["region"], "complaints_only": True, "min_root_cause_confidence": 0.7},
+        {"min_estimated_cost_dollars": 5, "lob": base_rows[0]["line_of_business"]},
+    ]
+
+    covered = []
+    for params in queries:
+        exact = client.get("/api/metrics", params={**scope, **params}).json()
+        approx = client.get("/api/metrics", params={**scope, **params, "approx": True}).json()
+        assert approx["approximate"]
+        assert 0 < approx["sample_size"] < len(base_rows)
+        for name, (low, high) in approx["confidence_intervals"].items():
+            covered.append(low <= exact[name] <= high)
+    # 95% intervals, but the metrics of one query miss together: allow for a few misses
+    assert sum(covered) >= 0.75 * len(covered)
+
+
+def test_single_flight_shares_one_execution():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def slow(value):
+        runs.append(value)
+        started.set()
+        release.wait(5)
+        if value == "bad":
+            raise ValueError(value)
+        return {"value": value}
+
+    def call(value, results):
+        try:
+            results.append(flight.do(("slow", freeze({"value": [value]})), slow, value))
+        except ValueError as e:
+            results.append(e)
+
+    for value in ("ok", "bad"):
+        started.clear()
+        release.clear()
+        results = []
+        threads = [threading.Thread(target=call, args=(value, results)) for _ in range(5)]
+        threads[0].start()
+        assert started.wait(5)
+        shared = flight.shared
+        for thread in threads[1:]:
+            thread.start()
+        while flight.shared < shared + 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        # Every caller got the leader's result (or exception) object
+        assert len(results) == 5 and all(result is results[0] for result in results)
+
+    assert runs == ["ok", "bad"]
+    assert (flight.executions, flight.shared) == (2, 8)
+    # Nothing is cached once a call finished
+    assert flight.do("again", lambda: 1) == flight.do("again", lambda: 2) - 1
+
+
+def test_admission_sheds_with_retry_after_when_saturated(client, monkeypatch):
+    gate = AdmissionGate("test", max_concurrent=1, max_queue=1, queue_timeout_seconds=0.2)
+
+    async def scenario():
+        holder = gate.admit()
+        await holder.__anext__()
+        queued = asyncio.ensure_future(gate.admit().__anext__())
+        await asyncio.sleep(0)
+        # One running, one queued: the next arrival finds the queue full
+        with pytest.raises(HTTPException) as full:
+            await gate.admit().__anext__()
+        # The queued request waits out its timeout
+        with pytest.raises(HTTPException) as timed_out:
+            await queued
+        await holder.aclose()
+        return full.value, timed_out.value
+
+    full, timed_out = asyncio.run(scenario())
+    assert full.status_code == timed_out.status_code == 503
+    assert int(full.headers["Retry-After"]) >= 1
+    assert "queue full" in full.detail and "timed out" in timed_out.detail
+    assert (gate.active, gate.shed) == (0, 2)
+
+    monkeypatch.setattr(main.HEAVY_REQUESTS, "active", main.HEAVY_REQUESTS.max_concurrent)
+    monkeypatch.setattr(main.HEAVY_REQUESTS, "max_queue", 0)
+    busy = client.post("/api/root_cause", json={"filters": {}})
+    assert busy.status_code == 503
+    assert int(busy.headers["Retry-After"]) >= 1
+    # Other cost classes still get through
+    assert client.get("/api/metrics").status_code == 200
+
+
+def test_split_bitmap_partitions_rows_in_order():
+    bitmap = bitmap_from_positions([1, 2, 3, 50, 51, 400, 401, 402, 1000, 5000])
+
+    chunks = split_bitmap(bitmap, 3)
+
+    assert len(chunks) == 3
+    assert sum(chunks) == bitmap
+    assert [chunk.bit_count() for chunk in chunks] == [3, 3, 4]
+    assert all(a.bit_length() <= (b & -b).bit_length() for a, b in zip(chunks, chunks[1:]))
+    assert split_bitmap(bitmap_from_positions([7]), 4) == [1 << 7]
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/api/metrics", {"min_handling_time_seconds": 0}),
+    ("/api/breakdown", {"group_by": "channel", "min_hold_time_seconds": 0}),
+    ("/api/trends", {"min_handling_time_seconds": 0}),
+])
+def test_parallel_scan_matches_serial(client, parallel_pool, monkeypatch, path, params):
+    monkeypatch.setattr(parallel_pool, "workers", 0)
+    serial = client.get(path, params=params).json()
+
+    monkeypatch.setattr(parallel_pool, "workers", 2)
+    offloaded = parallel_pool.offloaded
+    parallel = client.get(path, params=params).json()
+
+    assert parallel_pool.offloaded == offloaded + 2
+    assert parallel == serial
+
+
+def test_offloaded_endpoint_matches_inline(client, parallel_pool, monkeypatch, base_rows):
+    path = f"/api/agents/{base_rows[0]['agent_id']}/profile"
+    monkeypatch.setattr(parallel_pool, "workers", 0)
+    inline = client.get(path).json()
+
+    monkeypatch.setattr(parallel_pool, "workers", 1)
+    offloaded = parallel_pool.offloaded
+    assert client.get(path).json() == inline
+    missing = client.get("/api/agents/NO-SUCH-AGENT/profile")
+
+    assert parallel_pool.offloaded == offloaded + 2
+    assert missing.status_code == 404
+    assert missing.json() == {"detail": "Agent not found"}
+
+
+def test_workers_follow_writes(parallel_pool, base_rows):
+    store = get_store()
+    row = store.get(base_rows[0]["interaction_id"])
+    edited = {**row, "agent_name": "Edited After Fork"}
+    calls = [{"interaction_id": row["interaction_id"]}] * 2
+
+    try:
+        store.upsert([edited])
+        assert parallel_pool.map("worker_row", store.version, calls, 10) == [edited, edited]
+    finally:
+        store.upsert([row])
+
+    assert parallel_pool.map("worker_row", store.version, calls, 10) == [row, row]
+
+
+def test_map_gives_up_after_timeout(parallel_pool):
+    started = time.monotonic()
+
+    assert parallel_pool.map("worker_sleep", get_store().version, [{"seconds": 1}] * 3, 0.1) is None
+    assert time.monotonic() - started < 0.5
+
+
+def test_parallel_scan_falls_back_to_serial_on_timeout(client, parallel_pool, monkeypatch):
+    params = {"group_by": "channel", "min_hold_time_seconds": 0}
+    monkeypatch.setattr(parallel_pool, "workers", 0)
+    serial = client.get("/api/breakdown", params=params).json()
+
+    monkeypatch.setattr(parallel_pool, "workers", 2)
+    monkeypatch.setattr(main, "PARALLEL_SCAN_TIMEOUT_SECONDS", 0)
+
+    assert client.get("/api/breakdown", params=params).json() == serial
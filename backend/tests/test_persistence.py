@@ -0,0 +1,206 @@
+"""
+Write-ahead log recovery: replaying the log on top of the checkpointed rows must
+reproduce the store as it was before the crash. Checkpoints must load back as the
+store they were taken from, and cold segments must read back as the rows they replaced.
+"""
+import gc
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from bulk_loader import run_bulk_load
+from data_generator import replay_wal
+from export_service import iter_csv, iter_parquet, resolve_columns
+from query_planner import compile_filters
+from persistence import (
+    Checkpointer, WriteAheadLog, load_checkpoint, load_snapshot, read_wal, wal_segments, CHECKPOINT_SEGMENT_DIR
+)
+from store import InteractionStore, SEGMENT_SIZE
+from tiered_storage import TieringManager, ColdSegment, cold_storage_available, open_cold_segment
+from conftest import snapshot_state
+
+
+def test_replay_stops_at_torn_final_frame(tmp_path, base_rows):
+    store = InteractionStore(base_rows[:1000])
+    store.attach_wal(WriteAheadLog(str(tmp_path), 0))
+    store.append(base_rows[1000:1200])
+    store.upsert([{**base_rows[5], "handling_time_seconds": 42}])
+    expected = snapshot_state(store.snapshot())
+    store.append(base_rows[1200:1300])
+    store.wal.close()
+
+    # A crash in the middle of the last write leaves only part of its frame
+    _, path = wal_segments(str(tmp_path))[-1]
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 10)
+
+    assert [op for op, _ in read_wal(str(tmp_path))] == ["append", "upsert"]
+    recovered = InteractionStore(base_rows[:1000])
+    assert replay_wal(recovered, str(tmp_path), 0) == 2
+    assert snapshot_state(recovered.snapshot()) == expected
+
+
+def test_replay_reapplies_retention(tmp_path, base_rows):
+    store = InteractionStore(base_rows[:1000])
+    store.attach_wal(WriteAheadLog(str(tmp_path), 0))
+    store.append(base_rows[1000:3000])
+    cutoff = store.snapshot().partition_days[3]
+    assert store.drop_before(cutoff) > 0
+    store.append(base_rows[3000:3100])
+    store.wal.close()
+
+    recovered = InteractionStore(base_rows[:1000])
+    replay_wal(recovered, str(tmp_path), 0)
+
+    assert min(recovered.snapshot().partition_days) >= cutoff
+    assert snapshot_state(recovered.snapshot()) == snapshot_state(store.snapshot())
+
+
+@pytest.mark.skipif(not cold_storage_available(), reason="cold storage requires pyarrow")
+def test_cold_segments_read_back_the_same_rows(tmp_path, base_rows):
+    store = InteractionStore(base_rows)
+    hot = snapshot_state(store.snapshot())
+    newest = max(row["timestamp"] for row in base_rows)
+
+    manager = TieringManager(store, str(tmp_path), hot_days=0)
+    moved = manager.run_once(now=datetime.fromisoformat(newest) + timedelta(days=1))
+
+    assert moved["cooled"] > 0
+    assert any(isinstance(segment, ColdSegment) for segment in store.snapshot().segments)
+    assert snapshot_state(store.snapshot()) == hot
+
+
+@pytest.mark.skipif(not cold_storage_available(), reason="cold storage requires pyarrow")
+def test_cold_reads_decode_only_requested_rows(tmp_path, base_rows):
+    store = InteractionStore(base_rows)
+    newest = max(row["timestamp"] for row in base_rows)
+    TieringManager(store, str(tmp_path), hot_days=0).run_once(now=datetime.fromisoformat(newest) + timedelta(days=1))
+    # Retention masks slots inside a cold segment
+    cutoff = store.snapshot().partition_days[5]
+    store.drop_before(cutoff)
+    hot = InteractionStore(base_rows)
+    hot.drop_before(cutoff)
+    cold, hot = store.snapshot(), hot.snapshot()
+    assert any(isinstance(segment, ColdSegment) and segment.dropped for segment in cold.segments)
+
+    positions = range(0, len(base_rows), 97)
+    assert [cold.row(pos) for pos in positions] == [hot.row(pos) for pos in positions]
+    assert list(cold.iter_rows(cold.live)) == list(hot.iter_rows(hot.live))
+    assert list(cold.iter_rows_with_calendar(cold.live, ["hour"])) == list(hot.iter_rows_with_calendar(hot.live, ["hour"]))
+
+
+def _cool_all(store, directory, rows):
+    newest = max(row["timestamp"] for row in rows)
+    TieringManager(store, directory, hot_days=0).run_once(now=datetime.fromisoformat(newest) + timedelta(days=1))
+
+
+@pytest.mark.skipif(not cold_storage_available(), reason="cold storage requires pyarrow")
+def test_parquet_export_passes_cold_columns_through(tmp_path, base_rows):
+    import pyarrow.parquet as pq
+
+    hot = InteractionStore(base_rows)
+    cold = InteractionStore(base_rows)
+    _cool_all(cold, str(tmp_path), base_rows)
+    days = sorted({row["timestamp"][:10] for row in base_rows})
+    query = compile_filters(from_date=days[1] + "T12:00:00", to_date=days[-2], channel=["Chat"])
+    columns = ["interaction_id", "timestamp", "channel", "handling_time_seconds", "recommended_actions"]
+
+    def export(rows):
+        path = tmp_path / f"{len(os.listdir(tmp_path))}.parquet"
+        path.write_bytes(b"".join(iter_parquet(rows, columns, batch_size=5000)))
+        return pq.read_table(path)
+
+    bitmap = query.exact_bitmap(cold.snapshot())
+    expected = export(query.iter_rows(hot.snapshot()))
+    assert any(isinstance(part, ColdSegment) for part in cold.snapshot().segments)
+    assert any(not isinstance(part, dict) for part in cold.snapshot().iter_rows_or_tables(bitmap, columns))
+    assert expected.num_rows
+    assert export(cold.snapshot().iter_rows_or_tables(bitmap, columns)).equals(expected)
+
+
+def _checkpointer(store, tmp_path):
+    store.attach_wal(WriteAheadLog(str(tmp_path / "wal"), 0))
+    return Checkpointer(store, store.wal, str(tmp_path / "interactions.snapshot"), lambda: [])
+
+
+def test_checkpoint_rewrites_only_changed_segments(tmp_path, base_rows):
+    filled = 2 * SEGMENT_SIZE + 100
+    store = InteractionStore(base_rows[:filled])
+    checkpointer = _checkpointer(store, tmp_path)
+    segment_dir = tmp_path / CHECKPOINT_SEGMENT_DIR
+
+    assert checkpointer.checkpoint()
+    first = set(os.listdir(segment_dir))
+    assert not checkpointer.checkpoint()
+    store.append(base_rows[filled:filled + 50])
+    assert checkpointer.checkpoint()
+    second = set(os.listdir(segment_dir))
+
+    # Only the segment being filled was written again, and its old file is gone
+    assert len(first) == len(second) == 3
+    assert len(first & second) == 2
+    _, loaded, _ = load_checkpoint(str(tmp_path / "interactions.snapshot"), open_cold_segment)
+    reloaded = InteractionStore(segments=[segment for segment, _ in loaded])
+    assert snapshot_state(reloaded.snapshot()) == snapshot_state(store.snapshot())
+
+
+@pytest.mark.skipif(not cold_storage_available(), reason="cold storage requires pyarrow")
+def test_checkpoint_lists_cold_files_and_maps_them_on_load(tmp_path, base_rows):
+    store = InteractionStore(base_rows)
+    _cool_all(store, str(tmp_path / "cold"), base_rows)
+    checkpointer = _checkpointer(store, tmp_path)
+    checkpointer.checkpoint()
+
+    _, loaded, _ = load_checkpoint(str(tmp_path / "interactions.snapshot"), open_cold_segment)
+    reloaded = InteractionStore(segments=[segment for segment, _ in loaded])
+    # A restart keeps the files the checkpoint lists
+    TieringManager(reloaded, str(tmp_path / "cold"))
+
+    assert [type(segment) for segment in reloaded.snapshot().segments] == \
+        [type(segment) for segment in store.snapshot().segments]
+    assert any(isinstance(segment, ColdSegment) for segment in reloaded.snapshot().segments)
+    assert len(os.listdir(tmp_path / CHECKPOINT_SEGMENT_DIR)) == 1
+    assert snapshot_state(reloaded.snapshot()) == snapshot_state(store.snapshot())
+
+
+@pytest.mark.skipif(not cold_storage_available(), reason="cold storage requires pyarrow")
+def test_retention_releases_cold_files_once_checkpointed(tmp_path, base_rows):
+    rows = sorted(base_rows, key=lambda row: row["timestamp"])
+    store = InteractionStore(rows)
+    _cool_all(store, str(tmp_path / "cold"), rows)
+    checkpointer = _checkpointer(store, tmp_path)
+    checkpointer.checkpoint()
+    path = store.snapshot().segments[0].cold_file.path
+
+    last_day = date.fromisoformat(rows[SEGMENT_SIZE - 1]["timestamp"][:10])
+    store.drop_before((last_day + timedelta(days=1)).isoformat())
+    gc.collect()
+    assert store.snapshot().segments[0] == (None,) * SEGMENT_SIZE
+    # Still listed by the checkpoint on disk
+    assert os.path.exists(path)
+
+    checkpointer.checkpoint()
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+@pytest.mark.skipif(not cold_storage_available(), reason="Parquet files require pyarrow")
+def test_bulk_load_merges_files_into_a_sorted_snapshot(tmp_path, base_rows):
+    columns = resolve_columns(None)
+    rows = base_rows[:3000]
+    edited = {**rows[10], "handling_time_seconds": 4242}
+    csv_path, parquet_path = tmp_path / "a.csv", tmp_path / "b.parquet"
+    # Newest rows first, a row that cannot be prepared, and an id the later file replaces
+    csv_path.write_text("".join(iter_csv(rows[::-1] + [{**rows[0], "interaction_id": "BAD", "timestamp": "x"}], columns)))
+    parquet_path.write_bytes(b"".join(iter_parquet([edited] + base_rows[3000:3500], columns)))
+
+    summary = run_bulk_load([str(csv_path), str(parquet_path)], str(tmp_path / "out.snapshot"), workers=2, chunk_size=700)
+    agents, interactions, _ = load_snapshot(str(tmp_path / "out.snapshot"))
+
+    assert (summary["loaded"], summary["duplicates"], summary["rejected"]) == (3500, 1, 1)
+    assert [row["timestamp"] for row in interactions] == sorted(row["timestamp"] for row in interactions)
+    by_id = {row["interaction_id"]: row for row in interactions}
+    assert by_id[edited["interaction_id"]] == edited
+    assert by_id[rows[20]["interaction_id"]] == rows[20]
+    assert {agent["agent_id"] for agent in agents} == {row["agent_id"] for row in base_rows[:3500]}
@@ -0,0 +1,196 @@
+"""
+Incremental index and aggregate maintenance must match a store built from scratch.
+"""
+import threading
+from datetime import datetime
+
+import pytest
+
+from calendar_table import CALENDAR_COLUMNS, calendar_day, calendar_week
+from query_planner import compile_filters
+from sketches import PERCENTILES, RELATIVE_ACCURACY, sketch_quantile
+from store import InteractionStore, DuplicateInteractionError
+from conftest import snapshot_state
+
+
+def test_incremental_append_matches_rebuild(base_rows):
+    rows = base_rows[:4000]
+    store = InteractionStore(rows[:1000])
+    for start in range(1000, 4000, 700):
+        store.append(rows[start:start + 700])
+
+    assert snapshot_state(store.snapshot()) == snapshot_state(InteractionStore(rows).snapshot())
+
+
+def test_append_leaves_earlier_snapshot_untouched(base_rows):
+    store = InteractionStore(base_rows[:1000])
+    before = store.snapshot()
+    expected = snapshot_state(InteractionStore(base_rows[:1000]).snapshot())
+
+    store.append(base_rows[1000:1500])
+
+    assert snapshot_state(before) == expected
+    assert store.version == before.version + 1
+
+
+def test_upsert_and_retention_leave_earlier_snapshot_untouched(base_rows):
+    store = InteractionStore(base_rows[:2000])
+    before = store.snapshot()
+    expected = snapshot_state(InteractionStore(base_rows[:2000]).snapshot())
+
+    store.upsert([{**base_rows[5], "handling_time_seconds": 4321}])
+    store.drop_before(max(row["timestamp"] for row in base_rows[:2000])[:10])
+
+    assert snapshot_state(before) == expected
+    assert store.version == before.version + 2
+
+
+def test_readers_see_whole_versions_during_ingest(base_rows):
+    store = InteractionStore(base_rows[:2000])
+    batches = [base_rows[start:start + 250] for start in range(2000, 6000, 250)]
+    writer = threading.Thread(target=lambda: [store.append(batch) for batch in batches])
+    versions = []
+
+    writer.start()
+    while writer.is_alive() or not versions:
+        snapshot = store.snapshot()
+        versions.append(snapshot.version)
+        rows = list(snapshot.iter_rows(snapshot.live))
+        # Rows, indexes and aggregates of a pinned version always agree
+        assert snapshot.totals["count"] == snapshot.live.bit_count() == len(rows)
+        assert len(rows) % 250 == 0
+    writer.join()
+
+    assert versions == sorted(versions)
+    assert len(store.snapshot().rows()) == 6000
+
+
+def test_append_rejects_duplicate_ids(base_rows):
+    store = InteractionStore(base_rows[:100])
+    version = store.version
+
+    with pytest.raises(DuplicateInteractionError):
+        store.append([base_rows[100], base_rows[50]])
+    with pytest.raises(DuplicateInteractionError):
+        store.append([base_rows[100], base_rows[100]])
+
+    assert store.version == version
+    assert len(store.snapshot().rows()) == 100
+
+
+def test_upsert_retracts_replaced_rows(base_rows):
+    rows = base_rows[:3000]
+    store = InteractionStore(rows)
+
+    corrected = {
+        10: {"is_complaint": not rows[10]["is_complaint"]},
+        500: {"region": "West" if rows[500]["region"] != "West" else "East", "handling_time_seconds": 1234},
+        2999: {"root_cause_label": "Fee Dispute", "hold_time_seconds": 0},
+    }
+    changes = [{**rows[pos], **fields} for pos, fields in corrected.items()]
+    new_row = {**rows[0], "interaction_id": "UPSERT-NEW"}
+
+    result = store.upsert(changes + [new_row])
+
+    expected_rows = [{**row, **corrected.get(pos, {})} for pos, row in enumerate(rows)] + [new_row]
+    assert result == {"inserted": 1, "updated": 3, "unchanged": 0}
+    assert snapshot_state(store.snapshot()) == snapshot_state(InteractionStore(expected_rows).snapshot())
+
+
+def test_upsert_of_unchanged_rows_is_a_no_op(base_rows):
+    store = InteractionStore(base_rows[:500])
+    version = store.version
+
+    assert store.upsert(base_rows[:20]) == {"inserted": 0, "updated": 0, "unchanged": 20}
+    assert store.version == version
+
+
+def test_partition_pruning_matches_a_timestamp_scan(base_rows):
+    snapshot = InteractionStore(base_rows).snapshot()
+    days = snapshot.partition_days
+
+    def midday(day):
+        """A time of day with rows of that day on both sides."""
+        times = sorted(row["timestamp"] for row in base_rows if row["timestamp"].startswith(day))
+        return datetime.fromisoformat(times[len(times) // 2])
+
+    from_dt, to_dt = midday(days[3]), midday(days[10])
+
+    covered, boundary = snapshot.prune_partitions(from_dt, to_dt)
+    query = compile_filters(from_date=from_dt.isoformat(), to_date=to_dt.isoformat())
+
+    expected = [row for row in base_rows if from_dt <= datetime.fromisoformat(row["timestamp"]) <= to_dt]
+    assert (covered, boundary) == (list(days[4:10]), [days[3], days[10]])
+    assert list(query.iter_rows(snapshot)) == expected
+    assert query.exact_bitmap(snapshot).bit_count() == len(expected)
+    assert query.aggregate(snapshot)[None]["count"] == len(expected)
+
+
+def test_calendar_ids_follow_row_timestamps(base_rows):
+    store = InteractionStore(base_rows[:3000])
+    # An upsert that moves a row to another day must move its calendar ids with it
+    moved = {**base_rows[7], "timestamp": base_rows[2500]["timestamp"]}
+    store.upsert([moved])
+    snapshot = store.snapshot()
+
+    for row, (day, week, hour, weekday) in snapshot.iter_rows_with_calendar(snapshot.live, list(CALENDAR_COLUMNS)):
+        stamp = datetime.fromisoformat(row["timestamp"])
+        iso_year, iso_week, iso_weekday = stamp.isocalendar()
+        assert calendar_day(day)["date"] == row["timestamp"][:10]
+        assert calendar_week(week)["week_key"] == calendar_day(day)["week_key"] == f"{iso_year}-W{iso_week:02d}"
+        assert (hour, weekday) == (stamp.hour, iso_weekday - 1)
+
+
+@pytest.mark.parametrize("filters", [
+    {"product": ["Checking Account", "Credit Card", "No Such Product"]},
+    {"channel": ["Chat"], "min_handling_time_seconds": 301, "max_handling_time_seconds": 733.5},
+    {"max_hold_time_seconds": 44, "min_transfer_count": 1},
+    {"min_estimated_cost_dollars": 3.1, "max_estimated_cost_dollars": 12.37, "complaints_only": True},
+    {"min_root_cause_confidence": 0.805, "region": ["West", "East"]},
+])
+def test_in_lists_and_ranges_match_a_brute_force_filter(base_rows, filters):
+    snapshot = InteractionStore(base_rows).snapshot()
+    days = snapshot.partition_days
+    from_date, to_date = days[2] + "T09:30:00", days[-3] + "T17:45:00"
+    query = compile_filters(filters, from_date=from_date, to_date=to_date)
+
+    def matches(row):
+        for name, value in filters.items():
+            if name == "complaints_only":
+                ok = row["is_complaint"]
+            elif name.startswith("min_"):
+                ok = row[name[4:]] >= value
+            elif name.startswith("max_"):
+                ok = row[name[4:]] <= value
+            else:
+                ok = row[name] in value
+            if not ok:
+                return False
+        return from_date <= row["timestamp"] <= to_date
+
+    expected = [row for row in base_rows if matches(row)]
+    assert expected
+    assert list(query.iter_rows(snapshot)) == expected
+    assert query.exact_bitmap(snapshot).bit_count() == len(expected)
+    totals = query.aggregate(snapshot)[None]
+    assert totals["count"] == len(expected)
+    assert totals["handling_time"] == sum(row["handling_time_seconds"] for row in expected)
+
+
+def test_sketch_percentiles_are_within_relative_accuracy(base_rows):
+    store = InteractionStore(base_rows[:6000])
+    # Retracted values must leave the sketches too
+    store.upsert([{**row, "handling_time_seconds": 3000 + pos} for pos, row in enumerate(base_rows[:300])])
+    rows = store.snapshot().rows()
+    days = store.snapshot().partition_days
+    query = compile_filters(from_date=days[1] + "T10:00:00", to_date=days[-2] + "T10:00:00")
+
+    grouped = query.aggregate(store.snapshot(), "channel", sketches=True)
+    assert set(grouped) == {"Phone", "Chat"}
+    for channel, counters in grouped.items():
+        matching = [row for row in rows if row["channel"] == channel and query.in_bounds(row)]
+        for field, sketch in (("handling_time_seconds", "handling_time_sketch"), ("hold_time_seconds", "hold_time_sketch")):
+            values = sorted(row[field] for row in matching)
+            for q in PERCENTILES.values():
+                exact = values[int(q * (len(values) - 1))]
+                assert abs(sketch_quantile(counters[sketch], q) - exact) <= RELATIVE_ACCURACY * exact + 1e-9
@@ -0,0 +1,292 @@
+"""
+Hot/cold tiering and retention for the interaction store.
+Recent row segments stay in memory as tuples of dicts. Older segments are written
+to Arrow IPC files in the interaction schema and swapped for ColdSegment objects
+that memory-map the file and decode only the rows a read asks for, keeping the
+column arrays of recently used files mapped in a small LRU. Indexes, partitions
+and aggregates stay in memory, so queries only touch cold rows they actually
+return. Checkpoints list cold segments by file, so the files outlive the process
+and are mapped again at startup (see persistence.py). Cold storage needs the
+optional pyarrow dependency.
+"""
+import os
+import sys
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:  # cold storage is optional
+    pa = None
+
+from schema import INTERACTION_SCHEMA
+from export_service import arrow_schema, iter_record_batches
+from store import SEGMENT_SIZE
+
+# Cold segment files kept memory-mapped; an entry is column arrays over the mapping,
+# not decoded rows, so it costs address space rather than heap
+DEFAULT_COLD_CACHE_SEGMENTS = 64
+
+# Rows sampled when estimating the in-memory size of a row
+ROW_SIZE_SAMPLE = 200
+
+
+def _remove_file(path: str, owner: int) -> None:
+    # Processes forked from the owner share its cold files but never delete them
+    if os.getpid() != owner:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ColdFile:
+    """
+    An Arrow IPC file of cold rows; deleted once no segment references it, which
+    includes the segments of the latest checkpoint (see persistence.Checkpointer).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Not at interpreter exit: the file must outlive the process for the checkpoint
+        finalizer = weakref.finalize(self, _remove_file, path, os.getpid())
+        finalizer.atexit = False
+
+    def table(self) -> "pa.Table":
+        """The file's columns, memory-mapped: nothing is copied or decoded."""
+        return pa.ipc.open_file(pa.memory_map(self.path)).read_all()
+
+
+class _ColumnCache:
+    """LRU of memory-mapped cold segment tables, keyed by file path, plus pinned tables."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, pa.Table]" = OrderedDict()
+        self._pinned: Dict[str, "pa.Table"] = {}
+        self._lock = threading.Lock()
+
+    def pin(self, cold_file: ColdFile) -> None:
+        """Keep the file mapped for good; the mapping stays readable after the file is deleted."""
+        table = self.table(cold_file)
+        with self._lock:
+            self._pinned[cold_file.path] = table
+
+    def table(self, cold_file: ColdFile) -> "pa.Table":
+        with self._lock:
+            table = self._pinned.get(cold_file.path)
+            if table is not None:
+                return table
+            table = self._entries.get(cold_file.path)
+            if table is not None:
+                self._entries.move_to_end(cold_file.path)
+                return table
+
+        table = cold_file.table()
+        with self._lock:
+            self._entries[cold_file.path] = table
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return table
+
+
+COLUMN_CACHE = _ColumnCache(DEFAULT_COLD_CACHE_SEGMENTS)
+
+
+class ColdSegment:
+    """
+    Immutable row segment backed by a memory-mapped Arrow file.
+    Behaves like the tuple it replaced; dropped slots read as None.
+    """
+
+    def __init__(self, cold_file: ColdFile, length: int, dropped: frozenset = frozenset()):
+        self.cold_file = cold_file
+        self.length = length
+        self.dropped = dropped
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, offset: int) -> Optional[Dict[str, Any]]:
+        if offset in self.dropped:
+            return None
+        # A one-row slice is a view of the mapped columns, so only this row is decoded
+        return COLUMN_CACHE.table(self.cold_file).slice(offset, 1).to_pylist()[0]
+
+    def __iter__(self) -> Iterator[Optional[Dict[str, Any]]]:
+        rows = COLUMN_CACHE.table(self.cold_file).to_pylist()
+        for offset in range(self.length):
+            yield None if offset in self.dropped else rows[offset]
+
+    def take(self, offsets: List[int]) -> List[Optional[Dict[str, Any]]]:
+        """The rows at offsets, decoding just those rows in one pass."""
+        kept = [offset for offset in offsets if offset not in self.dropped]
+        rows = iter(COLUMN_CACHE.table(self.cold_file).take(kept).to_pylist() if kept else ())
+        return [None if offset in self.dropped else next(rows) for offset in offsets]
+
+    def take_table(self, offsets: List[int], columns: List[str]) -> "pa.Table":
+        """The columns of the (kept) rows at offsets, as Arrow arrays over the mapping: nothing is decoded."""
+        kept = [offset for offset in offsets if offset not in self.dropped]
+        return COLUMN_CACHE.table(self.cold_file).select(columns).take(kept)
+
+    def without(self, offsets: Iterable[int]) -> "ColdSegment":
+        """The same segment with more slots dropped."""
+        return ColdSegment(self.cold_file, self.length, self.dropped | frozenset(offsets))
+
+    def checkpoint_entry(self) -> Dict[str, Any]:
+        """How a checkpoint lists this segment; open_cold_segment maps it again."""
+        return {"cold": self.cold_file.path, "length": self.length, "dropped": sorted(self.dropped)}
+
+
+def cold_storage_available() -> bool:
+    """Whether pyarrow is installed for cold segments."""
+    return pa is not None
+
+
+def pin_cold_files(snapshot: Any) -> int:
+    """
+    Map every cold file a snapshot uses for good, in a process forked from the one
+    that owns them: the owner deletes a file once its own store stops using it,
+    possibly before this process has caught up. Returns the number of files pinned.
+    """
+    cold_files = {segment.cold_file.path: segment.cold_file for segment in snapshot.segments if isinstance(segment, ColdSegment)}
+    for cold_file in cold_files.values():
+        COLUMN_CACHE.pin(cold_file)
+    return len(cold_files)
+
+
+def open_cold_segment(entry: Dict[str, Any]) -> ColdSegment:
+    """The cold segment a checkpoint entry lists, mapping its existing file."""
+    if not cold_storage_available():
+        raise RuntimeError("The checkpoint lists cold segments, which require pyarrow")
+    if not os.path.exists(entry["cold"]):
+        raise FileNotFoundError(f"Cold segment file listed by the checkpoint is missing: {entry['cold']}")
+    return ColdSegment(ColdFile(entry["cold"]), entry["length"], frozenset(entry["dropped"]))
+
+
+def write_cold_segment(directory: str, segment: Iterable[Optional[Dict[str, Any]]]) -> ColdSegment:
+    """Write a hot segment to an Arrow file and return its cold replacement."""
+    rows = list(segment)
+    dropped = frozenset(offset for offset, row in enumerate(rows) if row is None)
+    # Dropped slots are kept as placeholders so offsets still line up
+    placeholder = {field: None for field in INTERACTION_SCHEMA}
+    columns = list(INTERACTION_SCHEMA)
+
+    path = os.path.join(directory, f"segment-{uuid.uuid4().hex}.arrow")
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, arrow_schema(columns)) as writer:
+            for batch in iter_record_batches((row or placeholder for row in rows), columns, SEGMENT_SIZE):
+                writer.write_batch(batch)
+
+    return ColdSegment(ColdFile(path), len(rows), dropped)
+
+
+def estimate_row_bytes(rows: List[Dict[str, Any]]) -> int:
+    """Rough in-memory size of a row dict, from a sample of rows."""
+    sample = [row for row in rows[:ROW_SIZE_SAMPLE] if row is not None]
+    if not sample:
+        return 0
+    total = sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values()) for row in sample)
+    return total // len(sample)
+
+
+class TieringManager:
+    """
+    Periodically enforces the storage policy on a store:
+    - retention: rows older than retention_days are dropped
+    - tiering: full segments whose newest row is older than hot_days go cold, and
+      the oldest remaining hot segments go cold while hot rows exceed the memory budget
+    The segment still being filled always stays hot.
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        directory: Optional[str] = None,
+        hot_days: int = 28,
+        memory_budget_mb: float = 0,
+        retention_days: int = 0,
+        interval: float = 60.0
+    ):
+        self.store = store
+        self.directory = directory if directory and cold_storage_available() else None
+        self.hot_days = hot_days
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.retention_days = retention_days
+        self.interval = interval
+        self._row_bytes = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        if self.directory:
+            # Files the store does not use were written but never swapped in or
+            # checkpointed before a crash; the store's own come from the checkpoint
+            os.makedirs(self.directory, exist_ok=True)
+            in_use = {
+                os.path.realpath(segment.cold_file.path)
+                for segment in store.snapshot().segments if isinstance(segment, ColdSegment)
+            }
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.startswith("segment-") and name.endswith(".arrow") and os.path.realpath(path) not in in_use:
+                    os.remove(path)
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Apply retention, then tiering. Returns rows dropped and segments moved to cold storage."""
+        now = now or datetime.now()
+        dropped = 0
+        if self.retention_days:
+            cutoff = (now - timedelta(days=self.retention_days)).date().isoformat()
+            dropped = self.store.drop_before(cutoff)
+
+        cooled = 0
+        if self.directory:
+            cooled = self._spill((now - timedelta(days=self.hot_days)).isoformat())
+
+        return {"dropped": dropped, "cooled": cooled}
+
+    def _spill(self, hot_cutoff: str) -> int:
+        snapshot = self.store.snapshot()
+        segments = snapshot.segments
+        hot = [
+            (max(row["timestamp"] for row in segment if row is not None), seg_no)
+            for seg_no, segment in enumerate(segments[:-1])
+            if isinstance(segment, tuple) and any(row is not None for row in segment)
+        ]
+        if not hot:
+            return 0
+
+        if not self._row_bytes:
+            self._row_bytes = estimate_row_bytes(list(segments[hot[0][1]]))
+        hot_bytes = (len(hot) + 1) * SEGMENT_SIZE * self._row_bytes
+
+        replacements = {}
+        for newest, seg_no in sorted(hot):
+            over_budget = self.memory_budget_bytes and hot_bytes > self.memory_budget_bytes
+            if newest >= hot_cutoff and not over_budget:
+                break
+            segment = segments[seg_no]
+            replacements[seg_no] = (segment, write_cold_segment(self.directory, segment))
+            hot_bytes -= SEGMENT_SIZE * self._row_bytes
+
+        return self.store.swap_segments(replacements) if replacements else 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="tiering", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
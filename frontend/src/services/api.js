@@ -11,6 +11,24 @@ export async function getOptions() {
   return response.data
 }
 
+// Per-value counts for the filter bar, each ignoring its own dimension's filter
+export async function getFacets(filters = {}) {
+  const params = {}
+
+  if (filters.from) params.from = filters.from
+  if (filters.to) params.to = filters.to
+  if (filters.lineOfBusiness) params.lob = filters.lineOfBusiness
+  if (filters.callReason) params.call_reason = filters.callReason
+  if (filters.product) params.product = filters.product
+  if (filters.region) params.region = filters.region
+  if (filters.teamLeader) params.team_leader = filters.teamLeader
+  if (filters.agentId) params.agent_id = filters.agentId
+  if (filters.complaintsOnly) params.complaints_only = true
+
+  const response = await api.get('/facets', { params })
+  return response.data
+}
+
 // Interactions
 export async function getInteractions(filters = {}, page = 1, pageSize = 50) {
   const params = {
@@ -129,6 +147,36 @@ export async function getBreakdown(filters = {}, groupBy = 'line_of_business') {
   return response.data
 }
 
+// Region -> team leader -> agent KPIs with daily series, for the agents page
+export async function getAgentRollup(filters = {}) {
+  const params = {}
+
+  if (filters.from) params.from = filters.from
+  if (filters.to) params.to = filters.to
+  if (filters.region) params.region = filters.region
+  if (filters.teamLeader) params.team_leader = filters.teamLeader
+
+  const response = await api.get('/agents/rollup', { params })
+  return response.data
+}
+
+// Nested breakdown over several dimensions (levels), aggregated in one request
+export async function getBreakdownTree(filters = {}, levels = ['line_of_business', 'call_reason', 'product'], depth = null) {
+  const params = { levels: levels.join(',') }
+
+  if (depth) params.depth = depth
+  if (filters.from) params.from = filters.from
+  if (filters.to) params.to = filters.to
+  if (filters.lineOfBusiness) params.lob = filters.lineOfBusiness
+  if (filters.callReason) params.call_reason = filters.callReason
+  if (filters.product) params.product = filters.product
+  if (filters.region) params.region = filters.region
+  if (filters.complaintsOnly) params.complaints_only = true
+
+  const response = await api.get('/breakdown/tree', { params })
+  return response.data
+}
+
 export async function getAgentPerformance(filters = {}) {
   const params = {}
 
@@ -188,6 +236,20 @@ export async function getComplaintHeatmap(filters = {}) {
   return response.data
 }
 
+// Coaching plans for every agent in a region / team, ranked by priority
+export async function getCoachingQueue(filters = {}) {
+  const params = {}
+
+  if (filters.from) params.from = filters.from
+  if (filters.to) params.to = filters.to
+  if (filters.region) params.region = filters.region
+  if (filters.teamLeader) params.team_leader = filters.teamLeader
+  if (filters.limit) params.limit = filters.limit
+
+  const response = await api.get('/agents/coaching', { params })
+  return response.data
+}
+
 // Agent Profile (Coaching)
 export async function getAgentProfile(agentId, filters = {}) {
   const params = {}